@@ -5,150 +5,31 @@ import os
 import subprocess
 import platform
 import datetime
-import shutil
 import argparse
 import time
-import signal
-import threading
 import sys
 from pathlib import Path
 import re
 
-def run_command(command, description=None, timeout=None, show_progress=False):
-    """コマンドを実行し、結果を返す"""
-    if description:
-        print(f"\n===== {description} =====")
-    
-    print(f"実行: {command}")
-    
-    # プログレス表示用スレッド
-    stop_progress = False
-    
-    def show_progress_indicator():
-        symbols = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
-        i = 0
-        start_time = time.time()
-        while not stop_progress:
-            elapsed = int(time.time() - start_time)
-            minutes, seconds = divmod(elapsed, 60)
-            print(f"\r{symbols[i % len(symbols)]} 処理中... ({minutes:02d}:{seconds:02d})", end='', flush=True)
-            i += 1
-            time.sleep(0.1)
-    
-    # プログレス表示を開始
-    progress_thread = None
-    if show_progress:
-        progress_thread = threading.Thread(target=show_progress_indicator)
-        progress_thread.daemon = True
-        progress_thread.start()
-    
-    try:
-        # プロセス開始
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # 標準出力と標準エラー出力を読み込む
-        stdout_data = []
-        stderr_data = []
-        
-        def read_output(pipe, data_list):
-            for line in iter(pipe.readline, ''):
-                data_list.append(line)
-                if not show_progress:  # プログレス表示中は出力しない
-                    print(line, end='')
-        
-        # 出力読み込みスレッド
-        stdout_thread = threading.Thread(target=read_output, args=(process.stdout, stdout_data))
-        stderr_thread = threading.Thread(target=read_output, args=(process.stderr, stderr_data))
-        stdout_thread.daemon = True
-        stderr_thread.daemon = True
-        stdout_thread.start()
-        stderr_thread.start()
-        
-        # 指定時間待機
-        exit_code = None
-        start_time = time.time()
-        while True:
-            exit_code = process.poll()
-            if exit_code is not None:
-                break
-                
-            # タイムアウトチェック
-            if timeout and time.time() - start_time > timeout:
-                print(f"\n\n⚠️ コマンドが{timeout}秒以上応答していないため強制終了します")
-                # Unix/Linux/Macの場合はSIGTERMを送信
-                if os.name != 'nt':
-                    process.send_signal(signal.SIGTERM)
-                    time.sleep(2)  # 正常終了の猶予
-                    if process.poll() is None:  # まだ終了していない
-                        process.send_signal(signal.SIGKILL)
-                else:  # Windowsの場合
-                    process.terminate()
-                    time.sleep(2)
-                    if process.poll() is None:
-                        process.kill()
-                
-                # プログレス表示を停止
-                if show_progress:
-                    stop_progress = True
-                    progress_thread.join(1)
-                    print("\r                                        ", end='\r')  # プログレス行をクリア
-                
-                return False, "タイムアウトにより中断されました"
-            
-            time.sleep(0.1)
-        
-        # スレッドの終了を待つ
-        stdout_thread.join()
-        stderr_thread.join()
-        
-        # 出力結果を結合
-        stdout_output = ''.join(stdout_data)
-        stderr_output = ''.join(stderr_data)
-        
-        # プログレス表示を停止
-        if show_progress:
-            stop_progress = True
-            progress_thread.join(1)
-            print("\r                                        ", end='\r')  # プログレス行をクリア
-        
-        if exit_code == 0:
-            if stdout_output:
-                print(stdout_output)
-            return True, stdout_output
-        else:
-            print(f"エラー発生 (コード: {exit_code}):")
-            if stderr_output:
-                print(f"エラー詳細: {stderr_output}")
-            return False, stderr_output
-            
-    except KeyboardInterrupt:
-        print("\n\n⚠️ ユーザーによって中断されました")
-        if 'process' in locals() and process.poll() is None:
-            process.terminate()
-        if show_progress:
-            stop_progress = True
-            progress_thread.join(1)
-            print("\r                                        ", end='\r')
-        return False, "ユーザーによって中断されました"
-    except Exception as e:
-        if show_progress:
-            stop_progress = True
-            progress_thread.join(1)
-            print("\r                                        ", end='\r')
-        print(f"予期せぬエラーが発生しました: {e}")
-        return False, str(e)
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+from command_runner import configure_metrics, metrics_checkpoint, print_command_metrics, enable_fake_toolchain
+from failure_signatures import FAILURE_SIGNATURES
+from probe_cache import cached_probe, invalidate_probes
+from step_cache import run_pub_get
+from build_invalidation import plan_clean, apply_clean, mark_built
+from preflight import run_preflight, run_graph, host_capacity
+from android_abi import (ABIS, DEFAULT_TARGET_PLATFORMS, ABI_BUILD_CPUS, ABI_BUILD_MEMORY_MB, build_abi,
+                         find_split_apks, collect_apks, print_apk_manifest)
+from gradle_tuning import ensure_gradle_properties, warm_gradle_daemon, run_gradle_build, print_gradle_cache_report
+from artifact_cache import artifact_key, fetch_artifacts, store_artifacts
+from build_telemetry import start_telemetry
+from output_store import apply_retention, print_retention_summary
+from device_fanout import install_to_all, built_apks
 
 def check_flutter_installation():
     """Flutterがインストールされているか確認する"""
-    result = subprocess.run("flutter --version", shell=True, text=True, capture_output=True)
+    result = cached_probe("flutter --version")
     if result.returncode != 0:
         print("Flutterがインストールされていないか、PATHに設定されていません。")
         print("https://flutter.dev/docs/get-started/install からFlutterをインストールしてください。")
@@ -254,33 +135,23 @@ def check_android_ndk():
     print(f"✅ NDKの設定を更新しました: {ndk_full_path}")
     return True
 
-def build_android_apk(release_mode=True, verbose=False, skip_clean=False, fast_build=False):
-    """Android APKをビルドする"""
+def build_android_apk(release_mode=True, verbose=False, skip_clean=False, fast_build=False, force_clean=False,
+                      clean_plan=None, check_ndk=True, parallel_abi=False, target_platforms=DEFAULT_TARGET_PLATFORMS):
+    """Android APKをビルドする (事前チェック済みの場合はclean_planを渡し、check_ndk=Falseにする)
+
+    parallel_abi を指定すると target_platforms ごとに別ジョブとして並列にビルドする。
+    """
     # NDKチェックを追加
-    if not check_android_ndk():
+    if check_ndk and not check_android_ndk():
         print("⚠️ Android NDKの設定が不完全です。ビルドをスキップします。")
         return False
         
-    build_mode = "--release" if release_mode else "--debug"
+    mode = "release" if release_mode else "debug"
     output_dir = "build/app/outputs/flutter-apk"
     
     # 開始時間を記録
     start_time = time.time()
-    
-    # クリーンビルドは時間がかかるのでスキップオプション
-    if not skip_clean:
-        clean_success, _ = run_command("flutter clean", "Flutterプロジェクトをクリーン", show_progress=True)
-        if not clean_success:
-            print("警告: クリーンに失敗しましたが、ビルドを続行します")
-    else:
-        print("クリーンステップをスキップします")
-    
-    # 依存関係の取得
-    print("依存関係を取得中...")
-    pub_success, _ = run_command("flutter pub get", "Flutter依存関係の解決", timeout=120, show_progress=True)
-    if not pub_success:
-        print("⚠️ 依存関係の解決に失敗しました。ネットワーク接続を確認してください。")
-        return False
+    metrics_start = metrics_checkpoint()
     
     # 高速ビルドのための追加オプション
     build_flags = []
@@ -289,58 +160,127 @@ def build_android_apk(release_mode=True, verbose=False, skip_clean=False, fast_b
         build_flags.append("--no-shrink")
         print("注: 高速ビルドモードが有効です (R8/ProGuard無効)")
     
-    # ビルド前の追加フラグ
-    extra_flags = "--verbose" if verbose else ""
-    extra_flags += " " + " ".join(build_flags)
-    
-    # Flutterビルドを実行
-    build_command = f"flutter build apk {build_mode} --split-per-abi {extra_flags}"
-    print("\n⏱️ Androidのビルドには、特に初回実行時は5〜10分程度かかる場合があります。")
-    print("   （次回以降のビルドでは '--no-clean --fast-build' オプションを使用すると高速化できます）\n")
-    
-    build_success, _ = run_command(build_command, "Android APKビルド", timeout=1200, show_progress=True)
-    if not build_success:
-        print("\n⚠️ APKビルドに失敗しました。詳細なエラーログを確認してください。")
-        print("問題解決のためのヒント:")
-        print("1. 'flutter doctor' を実行して環境の問題をチェック")
-        print("2. Android SDK、JDK、Gradleのバージョン互換性を確認")
-        print("3. '--verbose'フラグを付けて再実行するとより詳細な情報を表示できます")
-        return False
-    
-    # ビルド結果の確認
-    apk_path = os.path.join(output_dir, "app-armeabi-v7a-release.apk" if release_mode else "app-debug.apk")
-    if not os.path.exists(apk_path):
-        # Split APKが見つからない場合は通常のAPKを確認
-        apk_path = os.path.join(output_dir, "app-release.apk" if release_mode else "app-debug.apk")
-        if not os.path.exists(apk_path):
-            print(f"APKファイルが見つかりません: {apk_path}")
+    # 同じ入力から作成済みのAPKがあれば、ビルドせずにキャッシュから復元する (--clean の場合は必ずビルドする)
+    variant = " ".join(["apk", "split-per-abi"] + build_flags + (sorted(target_platforms) if parallel_abi else []))
+    cache_key = artifact_key('android', mode, variant)
+    if not force_clean and fetch_artifacts(cache_key):
+        apks = find_split_apks(mode, output_dir) or {'universal': os.path.join(output_dir, f"app-{mode}.apk")}
+        durations, gradle_stats = None, {}
+    else:
+        compiled = compile_android_apks(mode, verbose, skip_clean, force_clean, clean_plan, build_flags,
+                                        parallel_abi, target_platforms, output_dir)
+        if not compiled:
             return False
-    
-    # 出力ディレクトリの作成
-    output_folder = "output/android"
-    os.makedirs(output_folder, exist_ok=True)
-    
-    # タイムスタンプ付きのファイル名
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_filename = f"gyroscope_app_{timestamp}.apk"
-    output_path = os.path.join(output_folder, output_filename)
+        apks, durations, gradle_stats = compiled
+        mark_built('android')
+        store_artifacts(cache_key, {_apk_cache_name(abi, mode, output_dir): path for abi, path in apks.items()},
+                        meta={'target': "apk", 'mode': mode})
     
     # ビルド時間の計算
     build_duration = time.time() - start_time
     minutes, seconds = divmod(int(build_duration), 60)
     
-    # ファイルのコピー
-    shutil.copy2(apk_path, output_path)
-    print(f"\n✅ APKが正常にビルドされました: {output_path}")
-    print(f"ファイルサイズ: {os.path.getsize(output_path) / (1024 * 1024):.2f} MB")
+    # 出力ディレクトリにコピーしてマニフェストを作成
+    manifest = collect_apks(apks, "output/android", durations, mode)
+    print(f"\n✅ {len(apks)}個のAPKが正常にビルドされました: output/android")
+    print_apk_manifest(manifest)
+    print_retention_summary(apply_retention())
     print(f"ビルド時間: {minutes}分{seconds}秒")
+    print_gradle_cache_report(gradle_stats)
+    print_command_metrics(metrics_start)
     
     return True
 
+def _apk_cache_name(abi, mode, output_dir):
+    """キャッシュから復元するときのAPKの配置先 (ビルド直後と同じ場所)"""
+    if abi == 'universal':
+        return os.path.join(output_dir, f"app-{mode}.apk")
+    return os.path.join(output_dir, f"app-{abi}-{mode}.apk")
+
+def compile_android_apks(mode, verbose, skip_clean, force_clean, clean_plan, build_flags, parallel_abi,
+                         target_platforms, output_dir):
+    """クリーン・依存関係の解決・APKのビルドを行い、(apks, durations, gradle_stats) を返す (失敗時はNone)"""
+    build_mode = f"--{mode}"
+    
+    # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
+    if not skip_clean:
+        print("前回のビルドからの変更を確認しています...")
+        apply_clean(clean_plan or plan_clean('android', force=force_clean), 'android')
+    else:
+        print("クリーンステップをスキップします")
+    
+    # 依存関係の取得
+    print("依存関係を取得中...")
+    pub_success, _ = run_pub_get(timeout=120, show_progress=True)
+    if not pub_success:
+        print("⚠️ 依存関係の解決に失敗しました。ネットワーク接続を確認してください。")
+        return None
+    
+    # ビルド前の追加フラグ
+    extra_flags = "--verbose" if verbose else ""
+    extra_flags += " " + " ".join(build_flags)
+    
+    print("\n⏱️ Androidのビルドには、特に初回実行時は5〜10分程度かかる場合があります。")
+    print("   （次回以降は変更のない部分を再利用します。'--fast-build' オプションでさらに高速化できます）\n")
+    
+    if parallel_abi:
+        # ABIごとに専用の作業ツリーで並列にビルドする
+        steps = [{'name': abi, 'func': build_abi, 'args': (target_platform, mode, extra_flags.strip()),
+                  'description': f"Android APKビルド ({abi})", 'cpus': ABI_BUILD_CPUS, 'memory_mb': ABI_BUILD_MEMORY_MB}
+                 for target_platform, abi in ABIS.items() if target_platform in target_platforms]
+        results = run_graph(steps, max_workers=max(1, len(steps)), title="ABIごとのAPKビルド",
+                            capacity=host_capacity(), announce=True)
+        apks = {abi: outcome['result']['apk'] for abi, outcome in results.items() if outcome['ok']}
+        gradle_stats = {f"flutter_build_apk_{abi}": outcome['result']['gradle']
+                        for abi, outcome in results.items() if outcome['ok']}
+        durations = {abi: outcome['duration'] for abi, outcome in results.items()}
+        failed = [abi for abi, outcome in results.items() if not outcome['ok']]
+        if failed:
+            print(f"\n⚠️ APKビルドに失敗したABI: {', '.join(failed)}")
+            print("詳細は output/logs/ のビルドログを確認してください。")
+            return None
+    else:
+        # Flutterビルドを実行
+        build_command = f"flutter build apk {build_mode} --split-per-abi {extra_flags}"
+        build_result, stats = run_gradle_build(build_command, "Android APKビルド", "flutter_build_apk", verbose,
+                                               timeout=1200, failure_signatures=FAILURE_SIGNATURES)
+        gradle_stats = {"flutter_build_apk": stats}
+        if not build_result['success']:
+            print("\n⚠️ APKビルドに失敗しました。詳細なエラーログを確認してください。")
+            print("問題解決のためのヒント:")
+            print("1. 'flutter doctor' を実行して環境の問題をチェック")
+            print("2. Android SDK、JDK、Gradleのバージョン互換性を確認")
+            print("3. '--verbose'フラグを付けて再実行するとより詳細な情報を表示できます")
+            return None
+        
+        # ビルド結果の確認 (すべてのABIのAPKを回収する)
+        apks = find_split_apks(mode, output_dir)
+        if not apks:
+            # Split APKが見つからない場合は通常のAPKを確認
+            apk_path = os.path.join(output_dir, f"app-{mode}.apk")
+            if not os.path.exists(apk_path):
+                print(f"APKファイルが見つかりません: {apk_path}")
+                return None
+            apks = {'universal': apk_path}
+        durations = None
+    return apks, durations, gradle_stats
+
+def prepare_gradle():
+    """gradle.properties のキャッシュ設定を反映し、Gradle デーモンを起動しておく"""
+    ensure_gradle_properties()
+    return warm_gradle_daemon()
+
+def run_flutter_doctor():
+    """flutter doctor -v を実行して表示する (結果はプローブキャッシュから返す)"""
+    print("\n===== Flutter環境診断 =====")
+    doctor = cached_probe("flutter doctor -v", timeout=60)
+    print(doctor.stdout or doctor.stderr)
+    return doctor.returncode == 0
+
 def get_flutter_version():
     """Flutterのバージョンを取得する"""
     try:
-        result = subprocess.run("flutter --version", shell=True, text=True, capture_output=True)
+        result = cached_probe("flutter --version")
         if result.returncode == 0:
             return result.stdout.splitlines()[0]
     except Exception:
@@ -353,27 +293,41 @@ def main():
     parser.add_argument('--debug', action='store_true', help='デバッグモードでビルド')
     parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
     parser.add_argument('--no-clean', action='store_true', help='クリーンステップをスキップして高速化')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず完全なクリーンを行う')
+    parser.add_argument('--parallel-abi', action='store_true', help='ABIごとに別ジョブとして並列にビルド')
+    parser.add_argument('--target-platforms', default=",".join(DEFAULT_TARGET_PLATFORMS),
+                        help='--parallel-abi でビルドする対象 (カンマ区切り: android-arm, android-arm64, android-x64)')
     parser.add_argument('--fast-build', action='store_true', help='高速ビルド (サイズ最適化を無効化)')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
+    parser.add_argument('--install-all', action='store_true',
+                        help='ビルド後、接続中のすべてのデバイス・エミュレータに並列にインストールして起動')
+    parser.add_argument('--devices', help='--install-all の対象のデバイスの名前・IDの正規表現 (例: "Pixel|SM-S9")')
     args = parser.parse_args()
+    target_platforms = [name.strip() for name in args.target_platforms.split(",") if name.strip()]
+    unknown = [name for name in target_platforms if name not in ABIS]
+    if unknown:
+        parser.error(f"--target-platforms に不明なプラットフォームがあります: {', '.join(unknown)} "
+                     f"(指定できるもの: {', '.join(ABIS)})")
+    if not target_platforms:
+        parser.error("--target-platforms にビルドする対象を1つ以上指定してください")
+    enable_fake_toolchain()
+    
+    if args.refresh_probes:
+        invalidate_probes()
     
     print("=== ジャイロスコープアプリ Android ビルドスクリプト ===")
     
-    # Flutter Doctorの実行を提案
-    if input("Flutter doctor を実行して環境を確認しますか？ (y/n): ").lower() == 'y':
-        run_command("flutter doctor -v", "Flutter環境診断", timeout=60, show_progress=True)
+    # Flutter Doctorの実行を提案（実行自体は他の事前チェックと並列に行う）
+    run_doctor = input("Flutter doctor を実行して環境を確認しますか？ (y/n): ").lower() == 'y'
     
     # 現在のディレクトリを表示
     print(f"現在のディレクトリ: {os.getcwd()}")
     
-    # スクリプトの作業ディレクトリを修正
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    if os.getcwd() != script_dir:
-        print(f"作業ディレクトリを変更: {script_dir}")
-        os.chdir(script_dir)
-    
-    # Flutterの確認
-    if not check_flutter_installation():
-        return 1
+    # スクリプトの作業ディレクトリをプロジェクトのルートに修正
+    project_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    if os.getcwd() != project_dir:
+        print(f"作業ディレクトリを変更: {project_dir}")
+        os.chdir(project_dir)
     
     # プロジェクトディレクトリの確認
     if not os.path.exists('lib/main.dart'):
@@ -383,15 +337,45 @@ def main():
     
     # 出力フォルダの準備
     os.makedirs("output/android", exist_ok=True)
+    configure_metrics("output/android")
+    start_telemetry("android_build", 'android')
+    
+    # 互いに独立した環境確認を並列に実行する (NDKの確認は入力待ちがあるため先に単独で実行)
+    preflight_steps = [
+        {'name': 'ndk', 'func': check_android_ndk, 'description': "Android NDKの確認", 'exclusive': True},
+        {'name': 'flutter', 'func': check_flutter_installation, 'description': "Flutterの確認"},
+    ]
+    # Gradle デーモンはビルドと同時に使うと別のデーモンが起動するため、事前チェックの間に準備しておく
+    preflight_steps.append({'name': 'gradle', 'func': prepare_gradle, 'deps': ['ndk'],
+                            'description': "Gradleデーモンとビルドキャッシュの準備"})
+    if run_doctor:
+        preflight_steps.append({'name': 'doctor', 'func': run_flutter_doctor, 'description': "Flutter環境診断"})
+    if not args.no_clean:
+        preflight_steps.append({'name': 'clean_plan', 'func': plan_clean, 'args': ('android', args.clean),
+                                'deps': ['flutter'], 'description': "前回のビルドからの変更確認"})
+    preflight = run_preflight(preflight_steps, title="Androidビルドの事前チェック")
+    if not preflight['flutter']['ok']:
+        return 1
+    if not preflight['ndk']['ok']:
+        print("⚠️ Android NDKの設定が不完全です。ビルドをスキップします。")
+        return 1
+    clean_plan = preflight['clean_plan']['result'] if 'clean_plan' in preflight else None
     
     # ビルドの実行
     success = True
     
     try:
-        if not build_android_apk(not args.debug, args.verbose, args.no_clean, args.fast_build):
+        if not build_android_apk(not args.debug, args.verbose, args.no_clean, args.fast_build, args.clean,
+                                 clean_plan, check_ndk=False, parallel_abi=args.parallel_abi,
+                                 target_platforms=target_platforms):
             success = False
             print("⚠️ Android APKのビルドに失敗しました")
         
+        if success and args.install_all:
+            if not install_to_all('android', built_apks("debug" if args.debug else "release"), match=args.devices):
+                print("\n⚠️ 一部のデバイスへのインストール・起動に失敗しました。上記の表を確認してください。")
+                return 1
+        
         if success:
             print("\n✨ Androidビルドが正常に完了しました! ✨")
         else:
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import contextlib
+from unittest import mock
+
+import fake_toolchain
+import pods_cache
+import step_cache
+import artifact_cache
+
+# キャッシュの確認に使う Podfile と Podfile.lock (内容はキャッシュのキーになるだけで、形式は問わない)
+PODFILE_TEMPLATE = "platform :ios, '13.0'\n\ntarget 'Runner' do\n  use_frameworks!\nend\n"
+PODFILE_LOCK_TEMPLATE = """PODS:
+  - Flutter (1.0.0)
+  - audioplayers_darwin (0.0.1):
+    - Flutter
+
+DEPENDENCIES:
+  - Flutter (from `Flutter`)
+  - audioplayers_darwin (from `.symlinks/plugins/audioplayers_darwin/ios`)
+
+PODFILE CHECKSUM: 0123456789abcdef0123456789abcdef01234567
+
+COCOAPODS: 1.16.2
+"""
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def _expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def _pod_installs():
+    """簡易版の pod install の実行回数 (子プロセスのツールと同じ状態ファイルを読む)"""
+    state_file = os.environ.get("FAKE_TOOLCHAIN_STATE", fake_toolchain.STATE_FILE)
+    with mock.patch.object(fake_toolchain, "STATE_FILE", state_file):
+        return fake_toolchain.load_state().get('pod_installs', 0)
+
+
+@contextlib.contextmanager
+def _pods_sandbox(project):
+    """pods_cache・step_cache の参照先を計測用のプロジェクトに向ける"""
+    ios_dir = os.path.join(project, "ios")
+    cache_dir = os.path.join(project, ".build_cache")
+    with contextlib.ExitStack() as stack:
+        for name, value in (("PODS_DIR", os.path.join(ios_dir, "Pods")),
+                            ("PODFILE", os.path.join(ios_dir, "Podfile")),
+                            ("PODFILE_LOCK", os.path.join(ios_dir, "Podfile.lock")),
+                            ("PUBSPEC_LOCK", os.path.join(project, "pubspec.lock")),
+                            ("PODS_CACHE_DIR", os.path.join(cache_dir, "pods"))):
+            stack.enter_context(mock.patch.object(pods_cache, name, value))
+        stack.enter_context(mock.patch.object(step_cache, "PROJECT_ROOT", project))
+        stack.enter_context(mock.patch.object(step_cache, "STEP_CACHE_DIR", os.path.join(cache_dir, "steps")))
+        # reflink に対応したファイルシステムでも、ハードリンクでの復元を確認する
+        stack.enter_context(mock.patch.object(pods_cache, "_reflink_tree", return_value=False))
+        previous = os.getcwd()
+        os.chdir(project)
+        try:
+            yield ios_dir
+        finally:
+            os.chdir(previous)
+
+
+def check_pods_cache(project):
+    """Pods のキャッシュが一致すれば pod install を実行せず、書き換えられるファイルは複製で復元されるか"""
+    with _pods_sandbox(project) as ios_dir:
+        os.makedirs(ios_dir, exist_ok=True)
+        with open(os.path.join(ios_dir, "Podfile"), 'w') as f:
+            f.write(PODFILE_TEMPLATE)
+        with open(os.path.join(ios_dir, "Podfile.lock"), 'w') as f:
+            f.write(PODFILE_LOCK_TEMPLATE)
+
+        installs = _pod_installs()
+        success, _ = step_cache.run_pod_install(show_output=False)
+        _expect(success, "初回の pod install に失敗しました")
+        _expect(_pod_installs() == installs + 1, "初回は pod install を実行するはずです")
+        _expect(os.path.isdir(pods_cache._entry_path(pods_cache.pods_cache_key())),
+                "インストール後の Pods がキャッシュに保存されていません")
+
+        # Pods を失った状態 (新しいチェックアウト・クリーン後) でも、キャッシュから復元して pod を実行しない
+        pods_dir = pods_cache.PODS_DIR
+        shutil.rmtree(pods_dir)
+        success, _ = step_cache.run_pod_install(show_output=False)
+        _expect(success, "キャッシュからの復元に失敗しました")
+        _expect(_pod_installs() == installs + 1, "キャッシュが一致するのに pod install を実行しました")
+
+        # 簡易版の pod install が作るファイルのうち、本物の pod install がその場で書き換えるもの
+        mutable = ["Manifest.lock", "Pods.xcodeproj/project.pbxproj",
+                   "Target Support Files/Pods-Runner/Pods-Runner.debug.xcconfig"]
+        for relative in mutable:
+            _expect(os.stat(os.path.join(pods_dir, relative)).st_nlink == 1,
+                    f"書き換えられるファイルがキャッシュとハードリンクされています: {relative}")
+        _expect(os.stat(os.path.join(pods_dir, "Flutter", "Flutter.h")).st_nlink > 1,
+                "書き換えないファイルがハードリンクで復元されていません")
+    return f"pod の実行 1回 / 複製で復元したファイル {len(mutable)}個を確認"
+
+
+def check_artifact_cache(project):
+    """ファイル1つの成果物 (APK) とディレクトリの成果物 (Web) が、保存・削除・復元で元の内容に戻るか"""
+    artifacts = {
+        "build/app/outputs/flutter-apk/app-release.apk": b"fake apk\n" * 1000,
+        "build/web/index.html": b"<html></html>\n",
+        "build/web/assets/main.dart.js": b"// fake\n" * 1000,
+    }
+    for relative, content in artifacts.items():
+        os.makedirs(os.path.dirname(os.path.join(project, relative)), exist_ok=True)
+        with open(os.path.join(project, relative), 'wb') as f:
+            f.write(content)
+    cases = {"1" * 64: "build/app/outputs/flutter-apk/app-release.apk", "2" * 64: "build/web"}
+
+    with mock.patch.object(artifact_cache, "ARTIFACT_CACHE_DIR", os.path.join(project, ".build_cache", "artifacts")), \
+            mock.patch.object(artifact_cache, "ARTIFACT_CACHE_URL", ""), \
+            mock.patch.object(artifact_cache, "ARTIFACT_CACHE_ENABLED", True):
+        for key, name in cases.items():
+            _expect(artifact_cache.store_artifacts(key, {name: os.path.join(project, name)}),
+                    f"{name} をキャッシュに保存できません")
+        shutil.rmtree(os.path.join(project, "build"))
+        for key, name in cases.items():
+            _expect(artifact_cache.fetch_artifacts(key, project) == [name], f"{name} をキャッシュから復元できません")
+            _expect(os.path.exists(artifact_cache._entry_path(key)), f"{name} の復元後にエントリが削除されています")
+    for relative, content in artifacts.items():
+        with open(os.path.join(project, relative), 'rb') as f:
+            _expect(f.read() == content, f"復元した {relative} の内容が異なります")
+    return f"成果物 {len(cases)}件 (ファイル {len(artifacts)}個) を復元"
+
+
+CHECKS = [
+    ("pods_cache", check_pods_cache),
+    ("artifact_cache", check_artifact_cache),
+]
+
+
+def run_checks(project, selected=None):
+    """確認を実行し、失敗した項目の名前の一覧を返す"""
+    failed = []
+    for name, check in CHECKS:
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                detail = check(project)
+        except CheckFailed as e:
+            print(f"❌ {name}: {e}")
+            failed.append(name)
+            continue
+        print(f"✅ {name}: {detail}")
+    return failed
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import datetime
+import tempfile
+import contextlib
+import subprocess
+import importlib.util
+from unittest import mock
+
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+import command_runner
+import probe_cache
+import fake_toolchain
+import device_inventory
+import web_server
+from command_runner import execute_command, PROJECT_ROOT, FAKE_BIN_DIR
+from failure_signatures import FAILURE_SIGNATURES
+from build_invalidation import compute_fingerprint
+from build_telemetry import percentile
+from gradle_tuning import ensure_gradle_properties, run_gradle_build, MANAGED_BEGIN
+from web_server import index_directory
+from checks import run_checks
+
+# 結果の保存先 (JSON)
+RESULTS_FILE = os.path.join(PROJECT_ROOT, "output", "bench", "bench_results.json")
+RESULTS_VERSION = 1
+
+# 出力の読み込みを計測する行数と、速さを制限した場合の行数・速さ (行/秒)
+PUMP_LINES = 20000
+PACED_LINES = 2000
+PACED_RATE = 10000
+# Web ビルドの成果物に見立てるファイル数
+WEB_FILES = 300
+
+# 遅くなったと判定する割合 (%) と、計測の揺らぎとして無視する差 (秒)
+DEFAULT_THRESHOLD = 25
+MIN_REGRESSION_SECONDS = 0.005
+
+ENTRY_POINTS = {
+    'ios': "run_ios/main.py",
+    'emu_android': "run_emu_android/main.py",
+    'emu_ios': "run_emu_ios/main.py",
+    'chrome': "run_chrome/main.py",
+    'android': "run_android/build_android_app.py",
+}
+
+GRADLE_TEMPLATE = """android {
+    namespace "com.example.gyroscope_app"
+    compileSdk 35
+    ndkVersion "25.1.8937393"
+
+    defaultConfig {
+        minSdk 23
+        targetSdk 35
+    }
+}
+""" + "".join(f"// dependency block {i}\ndependencies {{ implementation 'com.example:lib{i}:1.0.{i}' }}\n"
+              for i in range(120))
+PODFILE_TEMPLATE = "platform :ios, '13.0'\n\n" + "".join(f"# pod option {i}\n" for i in range(60)) + \
+    'target "Runner" do\n  use_frameworks!\n  flutter_install_all_ios_pods File.dirname(File.realpath(__FILE__))\nend\n'
+
+
+def load_entry(relative):
+    """エントリポイントのスクリプトをモジュールとして読み込む (main() は実行しない)"""
+    path = os.path.join(PROJECT_ROOT, relative)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = "bench_" + os.path.dirname(relative)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def _quiet():
+    """計測中の表示を捨てる"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def _chdir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def prepare_sandbox(root, avds=None, simulators=None):
+    """計測用のホームディレクトリ・プロジェクトを作り、簡易版のツールチェーンを使うよう環境を設定する
+
+    avds・simulators を指定した場合は、簡易版のツールが返すAVD・シミュレータの台数を変更する。
+    """
+    if avds is not None:
+        os.environ["FAKE_AVD_COUNT"] = str(avds)
+        fake_toolchain.AVD_COUNT = avds
+    if simulators is not None:
+        os.environ["FAKE_SIMULATOR_COUNT"] = str(simulators)
+    os.environ["FAKE_TOOLCHAIN_STATE"] = os.path.join(root, "fake_toolchain_state.json")
+    home = fake_toolchain.prepare_home(os.path.join(root, "home"))
+
+    project = os.path.join(root, "project")
+    with open(os.path.join(PROJECT_ROOT, "android", "gradle.properties")) as f:
+        _write(os.path.join(project, "android", "gradle.properties"), f.read())
+    web_root = os.path.join(project, "build", "web")
+    for index in range(WEB_FILES):
+        suffix = (".js", ".css", ".json", ".png")[index % 4]
+        _write(os.path.join(web_root, "assets", f"file{index}.{index * 7919:08x}{suffix}"), f"content {index}\n" * 300)
+    _write(os.path.join(web_root, "index.html"), "<html><body>bench</body></html>\n" * 50)
+
+    os.environ["HOME"] = home
+    command_runner.enable_fake_toolchain(force=True)
+    # ログとプローブの記録がプロジェクトのものと混ざらないようにする
+    command_runner.LOG_DIR = os.path.join(root, "logs")
+    probe_cache.CACHE_DIR = os.path.join(root, "cache")
+    probe_cache.PROBE_CACHE_FILE = os.path.join(probe_cache.CACHE_DIR, "probes.json")
+    # 事前圧縮したWebファイルの保存先は、読み込み時のキャッシュの場所から決まっているため合わせて変更する
+    web_server.PRECOMPRESSED_DIR = os.path.join(probe_cache.CACHE_DIR, "web_precompressed")
+    # デバイス一覧のサービスも計測用に別に起動する (バックグラウンドのサービスには環境変数で伝える)
+    os.environ["DEVICE_INVENTORY_DIR"] = device_inventory.INVENTORY_DIR = os.path.join(root, "inventory")
+    for name in ("INVENTORY_FILE", "LOCK_FILE", "LEASE_FILE", "LOG_FILE"):
+        path = getattr(device_inventory, name)
+        setattr(device_inventory, name, os.path.join(device_inventory.INVENTORY_DIR, os.path.basename(path)))
+    return project
+
+
+def measure(func, iterations, setup=None, baseline=None, warmup=1):
+    """func を iterations 回実行し、1回ごとの所要時間 (秒) の一覧を返す。setup の時間は含めない
+
+    baseline を指定した場合は func と交互に実行し、(func の一覧, baseline の一覧) を返す
+    (交互に実行して、計測中の負荷の変化が両方に同じように影響するようにする)。
+    """
+    samples, baseline_samples = [], []
+    for index in range(warmup + iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if baseline:
+            baseline_start = time.perf_counter()
+            baseline()
+            baseline_elapsed = time.perf_counter() - baseline_start
+        if index >= warmup:
+            samples.append(elapsed)
+            if baseline:
+                baseline_samples.append(baseline_elapsed)
+    return (samples, baseline_samples) if baseline else samples
+
+
+def summarize(samples):
+    return {
+        'iterations': len(samples),
+        'median': round(percentile(samples, 0.5), 6),
+        'p95': round(percentile(samples, 0.95), 6),
+        'min': round(min(samples), 6),
+        'mean': round(sum(samples) / len(samples), 6),
+    }
+
+
+def _raw_run(command, cwd=None):
+    """計測の基準: 出力を読み込むだけの最小限の実行"""
+    subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+
+
+def build_benchmarks(project):
+    """計測項目の一覧を作る
+
+    各項目は name, entry (対象のスクリプト), category, func, iterations と、必要に応じて
+    setup (計測に含めない準備)、baseline (オーバーヘッドの基準にする処理)、lines (出力行数) を持つ。
+    """
+    entries = {key: load_entry(relative) for key, relative in ENTRY_POINTS.items()}
+    ios_builder = sys.modules['ios_builder']
+    pump_command = "flutter build apk --release"
+    paced_command = f"FAKE_OUTPUT_LINES={PACED_LINES} FAKE_LINE_RATE={PACED_RATE} flutter build apk --release"
+    gradle_files = [os.path.join(project, "android", "build.gradle"),
+                    os.path.join(project, "android", "app", "build.gradle")]
+    gradle_properties = os.path.join(project, "android", "gradle.properties")
+    with open(gradle_properties) as f:
+        original_properties = f.read()
+    swift_backups = os.path.join(PROJECT_ROOT, "run_ios", "swift_backups")
+
+    def reset_gradle():
+        for path in gradle_files:
+            _write(path, GRADLE_TEMPLATE)
+
+    def reset_podfile():
+        _write(os.path.join(project, "ios", "Podfile"), PODFILE_TEMPLATE)
+
+    def reset_properties():
+        _write(gradle_properties, original_properties.split(MANAGED_BEGIN)[0])
+
+    def probe_ios_devices():
+        probe_cache.invalidate_probes("xcrun")
+        # get_connected_ios_devices は macOS 以外では何もしないため、macOS として実行する
+        with mock.patch.object(ios_builder.platform, 'system', return_value="Darwin"):
+            ios_builder.get_connected_ios_devices()
+
+    def patch_swift_files():
+        # 修正時にプロジェクト内に作られるバックアップは残さない
+        before = set(os.listdir(swift_backups)) if os.path.isdir(swift_backups) else None
+        entries['ios'].fix_all_audioplayers_swift_files()
+        if before is None:
+            shutil.rmtree(swift_backups, ignore_errors=True)
+        else:
+            for name in set(os.listdir(swift_backups)) - before:
+                os.remove(os.path.join(swift_backups, name))
+
+    def in_project(func, *args):
+        def run():
+            with _chdir(project):
+                func(*args)
+        return run
+
+    env = dict(os.environ, FAKE_OUTPUT_LINES=str(PUMP_LINES))
+    return [
+        # プロセス起動と出力の読み込み (全スクリプト共通の command_runner)
+        {'name': "spawn", 'entry': "run_common/command_runner.py", 'category': "spawn", 'iterations': 20,
+         'func': lambda: execute_command("flutter --version", show_output=False),
+         'baseline': lambda: _raw_run("flutter --version")},
+        {'name': "pump", 'entry': "run_common/command_runner.py", 'category': "pump", 'iterations': 5,
+         'func': lambda: execute_command(pump_command, show_output=False, env=env, cwd=project),
+         'baseline': lambda: subprocess.run(pump_command, shell=True, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, env=env, cwd=project),
+         'lines': PUMP_LINES},
+        {'name': "pump_logged", 'entry': "run_common/command_runner.py", 'category': "pump", 'iterations': 5,
+         'func': lambda: execute_command(pump_command, show_output=False, env=env, cwd=project,
+                                         log_name="bench_pump", failure_signatures=FAILURE_SIGNATURES),
+         'baseline': lambda: subprocess.run(pump_command, shell=True, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, env=env, cwd=project),
+         'lines': PUMP_LINES},
+        {'name': "pump_paced", 'entry': "run_common/command_runner.py", 'category': "pump", 'iterations': 3,
+         'func': lambda: execute_command(paced_command, show_output=False, show_progress=True, cwd=project),
+         'baseline': lambda: _raw_run(paced_command, cwd=project), 'lines': PACED_LINES},
+        # run_ios/main.py
+        {'name': "ios.device_parse", 'entry': ENTRY_POINTS['ios'], 'category': "device_parse", 'iterations': 10,
+         'func': probe_ios_devices},
+        {'name': "ios.fingerprint", 'entry': ENTRY_POINTS['ios'], 'category': "file_sweep", 'iterations': 5,
+         'func': lambda: compute_fingerprint('ios')},
+        {'name': "ios.patch_podfile", 'entry': ENTRY_POINTS['ios'], 'category': "patch", 'iterations': 20,
+         'setup': reset_podfile, 'func': in_project(entries['ios'].modify_ios_podfile)},
+        {'name': "ios.patch_swift", 'entry': ENTRY_POINTS['ios'], 'category': "patch", 'iterations': 10,
+         'func': patch_swift_files},
+        # run_emu_android/main.py
+        {'name': "emu_android.device_parse", 'entry': ENTRY_POINTS['emu_android'], 'category': "device_parse",
+         'iterations': 5, 'func': entries['emu_android'].get_available_emulators},
+        {'name': "emu_android.patch_ndk", 'entry': ENTRY_POINTS['emu_android'], 'category': "patch",
+         'iterations': 20, 'setup': reset_gradle,
+         'func': in_project(entries['emu_android'].update_gradle_ndk_version, "27.0.12077973")},
+        # run_emu_ios/main.py
+        {'name': "emu_ios.device_parse", 'entry': ENTRY_POINTS['emu_ios'], 'category': "device_parse",
+         'iterations': 10, 'func': entries['emu_ios'].get_available_simulators},
+        # run_chrome/main.py
+        {'name': "chrome.fingerprint", 'entry': ENTRY_POINTS['chrome'], 'category': "file_sweep", 'iterations': 5,
+         'func': lambda: compute_fingerprint('web')},
+        {'name': "chrome.index_web", 'entry': ENTRY_POINTS['chrome'], 'category': "file_sweep", 'iterations': 5,
+         'func': lambda: index_directory(os.path.join(project, "build", "web"))},
+        # run_android/build_android_app.py
+        {'name': "android.gradle_output", 'entry': ENTRY_POINTS['android'], 'category': "pump", 'iterations': 5,
+         'func': lambda: run_gradle_build("flutter build apk --release", None, "bench_gradle",
+                                          show_progress=False, env=env, cwd=project),
+         'baseline': lambda: subprocess.run(f"{pump_command} -v", shell=True, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, env=env, cwd=project),
+         'lines': PUMP_LINES},
+        {'name': "android.fingerprint", 'entry': ENTRY_POINTS['android'], 'category': "file_sweep",
+         'iterations': 5, 'func': lambda: compute_fingerprint('android')},
+        {'name': "android.patch_properties", 'entry': ENTRY_POINTS['android'], 'category': "patch",
+         'iterations': 20, 'setup': reset_properties, 'func': lambda: ensure_gradle_properties(gradle_properties)},
+    ]
+
+
+def run_benchmarks(benchmarks, scale=1.0, selected=None):
+    """計測を実行し、項目ごとの結果の一覧を返す"""
+    results = []
+    for bench in benchmarks:
+        if selected and not any(pattern in bench['name'] for pattern in selected):
+            continue
+        iterations = max(1, int(bench['iterations'] * scale))
+        with _quiet():
+            if 'baseline' in bench:
+                samples, baseline = measure(bench['func'], iterations, bench.get('setup'), bench['baseline'])
+            else:
+                samples, baseline = measure(bench['func'], iterations, bench.get('setup')), None
+        result = {'name': bench['name'], 'entry': bench['entry'], 'category': bench['category']}
+        result.update(summarize(samples))
+        result['value'] = result['median']
+        if baseline:
+            result['baseline_median'] = round(percentile(baseline, 0.5), 6)
+            # オーバーヘッド = スクリプト経由の実行時間 - 最小限の実行時間
+            result['overhead'] = round(result['median'] - result['baseline_median'], 6)
+            result['value'] = result['overhead']
+        if 'lines' in bench:
+            result['lines_per_second'] = round(bench['lines'] / result['median'])
+        results.append(result)
+        print(f"⏱️ {bench['name']:<28} {iterations:>3}回 | 中央値 {result['median'] * 1000:8.1f}ms"
+              + (f" / オーバーヘッド {result['overhead'] * 1000:7.1f}ms" if baseline else ""))
+    return results
+
+
+def compare_results(results, baseline_results, threshold=DEFAULT_THRESHOLD):
+    """基準の結果と比較し、遅くなった項目の一覧を返す
+
+    比較するのは value (基準の処理がある項目はオーバーヘッド、それ以外は中央値)。
+    オーバーヘッドは0に近い値になり得るため、増加分を基準の結果の中央値に対する割合で判定する。
+    """
+    previous = {result['name']: result for result in baseline_results}
+    regressions = []
+    print(f"\n{'項目':<28} | {'基準':>10} | {'今回':>10} | {'変化':>7}")
+    print("-" * 66)
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            print(f"{result['name']:<28} | {'-':>10} | {result['value'] * 1000:>8.1f}ms | {'新規':>7}")
+            continue
+        increase = result['value'] - before['value']
+        change = increase / before['median'] * 100 if before['median'] > 0 else 0.0
+        regressed = increase > max(before['median'] * threshold / 100, MIN_REGRESSION_SECONDS)
+        if regressed:
+            regressions.append(result['name'])
+        print(f"{result['name']:<28} | {before['value'] * 1000:>8.1f}ms | {result['value'] * 1000:>8.1f}ms | "
+              f"{change:>+6.0f}%{' ⚠️' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルドスクリプト自体の処理時間を簡易版のツールチェーンで計測する")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='名前に指定の文字列を含む項目のみ計測')
+    parser.add_argument('--scale', type=float, default=1.0, help='繰り返し回数の倍率')
+    parser.add_argument('--avds', type=int, help='簡易版の emulator が返すAVDの数 (デバイス検出の負荷試験用)')
+    parser.add_argument('--simulators', type=int, help='簡易版の xcrun が返すシミュレータの数')
+    parser.add_argument('--output', default=RESULTS_FILE, help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', metavar='JSON', help='比較する基準の結果ファイル')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='遅くなったと判定する割合 (%%)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='遅くなった項目があれば終了コード1')
+    parser.add_argument('--check', action='store_true',
+                        help='計測の代わりに、キャッシュなどの動作を簡易版のツールチェーンで確認する (失敗があれば終了コード1)')
+    args = parser.parse_args()
+
+    baseline_results = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline_results = json.load(f)['results']
+
+    with tempfile.TemporaryDirectory(prefix="flutter_bench_") as sandbox:
+        saved_environ = dict(os.environ)
+        project = None
+        try:
+            project = prepare_sandbox(sandbox, args.avds, args.simulators)
+            if args.check:
+                print(f"=== 動作の確認 ({FAKE_BIN_DIR} のツールを使用) ===")
+                return 1 if run_checks(project, args.only) else 0
+            print(f"=== オーケストレーションのベンチマーク ({FAKE_BIN_DIR} のツールを使用) ===")
+            results = run_benchmarks(build_benchmarks(project), args.scale, args.only)
+        finally:
+            # 準備の途中で失敗した場合、ロックファイルはまだプロジェクトのものを指しているため止めない
+            if project is not None:
+                device_inventory.stop_inventory()
+            os.environ.clear()
+            os.environ.update(saved_environ)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'host': socket.gethostname(),
+        'platform': f"{platform.system()} {platform.machine()}",
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'devices': {'avds': fake_toolchain.AVD_COUNT,
+                    'simulators': args.simulators or fake_toolchain.SIMULATOR_COUNT},
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"\n📄 結果: {args.output}")
+
+    if baseline_results is None:
+        return 0
+    regressions = compare_results(results, baseline_results, args.threshold)
+    if regressions:
+        print(f"\n⚠️ {args.threshold:.0f}%以上遅くなった項目: {', '.join(regressions)}")
+    else:
+        print("\n✅ 遅くなった項目はありません")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,44 +9,23 @@ import sys
 import subprocess
 import time
 import shutil
+import threading
 
-def run_command(cmd, description="", timeout=None, show_output=True, show_progress=False):
-    """コマンドを実行し、結果を表示する"""
-    if description:
-        print(f"\n===== {description} =====")
-        print(f"実行: {cmd}")
-    
-    try:
-        if show_output:
-            if show_progress:
-                process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-                for line in iter(process.stdout.readline, ''):
-                    if line:  # 空行をスキップ
-                        print(line.rstrip())
-                process.stdout.close()
-                return_code = process.wait(timeout=timeout)
-            else:
-                result = subprocess.run(cmd, shell=True, check=False, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-                if result.stdout:
-                    print(result.stdout)
-                return_code = result.returncode
-        else:
-            result = subprocess.run(cmd, shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-            return_code = result.returncode
-        
-        if return_code != 0 and show_output:
-            print(f"エラー発生 (コード: {return_code})")
-            if not show_progress:
-                print(f"エラー詳細: {result.stdout}")
-            return False
-        
-        return True
-    except subprocess.TimeoutExpired:
-        print(f"タイムアウト: {cmd}")
-        return False
-    except Exception as e:
-        print(f"例外発生: {e}")
-        return False
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+from command_runner import run_command, configure_metrics, enable_fake_toolchain
+from probe_cache import cached_probe, invalidate_probes
+from step_cache import run_pub_get
+from build_invalidation import plan_clean, apply_clean, mark_built
+from preflight import run_preflight
+from artifact_cache import artifact_key, fetch_artifacts, store_artifacts
+from build_telemetry import start_telemetry
+from web_server import serve_directory, DEFAULT_PORT
+from hot_reload import run_hot_reload_session
+from readiness import port_open, wait_for_port
+
+# flutter run -d chrome のWebサーバーのポート番号
+RUN_WEB_PORT = 8080
 
 def check_flutter_installation():
     """Flutter SDKのインストールを確認する"""
@@ -63,7 +42,9 @@ def check_flutter_installation():
 def get_flutter_version():
     """Flutterのバージョン情報を取得する"""
     try:
-        result = subprocess.run("flutter --version", shell=True, check=True, text=True, capture_output=True)
+        result = cached_probe("flutter --version")
+        if result.returncode != 0:
+            return "不明"
         version_line = result.stdout.strip().split('\n')[0]
         return version_line
     except:
@@ -93,36 +74,92 @@ def check_chrome_installation():
     print("⚠️ Google Chromeが見つかりませんでした。インストールしてください。")
     return False
 
-def build_and_run_chrome(verbose=False, no_clean=False):
-    """ChromeでFlutterアプリをビルドして実行する"""
+def enable_web(verbose=False):
+    """FlutterのWebサポートを有効化する"""
+    return run_command("flutter config --enable-web", "Webの有効化", show_output=verbose)[0]
+
+def build_and_run_chrome(verbose=False, no_clean=False, force_clean=False, clean_plan=None, watch=False):
+    """ChromeでFlutterアプリをビルドして実行する (Webの有効化は事前チェックで実施済み)"""
     print("\n🚀 FlutterアプリをChromeでビルド・実行します")
     
-    # クリーンビルドが必要な場合
+    # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
     if not no_clean:
-        print("🧹 クリーンビルド実行中...")
-        if not run_command("flutter clean", "クリーンビルド", show_output=verbose):
-            return False
+        print("🔍 前回のビルドからの変更を確認中...")
+        apply_clean(clean_plan or plan_clean('web', force=force_clean), 'web', show_progress=verbose)
     
     # 依存関係の解決
     print("📦 依存パッケージを取得中...")
-    if not run_command("flutter pub get", "依存関係の解決", show_output=verbose):
+    if not run_pub_get("依存関係の解決", show_output=verbose)[0]:
         return False
     
-    # Webビルド前の設定
-    print("⚙️ Webビルドの設定中...")
-    if not run_command("flutter config --enable-web", "Webの有効化", show_output=verbose):
+    # 使用中のポートでは flutter run が起動に失敗するため、先に確認する
+    if port_open(RUN_WEB_PORT):
+        print(f"⚠️ ポート {RUN_WEB_PORT} は既に使用されています。使用中のプロセスを終了してから実行してください")
         return False
     
     # デバッグモードでChromeで実行
     print("🌐 ChromeでFlutterアプリを起動中...")
     print("💡 終了するにはこのターミナルでCtrl+Cを押してください")
+    threading.Thread(target=announce_when_serving, args=(RUN_WEB_PORT,), daemon=True).start()
     
     # 以下のコマンドはブロッキングであり、ユーザーがCtrl+Cを押すまで実行し続ける
-    if not run_command("flutter run -d chrome --web-port 8080", "ChromeでFlutterアプリを実行", show_output=True, show_progress=True):
+    run_cmd = f"flutter run -d chrome --web-port {RUN_WEB_PORT}"
+    if watch:
+        if not run_hot_reload_session(run_cmd, verbose):
+            return False
+    elif not run_command(run_cmd, "ChromeでFlutterアプリを実行", show_output=True, interactive=True)[0]:
         return False
+    mark_built('web')
     
     return True
 
+def announce_when_serving(port):
+    """flutter run のWebサーバーが応答し始めたら URL と待ち時間を表示する"""
+    started = time.time()
+    if wait_for_port(port, timeout=900, name="flutter run のWebサーバー"):
+        print(f"\n🌐 http://localhost:{port}/ で応答しています ({time.time() - started:.1f}秒)")
+
+def open_in_chrome(url):
+    """URL を Google Chrome で開く"""
+    if platform.system() == "Darwin":
+        command = ["open", "-a", "Google Chrome", url]
+    elif platform.system() == "Windows":
+        command = ["cmd", "/c", "start", "chrome", url]
+    else:
+        command = [shutil.which("google-chrome") or shutil.which("chrome") or "google-chrome", url]
+    try:
+        subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"⚠️ Chromeを起動できませんでした ({e})。ブラウザで {url} を開いてください")
+
+def build_and_serve_web(verbose=False, no_clean=False, force_clean=False, clean_plan=None, port=DEFAULT_PORT):
+    """flutter build web の成果物を静的サーバーで配信してChromeで開く
+
+    同じ入力からビルド済みの成果物がキャッシュにあれば、ビルドせずにそれを配信する。
+    """
+    print("\n🚀 ビルド済みのWebアプリをChromeで開きます")
+    # ビルドマトリクスの web ターゲットと同じキーにして成果物を共有する
+    build_command = "flutter build web --release --no-pub"
+    cache_key = artifact_key('web', 'release', build_command)
+    if force_clean or not fetch_artifacts(cache_key):
+        # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
+        if not no_clean:
+            print("🔍 前回のビルドからの変更を確認中...")
+            apply_clean(clean_plan or plan_clean('web', force=force_clean), 'web', show_progress=verbose)
+        
+        # 依存関係の解決
+        print("📦 依存パッケージを取得中...")
+        if not run_pub_get("依存関係の解決", show_output=verbose)[0]:
+            return False
+        
+        if not run_command(build_command + (" --verbose" if verbose else ""), "Webアプリのビルド", timeout=900,
+                           show_output=verbose, show_progress=not verbose, log_name="flutter_build_web")[0]:
+            return False
+        mark_built('web')
+        store_artifacts(cache_key, {"build/web": "build/web"}, meta={'target': "web", 'mode': "release"})
+    
+    return serve_directory("build/web", port, on_ready=open_in_chrome)
+
 def main():
     """メイン実行関数"""
     # カレントディレクトリをプロジェクトのルートに変更（安全のため）
@@ -131,18 +168,20 @@ def main():
     parser = argparse.ArgumentParser(description="Flutter アプリケーションのChromeでの実行")
     parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
     parser.add_argument('--no-clean', action='store_true', help='クリーンビルドをスキップ')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず完全なクリーンを行う')
+    parser.add_argument('--watch', action='store_true',
+                        help='flutter run を起動したまま、ファイルの変更をホットリロード・リスタートで自動反映')
+    parser.add_argument('--prebuilt', action='store_true',
+                        help='flutter run の代わりにリリースビルドを静的サーバーで配信 (キャッシュがあればビルドしない)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='--prebuilt で配信するポート番号')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
     args = parser.parse_args()
+    enable_fake_toolchain()
     
-    print("=== ジャイロスコープアプリ Chrome 自動ビルド＆実行スクリプト ===")
+    if args.refresh_probes:
+        invalidate_probes()
     
-    # Flutter環境のチェック
-    if not check_flutter_installation():
-        return 1
-    
-    # Chromeブラウザのチェック
-    if not check_chrome_installation():
-        print("GoogleChromeをインストールしてから再実行してください。")
-        return 1
+    print("=== ジャイロスコープアプリ Chrome 自動ビルド＆実行スクリプト ===")
     
     # プロジェクトディレクトリの確認
     if not os.path.exists('lib/main.dart'):
@@ -152,10 +191,34 @@ def main():
     
     # 出力フォルダの準備
     os.makedirs("output/web", exist_ok=True)
+    configure_metrics("output/web")
+    start_telemetry("chrome", 'web')
+    
+    # Flutter環境・Chromeブラウザのチェックと Web ビルドの設定を並列に実行する
+    preflight_steps = [
+        {'name': 'flutter', 'func': check_flutter_installation, 'description': "Flutterの確認"},
+        {'name': 'chrome', 'func': check_chrome_installation, 'description': "Google Chromeの確認"},
+        {'name': 'enable_web', 'func': enable_web, 'args': (args.verbose,), 'deps': ['flutter'],
+         'description': "Webビルドの設定"},
+    ]
+    if not args.no_clean:
+        preflight_steps.append({'name': 'clean_plan', 'func': plan_clean, 'args': ('web', args.clean),
+                                'deps': ['flutter'], 'description': "前回のビルドからの変更確認"})
+    preflight = run_preflight(preflight_steps, title="Chrome実行の事前チェック")
+    if not preflight['flutter']['ok'] or not preflight['enable_web']['ok']:
+        return 1
+    if not preflight['chrome']['ok']:
+        print("GoogleChromeをインストールしてから再実行してください。")
+        return 1
+    clean_plan = preflight['clean_plan']['result'] if 'clean_plan' in preflight else None
     
     # ビルドと実行
     try:
-        if build_and_run_chrome(args.verbose, args.no_clean):
+        if args.prebuilt:
+            success = build_and_serve_web(args.verbose, args.no_clean, args.clean, clean_plan, args.port)
+        else:
+            success = build_and_run_chrome(args.verbose, args.no_clean, args.clean, clean_plan, args.watch)
+        if success:
             print("\n✨ アプリの実行が終了しました")
             return 0
         else:
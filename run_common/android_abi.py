@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import datetime
+
+from command_runner import run_command, PROJECT_ROOT
+from failure_signatures import FAILURE_SIGNATURES
+from probe_cache import CACHE_DIR
+from gradle_tuning import run_gradle_build
+from output_store import publish_build, attach_files
+
+# --target-platform と split-per-abi で生成される APK の ABI 名の対応
+ABIS = {
+    'android-arm': 'armeabi-v7a',
+    'android-arm64': 'arm64-v8a',
+    'android-x64': 'x86_64',
+}
+DEFAULT_TARGET_PLATFORMS = ['android-arm', 'android-arm64', 'android-x64']
+
+# ABI ごとの並列ビルドに使う作業ツリー (Gradle のロックと出力先が衝突しないようプロジェクトを分ける)
+# ビルドの中間生成物を次回に再利用するため、作業ツリーは削除せずに差分だけを同期する
+WORKTREE_DIR = os.path.join(CACHE_DIR, "abi_worktrees")
+WORKTREE_INCLUDES = ["lib", "assets", "android", "pubspec.yaml", "pubspec.lock", "analysis_options.yaml", ".metadata"]
+WORKTREE_EXCLUDES = {".gradle", "build", ".cxx", ".kotlin"}
+
+# ABI 1本のビルドが使う資源の目安 (android/gradle.properties の -Xmx8G に Kotlin デーモン分を加えたもの)
+ABI_BUILD_CPUS = 8
+ABI_BUILD_MEMORY_MB = 10240
+APK_OUTPUT_DIR = os.path.join("build", "app", "outputs", "flutter-apk")
+
+
+def _sync_tree(source, destination):
+    """source の内容を destination に反映する (更新日時とサイズが同じファイルはコピーしない)"""
+    if os.path.isfile(source):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        src_stat, dst_stat = os.stat(source), os.stat(destination) if os.path.exists(destination) else None
+        if dst_stat is None or (src_stat.st_size, src_stat.st_mtime_ns) != (dst_stat.st_size, dst_stat.st_mtime_ns):
+            shutil.copy2(source, destination)
+        return
+    os.makedirs(destination, exist_ok=True)
+    names = {name for name in os.listdir(source) if name not in WORKTREE_EXCLUDES}
+    for name in os.listdir(destination):
+        if name in WORKTREE_EXCLUDES or name in names:
+            continue
+        stale = os.path.join(destination, name)
+        if os.path.isdir(stale) and not os.path.islink(stale):
+            shutil.rmtree(stale)
+        else:
+            os.remove(stale)
+    for name in names:
+        src = os.path.join(source, name)
+        if os.path.islink(src):
+            continue
+        _sync_tree(src, os.path.join(destination, name))
+
+
+def prepare_worktree(target_platform):
+    """ABI 用の作業ツリーをプロジェクトの現在の内容に同期し、そのパスを返す"""
+    worktree = os.path.join(WORKTREE_DIR, target_platform)
+    for relative in WORKTREE_INCLUDES:
+        source = os.path.join(PROJECT_ROOT, relative)
+        if os.path.exists(source):
+            _sync_tree(source, os.path.join(worktree, relative))
+    return worktree
+
+
+def build_abi(target_platform, mode="release", extra_flags=""):
+    """1つの ABI の APK を専用の作業ツリーでビルドする
+
+    成功時は {'apk': APK のパス, 'gradle': Gradle のタスク集計}、失敗時はFalseを返す。
+    """
+    abi = ABIS[target_platform]
+    worktree = prepare_worktree(target_platform)
+    pub_success, _ = run_command(f"cd '{worktree}' && (flutter pub get --offline || flutter pub get)",
+                                 f"依存関係の解決 ({abi})", timeout=300, show_output=False)
+    if not pub_success:
+        return False
+    command = (f"cd '{worktree}' && flutter build apk --{mode} --no-pub --split-per-abi "
+               f"--target-platform {target_platform} {extra_flags}")
+    result, stats = run_gradle_build(command.strip(), f"Android APKビルド ({abi})", f"flutter_build_apk_{abi}",
+                                     timeout=1200, show_progress=False, failure_signatures=FAILURE_SIGNATURES)
+    if not result['success']:
+        return False
+    apk_path = os.path.join(worktree, APK_OUTPUT_DIR, f"app-{abi}-{mode}.apk")
+    if not os.path.exists(apk_path):
+        print(f"APKファイルが見つかりません: {apk_path}")
+        return False
+    return {'apk': apk_path, 'gradle': stats}
+
+
+def find_split_apks(mode="release", output_dir=APK_OUTPUT_DIR):
+    """split-per-abi でビルドされた APK を ABI ごとに探す ({abi: path})"""
+    apks = {}
+    for abi in ABIS.values():
+        path = os.path.join(output_dir, f"app-{abi}-{mode}.apk")
+        if os.path.exists(path):
+            apks[abi] = path
+    return apks
+
+
+def collect_apks(apks, output_folder, durations=None, mode="release"):
+    """APK を出力フォルダに置き、ABI・サイズ・SHA-256 をマニフェストに記録する
+
+    apks は {abi: path}、durations は {abi: ビルド秒数}。戻り値はマニフェストの辞書。
+    APK は output_store に保存してハードリンクで置くため、同じ内容のAPKは容量を消費しない。
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    build_id = f"gyroscope_app_{timestamp}"
+    record = publish_build(output_folder, {f"{build_id}_{abi}.apk": path for abi, path in apks.items()},
+                           build_id, meta={'mode': mode})
+    manifest = {'timestamp': timestamp, 'mode': mode, 'artifacts': []}
+    for abi, item in zip(sorted(apks), record['files']):
+        entry = {
+            'abi': abi,
+            'file': item['name'],
+            'size': item['size'],
+            'sha256': item['sha256'],
+        }
+        if durations and abi in durations:
+            entry['build_seconds'] = round(durations[abi], 1)
+        manifest['artifacts'].append(entry)
+
+    manifest_name = f"{build_id}_manifest.json"
+    manifest_path = os.path.join(output_folder, manifest_name)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    attach_files(record, [manifest_name])
+    manifest['path'] = manifest_path
+    return manifest
+
+
+def print_apk_manifest(manifest):
+    """マニフェストの内容を一覧表示する"""
+    print(f"\n{'ABI':<12} | {'サイズ':>9} | {'ビルド時間':>8} | SHA-256")
+    print("-" * 100)
+    for entry in manifest['artifacts']:
+        seconds = f"{entry['build_seconds']:.1f}s" if 'build_seconds' in entry else "-"
+        print(f"{entry['abi']:<12} | {entry['size'] / (1024 * 1024):>7.2f}MB | {seconds:>8} | {entry['sha256']}")
+    print(f"\nマニフェスト: {manifest['path']}")
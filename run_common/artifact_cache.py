@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hmac
+import hashlib
+import argparse
+import posixpath
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from command_runner import PROJECT_ROOT
+from probe_cache import CACHE_DIR
+from build_invalidation import content_digest, file_digest, toolchain_version
+from build_telemetry import record_cache_event
+
+# ビルド成果物のキャッシュの保存先
+# objects/<sha256の先頭2文字>/<sha256> にファイルの内容を、entries/<キー>.json に成果物の構成を保存する
+ARTIFACT_CACHE_DIR = os.path.join(CACHE_DIR, "artifacts")
+# キャッシュの上限 (MB)。環境変数 ARTIFACT_CACHE_MAX_MB で変更できる
+ARTIFACT_CACHE_MAX_MB = int(os.environ.get("ARTIFACT_CACHE_MAX_MB", "10240"))
+# 自動での削減を行う間隔 (秒)。保存のたびには行わない
+PRUNE_INTERVAL = 600
+# どのエントリからも参照されていなくても、この時間 (秒) 以内に書き込まれたファイルは削除しない
+# (エントリを書き込む前のファイルを、別のプロセスの削減が消してしまわないようにする)
+PRUNE_GRACE_SECONDS = 3600
+# 環境変数 NO_ARTIFACT_CACHE=1 でキャッシュを無効化する
+ARTIFACT_CACHE_ENABLED = os.environ.get("NO_ARTIFACT_CACHE", "") not in ("1", "true", "yes")
+# 共有キャッシュサーバーの URL (例: http://build-cache.local:8765)。未設定ならローカルのみ
+ARTIFACT_CACHE_URL = os.environ.get("ARTIFACT_CACHE_URL", "").rstrip("/")
+REMOTE_TIMEOUT = 30
+DEFAULT_PORT = 8765
+# 共有キャッシュサーバーへの書き込みに必要なトークン (サーバーとクライアントで同じ値を設定する。未設定なら認証なし)
+ARTIFACT_CACHE_TOKEN = os.environ.get("ARTIFACT_CACHE_TOKEN", "")
+# 共有キャッシュサーバーが受け付けるファイル1つの上限 (MB)。環境変数 ARTIFACT_CACHE_MAX_UPLOAD_MB で変更できる
+MAX_UPLOAD_MB = int(os.environ.get("ARTIFACT_CACHE_MAX_UPLOAD_MB", "2048"))
+# エントリ (成果物の構成のJSON) の上限
+MAX_ENTRY_BYTES = 16 * 1024 * 1024
+
+# キーの形式を変えた場合に上げる (古いエントリと混ざらないようにする)
+KEY_VERSION = 1
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def artifact_key(platform_name, mode, variant=""):
+    """ビルドの入力からキャッシュのキーを作成する
+
+    lib/・assets/・pubspec.yaml・pubspec.lock・プラットフォームディレクトリの内容と、
+    ツールチェーンのバージョン・ビルドモード・ビルドの種類 (variant) のハッシュ。
+    更新日時は使わないため、別のマシンや新しいチェックアウトでも同じキーになる。
+    """
+    digest = hashlib.sha256()
+    parts = [
+        f"v{KEY_VERSION}", platform_name, mode, variant,
+        toolchain_version(platform_name),
+        content_digest(os.path.join(PROJECT_ROOT, "lib")),
+        content_digest(os.path.join(PROJECT_ROOT, "assets")),
+        file_digest(os.path.join(PROJECT_ROOT, "pubspec.yaml")),
+        file_digest(os.path.join(PROJECT_ROOT, "pubspec.lock")),
+        content_digest(os.path.join(PROJECT_ROOT, platform_name)),
+    ]
+    for part in parts:
+        digest.update(f"{part}\n".encode())
+    return digest.hexdigest()
+
+
+def _object_path(sha, root=None):
+    return os.path.join(root or ARTIFACT_CACHE_DIR, "objects", sha[:2], sha)
+
+
+def _entry_path(key, root=None):
+    return os.path.join(root or ARTIFACT_CACHE_DIR, "entries", f"{key}.json")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _store_object(source, root=None):
+    """ファイルを内容のハッシュで保存し、(sha256, サイズ) を返す (同じ内容は1つにまとまる)"""
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    sha = digest.hexdigest()
+    path = _object_path(sha, root)
+    try:
+        # 既存のファイルを使う場合も更新日時を新しくし、エントリを書き込むまで削減の対象外にする
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+    return sha, os.path.getsize(path)
+
+
+def _walk_artifact(name, source):
+    """成果物 (ファイルまたはディレクトリ) を (相対パス, 実パス) の一覧に展開する"""
+    if not os.path.isdir(source) or os.path.islink(source):
+        return [(name, source)]
+    items = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames.sort()
+        for child in sorted(filenames) + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            path = os.path.join(dirpath, child)
+            items.append((os.path.join(name, os.path.relpath(path, source)), path))
+    return items
+
+
+def _is_safe_path(path):
+    """正規化済みの相対パスで、'..' を含まないか (エントリ内のパスは常に '/' 区切り)"""
+    return (isinstance(path, str) and path not in ("", ".") and "\\" not in path and "\0" not in path
+            and not posixpath.isabs(path) and posixpath.normpath(path) == path
+            and ".." not in path.split("/"))
+
+
+def _artifact_root(path, artifacts):
+    """パスを含む成果物の名前 (復元先のルート) を返す (どれにも含まれなければNone)"""
+    for name in artifacts:
+        if path == name or path.startswith(name + "/"):
+            return name
+    return None
+
+
+def _link_in_root(path, link, root):
+    """シンボリックリンクの参照先が成果物のルートの中に収まるか (パスの上での判定)"""
+    if not isinstance(link, str) or not link or "\0" in link or posixpath.isabs(link):
+        return False
+    resolved = posixpath.normpath(posixpath.join(posixpath.dirname(path), link))
+    return resolved == root or resolved.startswith(root + "/")
+
+
+def validate_entry(entry, key=None):
+    """エントリの構成を検証し、問題があれば理由を返す (問題なければNone)
+
+    共有キャッシュなど信頼できない取得元のエントリも、復元先の外に書き込めないようにする。
+    成果物の名前とファイルのパスはすべて '..' を含まない正規化済みの相対パスで、
+    ファイルはいずれかの成果物の中にあり、シンボリックリンクはその成果物の外を指さないこと。
+    """
+    if not isinstance(entry, dict):
+        return "形式が不正です"
+    if key is not None and entry.get('key') != key:
+        return "キーが一致しません"
+    artifacts, files = entry.get('artifacts'), entry.get('files')
+    if not isinstance(artifacts, list) or not isinstance(files, list) or not isinstance(entry.get('meta', {}), dict):
+        return "形式が不正です"
+    for name in artifacts:
+        if not _is_safe_path(name):
+            return f"不正な成果物のパス: {name!r}"
+        if any(other != name and other.startswith(name + "/") for other in artifacts):
+            return f"成果物のパスが重複しています: {name!r}"
+    for item in files:
+        path = item.get('path') if isinstance(item, dict) else None
+        if not _is_safe_path(path):
+            return f"不正なファイルのパス: {path!r}"
+        root = _artifact_root(path, artifacts)
+        if root is None:
+            return f"成果物の外のファイル: {path}"
+        if 'link' in item:
+            if 'sha256' in item or not _link_in_root(path, item['link'], root):
+                return f"成果物の外を指すシンボリックリンク: {path} -> {item['link']!r}"
+        elif not isinstance(item.get('sha256'), str) or not _SHA256_RE.match(item['sha256']) \
+                or not isinstance(item.get('size'), int) or item['size'] < 0:
+            return f"不正なファイルの情報: {path}"
+    return None
+
+
+def load_entry(key, root=None):
+    try:
+        with open(_entry_path(key, root), 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    problem = validate_entry(entry, key)
+    if problem:
+        print(f"警告: キャッシュのエントリ ({key[:12]}) を使用しません - {problem}")
+        return None
+    return entry
+
+
+def store_artifacts(key, artifacts, meta=None):
+    """成果物をキャッシュに保存する
+
+    artifacts は {復元先の相対パス: 実パス} で、ディレクトリも指定できる。
+    共有キャッシュサーバーが設定されていればアップロードも行う。
+    """
+    if not ARTIFACT_CACHE_ENABLED or not key or not artifacts:
+        return False
+    entry = {'key': key, 'created': time.time(), 'artifacts': sorted(artifacts), 'files': [], 'meta': meta or {}}
+    try:
+        for name, source in sorted(artifacts.items()):
+            if not os.path.lexists(source):
+                print(f"警告: キャッシュに保存する成果物が見つかりません - {source}")
+                return False
+            for relative, path in _walk_artifact(name, source):
+                if os.path.islink(path):
+                    entry['files'].append({'path': relative, 'link': os.readlink(path)})
+                    continue
+                sha, size = _store_object(path)
+                entry['files'].append({'path': relative, 'sha256': sha, 'size': size,
+                                       'executable': os.access(path, os.X_OK)})
+        problem = validate_entry(entry)
+        if problem:
+            print(f"警告: 成果物をキャッシュに保存できません - {problem}")
+            return False
+        _write_atomic(_entry_path(key), json.dumps(entry, ensure_ascii=False, indent=1).encode())
+    except OSError as e:
+        print(f"警告: 成果物のキャッシュ保存に失敗しました - {e}")
+        return False
+    size_mb = sum(item.get('size', 0) for item in entry['files']) / (1024 * 1024)
+    print(f"💾 成果物をキャッシュに保存しました ({key[:12]}, {len(entry['files'])}ファイル, {size_mb:.1f}MB)")
+    if ARTIFACT_CACHE_URL:
+        upload_entry(key)
+    maybe_prune_artifact_cache()
+    return True
+
+
+def _remove_artifacts(entry, destination_root):
+    for name in entry['artifacts']:
+        target = os.path.join(destination_root, name)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+
+
+def _materialize_entry(entry, destination_root):
+    """エントリの成果物を destination_root 以下に展開する (既存の成果物は置き換える)
+
+    validate_entry で検証済みのエントリを前提に、実パスでも各成果物のルートの外に出ないことを確認する。
+    外に出るものがあれば展開した成果物を削除してValueErrorを送出する。
+    """
+    _remove_artifacts(entry, destination_root)
+    roots = {name: os.path.realpath(os.path.join(destination_root, name)) for name in entry['artifacts']}
+
+    def check(path, item):
+        real = os.path.realpath(path)
+        root = roots[_artifact_root(item['path'], entry['artifacts'])]
+        if real != root and not real.startswith(root + os.sep):
+            raise ValueError(f"成果物の外を指すパス: {item['path']}")
+
+    try:
+        # 通常のファイルを先に展開し、シンボリックリンクを経由して書き込まないようにする
+        for item in sorted(entry['files'], key=lambda item: 'link' in item):
+            target = os.path.join(destination_root, item['path'])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if item['path'] not in roots:
+                # 成果物がディレクトリの場合は、書き込み先のディレクトリがその中にあること
+                # (ファイル1つの成果物は、親ディレクトリがルートの外になるため対象外)
+                check(os.path.dirname(target), item)
+            if 'link' in item:
+                os.symlink(item['link'], target)
+                continue
+            # ビルドツールがその場で書き換えても汚れないよう、リンクではなく複製する
+            shutil.copyfile(_object_path(item['sha256']), target)
+            if item.get('executable'):
+                os.chmod(target, 0o755)
+        # リンクをたどった先 (リンクの連鎖を含む) もルートの中にあること
+        for item in entry['files']:
+            if 'link' in item:
+                check(os.path.join(destination_root, item['path']), item)
+    except ValueError:
+        _remove_artifacts(entry, destination_root)
+        raise
+
+
+def fetch_artifacts(key, destination_root=PROJECT_ROOT):
+    """キーが一致する成果物を復元し、復元した相対パスの一覧を返す (無ければNone)
+
+    ローカルに無い場合は共有キャッシュサーバーから取得する。
+    """
+    if not ARTIFACT_CACHE_ENABLED or not key:
+        return None
+    entry = load_entry(key)
+    if entry is None and ARTIFACT_CACHE_URL:
+        entry = download_entry(key)
+    if entry is None:
+        record_cache_event("artifact_cache", False, fingerprint=key)
+        return None
+    missing = [item for item in entry['files'] if 'sha256' in item and not os.path.exists(_object_path(item['sha256']))]
+    if missing:
+        print(f"警告: キャッシュの一部 ({len(missing)}ファイル) が欠けているため使用しません")
+        os.remove(_entry_path(key))
+        return None
+
+    start = time.time()
+    # 復元中に別のプロセスの削減で消されないよう、先に最近使ったエントリにする
+    os.utime(_entry_path(key))
+    try:
+        _materialize_entry(entry, destination_root)
+    except ValueError as e:
+        print(f"警告: 不正なキャッシュのエントリのため使用しません - {e}")
+        os.remove(_entry_path(key))
+        return None
+    except OSError as e:
+        print(f"警告: 成果物の復元に失敗しました - {e}")
+        return None
+    record_cache_event("artifact_cache", True, fingerprint=key, duration=time.time() - start)
+    print(f"♻️ キャッシュから成果物を復元しました ({key[:12]}, {time.time() - start:.1f}秒)")
+    return entry['artifacts']
+
+
+def _remote_request(method, path, data=None):
+    """共有キャッシュサーバーにリクエストを送り、(ステータス, 本文) を返す (接続できなければNone)"""
+    request = urllib.request.Request(f"{ARTIFACT_CACHE_URL}/{path}", data=data, method=method)
+    if ARTIFACT_CACHE_TOKEN:
+        request.add_header("Authorization", f"Bearer {ARTIFACT_CACHE_TOKEN}")
+    try:
+        with urllib.request.urlopen(request, timeout=REMOTE_TIMEOUT) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b''
+    except (urllib.error.URLError, OSError) as e:
+        print(f"警告: 共有キャッシュサーバーに接続できません ({ARTIFACT_CACHE_URL}) - {e}")
+        return None
+
+
+def download_entry(key):
+    """共有キャッシュサーバーからエントリと不足しているファイルを取得する"""
+    response = _remote_request("GET", f"entries/{key}.json")
+    if response is None or response[0] != 200:
+        return None
+    try:
+        entry = json.loads(response[1])
+    except ValueError:
+        return None
+    problem = validate_entry(entry, key)
+    if problem:
+        print(f"警告: 共有キャッシュのエントリ ({key[:12]}) を使用しません - {problem}")
+        return None
+    for item in entry['files']:
+        if 'sha256' not in item or os.path.exists(_object_path(item['sha256'])):
+            continue
+        response = _remote_request("GET", f"objects/{item['sha256']}")
+        if response is None or response[0] != 200 or hashlib.sha256(response[1]).hexdigest() != item['sha256']:
+            print(f"警告: 共有キャッシュから {item['path']} を取得できませんでした")
+            return None
+        _write_atomic(_object_path(item['sha256']), response[1])
+    _write_atomic(_entry_path(key), json.dumps(entry, ensure_ascii=False, indent=1).encode())
+    print(f"🌐 共有キャッシュから成果物を取得しました ({key[:12]})")
+    return entry
+
+
+def upload_entry(key):
+    """ローカルのエントリを共有キャッシュサーバーにアップロードする (サーバーに無いファイルのみ送る)"""
+    entry = load_entry(key)
+    if entry is None:
+        return False
+    for sha in sorted({item['sha256'] for item in entry['files'] if 'sha256' in item}):
+        response = _remote_request("HEAD", f"objects/{sha}")
+        if response is None:
+            return False
+        if response[0] == 200:
+            continue
+        with open(_object_path(sha), 'rb') as f:
+            response = _remote_request("PUT", f"objects/{sha}", f.read())
+        if response is None or response[0] not in (200, 201):
+            print("警告: 共有キャッシュへのアップロードに失敗しました")
+            return False
+    with open(_entry_path(key), 'rb') as f:
+        response = _remote_request("PUT", f"entries/{key}.json", f.read())
+    if response is None or response[0] not in (200, 201):
+        print("警告: 共有キャッシュへのアップロードに失敗しました")
+        return False
+    print(f"🌐 成果物を共有キャッシュにアップロードしました ({key[:12]})")
+    return True
+
+
+def prune_artifact_cache(max_mb=None, root=None):
+    """最近使われていないエントリから削除し、ファイルの合計を上限以下に保つ。削除したエントリ数を返す
+
+    複数のエントリが共有するファイルは、参照するエントリがすべて削除された時点で削除する。
+    参照されていないファイルでも PRUNE_GRACE_SECONDS 以内に書き込まれたものは、保存中のエントリの
+    ものである可能性があるため残す。
+    """
+    max_mb = ARTIFACT_CACHE_MAX_MB if max_mb is None else max_mb
+    root = root or ARTIFACT_CACHE_DIR
+    entries_dir = os.path.join(root, "entries")
+    if not os.path.isdir(entries_dir):
+        return 0
+    entries = []
+    for name in os.listdir(entries_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(entries_dir, name)
+        try:
+            with open(path, 'r') as f:
+                files = json.load(f)['files']
+            entries.append((os.path.getmtime(path), path, files))
+        except (OSError, ValueError, KeyError):
+            continue
+    entries.sort(key=lambda item: item[0], reverse=True)
+
+    limit = max_mb * 1024 * 1024
+    kept, total, removed = set(), 0, 0
+    for _, path, files in entries:
+        blobs = {item['sha256']: item['size'] for item in files if 'sha256' in item}
+        added = sum(size for sha, size in blobs.items() if sha not in kept)
+        if kept and total + added > limit:
+            os.remove(path)
+            removed += 1
+            continue
+        kept.update(blobs)
+        total += added
+
+    objects_dir = os.path.join(root, "objects")
+    cutoff = time.time() - PRUNE_GRACE_SECONDS
+    for dirpath, _, filenames in os.walk(objects_dir):
+        for name in filenames:
+            if name in kept:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+    return removed
+
+
+def maybe_prune_artifact_cache(max_mb=None, root=None):
+    """前回の削減から PRUNE_INTERVAL 秒以上経っていれば削減する"""
+    root = root or ARTIFACT_CACHE_DIR
+    stamp = os.path.join(root, ".last_prune")
+    try:
+        if time.time() - os.path.getmtime(stamp) < PRUNE_INTERVAL:
+            return 0
+    except OSError:
+        pass
+    os.makedirs(root, exist_ok=True)
+    with open(stamp, 'w'):
+        pass
+    return prune_artifact_cache(max_mb, root)
+
+
+class ArtifactCacheHandler(BaseHTTPRequestHandler):
+    """共有キャッシュサーバー (GET/HEAD/PUT で objects/ と entries/ を読み書きする)
+
+    PUT は ARTIFACT_CACHE_TOKEN が設定されていればトークンを確認し、大きさの上限と内容を検証してから保存する。
+    """
+    root = ARTIFACT_CACHE_DIR
+    max_mb = ARTIFACT_CACHE_MAX_MB
+    token = ARTIFACT_CACHE_TOKEN
+    max_upload_bytes = MAX_UPLOAD_MB * 1024 * 1024
+
+    def _resolve(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "objects" and _SHA256_RE.match(parts[1]):
+            return 'object', parts[1], _object_path(parts[1], self.root)
+        if len(parts) == 2 and parts[0] == "entries" and parts[1].endswith(".json") \
+                and _SHA256_RE.match(parts[1][:-5]):
+            return 'entry', parts[1][:-5], _entry_path(parts[1][:-5], self.root)
+        return None, None, None
+
+    def _send(self, status, body=b''):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        kind, _, path = self._resolve()
+        if kind is None or not os.path.isfile(path):
+            return self._send(404)
+        with open(path, 'rb') as f:
+            body = f.read()
+        if kind == 'entry':
+            os.utime(path)
+        self._send(200, body)
+
+    def do_HEAD(self):
+        kind, _, path = self._resolve()
+        self._send(200 if kind is not None and os.path.isfile(path) else 404)
+
+    def _receive_object(self, name, path, length):
+        """アップロードされたファイルを一時ファイルに書き出しながらハッシュを確認し、一致すれば保存する"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                while length > 0:
+                    chunk = self.rfile.read(min(length, 1024 * 1024))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    length -= len(chunk)
+            if length > 0 or digest.hexdigest() != name:
+                return False
+            os.replace(tmp_path, path)
+            return True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def do_PUT(self):
+        kind, name, path = self._resolve()
+        if kind is None:
+            return self._send(404)
+        if self.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.token}"):
+            return self._send(401)
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            return self._send(411)
+        if length < 0 or length > (self.max_upload_bytes if kind == 'object' else MAX_ENTRY_BYTES):
+            self.close_connection = True
+            return self._send(413)
+        if kind == 'object':
+            return self._send(201 if self._receive_object(name, path, length) else 400)
+
+        body = self.rfile.read(length)
+        try:
+            entry = json.loads(body)
+        except ValueError:
+            return self._send(400)
+        if validate_entry(entry, name):
+            return self._send(400)
+        missing = [item for item in entry['files']
+                   if 'sha256' in item and not os.path.exists(_object_path(item['sha256'], self.root))]
+        if missing:
+            return self._send(409)
+        _write_atomic(path, body)
+        maybe_prune_artifact_cache(self.max_mb, self.root)
+        self._send(201)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+
+def serve(port=DEFAULT_PORT, root=ARTIFACT_CACHE_DIR, max_mb=None):
+    """共有キャッシュサーバーを起動する (Ctrl+Cで終了)"""
+    ArtifactCacheHandler.root = root
+    ArtifactCacheHandler.max_mb = ARTIFACT_CACHE_MAX_MB if max_mb is None else max_mb
+    os.makedirs(root, exist_ok=True)
+    server = ThreadingHTTPServer(("", port), ArtifactCacheHandler)
+    print(f"🌐 成果物の共有キャッシュサーバーを起動しました: http://0.0.0.0:{port} ({root}, 上限 {ArtifactCacheHandler.max_mb}MB)")
+    print(f"   各マシンで ARTIFACT_CACHE_URL=http://<このマシン>:{port} を設定してください")
+    if not ArtifactCacheHandler.token:
+        print("   ⚠️ ARTIFACT_CACHE_TOKEN が未設定のため、接続できる誰でも書き込めます")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルド成果物のキャッシュ管理")
+    parser.add_argument('--serve', action='store_true', help='共有キャッシュサーバーを起動')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='--serve のポート番号')
+    parser.add_argument('--root', default=ARTIFACT_CACHE_DIR, help='--serve で使う保存先')
+    parser.add_argument('--prune', type=int, nargs='?', const=ARTIFACT_CACHE_MAX_MB, metavar='MB',
+                        help='キャッシュを上限 (MB) 以下に削減')
+    parser.add_argument('--key', nargs=2, metavar=('PLATFORM', 'MODE'), help='現在の入力に対するキーを表示')
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.port, args.root)
+    if args.prune is not None:
+        print(f"✅ {prune_artifact_cache(args.prune)}件のエントリを削除しました")
+        return 0
+    if args.key:
+        print(artifact_key(*args.key))
+        return 0
+
+    entries_dir = os.path.join(ARTIFACT_CACHE_DIR, "entries")
+    names = sorted(os.listdir(entries_dir)) if os.path.isdir(entries_dir) else []
+    for name in names:
+        entry = load_entry(name[:-5])
+        if entry is None:
+            continue
+        size_mb = sum(item.get('size', 0) for item in entry['files']) / (1024 * 1024)
+        age = int(time.time() - os.path.getmtime(_entry_path(name[:-5])))
+        label = " ".join(str(value) for value in entry['meta'].values())
+        print(f"{name[:12]} | {label:<32} | {size_mb:>8.1f}MB | {age:>8}秒前")
+    print(f"\n{len(names)}件 / 上限 {ARTIFACT_CACHE_MAX_MB}MB"
+          + (f" / 共有サーバー {ARTIFACT_CACHE_URL}" if ARTIFACT_CACHE_URL else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from command_runner import run_command, enable_fake_toolchain
+from probe_cache import CACHE_DIR
+
+# AVD の config.ini を解析した結果のキャッシュ (config.ini の更新日時・サイズが変わったものだけ読み直す)
+AVD_INDEX_FILE = os.path.join(CACHE_DIR, "avd_index.json")
+AVD_INDEX_VERSION = 2
+
+# APIレベルとAndroidバージョンの対応
+API_TO_VERSION = {
+    '36': '16.0', '35': '15.0', '34': '14.0', '33': '13.0', '32': '12.1', '31': '12.0',
+    '30': '11.0', '29': '10.0', '28': '9.0', '27': '8.1', '26': '8.0', '25': '7.1',
+    '24': '7.0', '23': '6.0', '22': '5.1',
+}
+
+# エミュレータのプロセスの引数から AVD 名を取り出す (-avd <名前> または @<名前>)
+_AVD_ARG_RE = re.compile(r'(?:^|\s)(?:-avd\s+|@)(\S+)')
+_API_RE = re.compile(r'android-(\d+)')
+
+
+def avd_home():
+    """AVD の保存先 (emulator コマンドと同じ順に環境変数を確認する)"""
+    if os.environ.get('ANDROID_AVD_HOME'):
+        return os.environ['ANDROID_AVD_HOME']
+    if os.environ.get('ANDROID_USER_HOME'):
+        return os.path.join(os.environ['ANDROID_USER_HOME'], "avd")
+    if os.environ.get('ANDROID_SDK_HOME'):
+        return os.path.join(os.environ['ANDROID_SDK_HOME'], ".android", "avd")
+    return os.path.expanduser("~/.android/avd")
+
+
+def avd_dir(name, home=None):
+    """AVD のディレクトリ
+
+    emulator コマンドと同じく <名前>.ini の path= (無ければ path.rel=) を使う。
+    ini が無い場合や参照先が存在しない場合は <保存先>/<名前>.avd を返す。
+    """
+    home = home or avd_home()
+    ini = {}
+    try:
+        with open(os.path.join(home, f"{name}.ini"), 'r', errors='replace') as f:
+            for line in f:
+                key, sep, value = line.partition('=')
+                if sep:
+                    ini[key.strip()] = value.strip()
+    except OSError:
+        pass
+    candidates = []
+    if ini.get('path'):
+        candidates.append(os.path.expanduser(ini['path']))
+    if ini.get('path.rel'):
+        # path.rel は Android のユーザーディレクトリ (AVD の保存先の親) からの相対パス
+        candidates.append(os.path.join(os.path.dirname(os.path.abspath(home)), ini['path.rel']))
+    for path in candidates:
+        if os.path.isdir(path):
+            return path
+    return os.path.join(home, f"{name}.avd")
+
+
+def list_avd_names():
+    """AVD 名の一覧。AVD の保存先の <名前>.ini から取得し、見つからない場合は emulator -list-avds を実行する"""
+    home = avd_home()
+    try:
+        names = sorted(entry[:-4] for entry in os.listdir(home)
+                       if entry.endswith(".ini") and os.path.isdir(avd_dir(entry[:-4], home)))
+    except OSError:
+        names = []
+    if names:
+        return names
+    success, output = run_command("emulator -list-avds", show_output=False)
+    if not success or not output:
+        return None
+    if isinstance(output, bytes):
+        output = output.decode('utf-8')
+    return [line.strip() for line in output.strip().split('\n') if line.strip() and not line.startswith("INFO")]
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def parse_avd_config(path):
+    """config.ini から一覧表示に使う情報を取り出す"""
+    config = {}
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            key, sep, value = line.partition('=')
+            if sep:
+                config[key.strip()] = value.strip()
+    api_match = _API_RE.search(config.get('target', '') or config.get('image.sysdir.1', ''))
+    api_level = api_match.group(1) if api_match else "不明"
+    ram = config.get('hw.ramSize', '')
+    return {
+        'api_level': api_level,
+        'android_version': API_TO_VERSION.get(api_level, f"API {api_level}"),
+        'abi': config.get('abi.type', "不明"),
+        'device': config.get('hw.device.name', "不明"),
+        'ram_mb': int(ram.rstrip('MmBb')) if ram.rstrip('MmBb').isdigit() else None,
+    }
+
+
+def _load_index():
+    try:
+        with open(AVD_INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        return index['entries'] if index.get('version') == AVD_INDEX_VERSION else {}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _save_index(entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{AVD_INDEX_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': AVD_INDEX_VERSION, 'entries': entries}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, AVD_INDEX_FILE)
+
+
+def load_avd_configs(names):
+    """AVD ごとの設定 ({名前: 情報}) を返す
+
+    config.ini とスナップショットのディレクトリの更新日時が前回と同じ AVD はキャッシュを使い、
+    変わったものだけ config.ini を読み直す。キャッシュは AVD のディレクトリ (ini の path=) ごとに持つ。
+    """
+    home = avd_home()
+    entries = _load_index()
+    configs, changed, seen = {}, False, set()
+    for name in names:
+        directory = avd_dir(name, home)
+        seen.add(directory)
+        config_path = os.path.join(directory, "config.ini")
+        snapshot_dir = os.path.join(directory, "snapshots", "default_boot")
+        key = [_stat_key(config_path), _stat_key(snapshot_dir)]
+        entry = entries.get(directory)
+        if entry is None or entry['key'] != key:
+            info = {'api_level': "不明", 'android_version': "不明", 'abi': "不明", 'device': "不明", 'ram_mb': None}
+            if key[0] is not None:
+                try:
+                    info = parse_avd_config(config_path)
+                except OSError as e:
+                    print(f"  ⚠️ エミュレータ情報の読み取りエラー ({name}): {e}")
+            info['snapshot'] = key[1] is not None
+            entry = {'key': key, 'info': info}
+            entries[directory] = entry
+            changed = True
+        configs[name] = dict(entry['info'])
+    stale = set(entries) - seen
+    for directory in stale:
+        del entries[directory]
+    if changed or stale:
+        _save_index(entries)
+    return configs
+
+
+def running_avds(names):
+    """プロセスの一覧を1回だけ取得し、実行中のエミュレータの AVD 名の集合を返す"""
+    if platform.system() == "Windows":
+        command = ["wmic", "process", "where", "name like '%qemu%' or name like 'emulator%'", "get", "CommandLine"]
+    else:
+        command = ["ps", "-eo", "args="]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return set()
+    wanted = set(names)
+    running = set()
+    for line in output.splitlines():
+        if "qemu" not in line and "emulator" not in line:
+            continue
+        for match in _AVD_ARG_RE.finditer(line):
+            if match.group(1) in wanted:
+                running.add(match.group(1))
+    return running
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AVD の設定の一覧 (キャッシュした config.ini の解析結果)")
+    parser.add_argument('--json', action='store_true', help='JSONで出力')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    start = time.perf_counter()
+    names = list_avd_names() or []
+    configs = load_avd_configs(names)
+    running = running_avds(names)
+    elapsed = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps({name: dict(configs[name], running=name in running) for name in names},
+                         ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'名前':<28} | {'API':<5} | {'ABI':<12} | {'デバイス':<14} | {'RAM':>6} | {'スナップショット':<8} | 状態")
+    print("-" * 100)
+    for name in names:
+        info = configs[name]
+        ram = f"{info['ram_mb']}MB" if info['ram_mb'] else "-"
+        print(f"{name:<28} | {info['api_level']:<5} | {info['abi']:<12} | {info['device']:<14} | {ram:>6} | "
+              f"{'あり' if info['snapshot'] else 'なし':<8} | {'実行中' if name in running else '停止中'}")
+    print(f"\n{len(names)}件 ({elapsed:.1f}ms, {AVD_INDEX_FILE})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
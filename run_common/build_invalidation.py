@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+
+from command_runner import run_command, PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR, cached_probe
+from pubspec_lock import parse_pubspec_lock
+from gradle_tuning import strip_managed_block
+
+# 前回ビルド成功時のフィンガープリントの保存先
+STATE_DIR = os.path.join(CACHE_DIR, "invalidation")
+
+# クリーンの段階
+CLEAN_NONE = "none"          # インクリメンタルビルド (何も削除しない)
+CLEAN_PLATFORM = "platform"  # プラットフォームのビルド成果物とプラグイン連携のみ削除
+CLEAN_FULL = "full"          # flutter clean を含む完全なクリーン
+
+# プラットフォームディレクトリの中で、ビルドやツールが生成するためフィンガープリントから除外するもの
+GENERATED_NAMES = {
+    "Pods", ".symlinks", "ephemeral", "build", ".gradle", ".cxx", "DerivedData", "xcuserdata",
+    "Podfile.lock", "Generated.xcconfig", "flutter_export_environment.sh", "local.properties",
+    "GeneratedPluginRegistrant.h", "GeneratedPluginRegistrant.m", "GeneratedPluginRegistrant.java",
+    "GeneratedPluginRegistrant.swift",
+}
+GENERATED_SUFFIXES = (".bak", ".original", ".fullbackup", ".tmp")
+
+# プラグイン構成が変わった場合に削除するもの (プラットフォームごと)
+PLATFORM_CLEAN_PATHS = {
+    'ios': ["ios/Pods", "ios/.symlinks", "ios/Flutter/Flutter.podspec", "ios/Flutter/ephemeral",
+            "build/ios/Debug-iphoneos", "build/ios/Release-iphoneos",
+            "build/ios/iphonesimulator", "build/ios/iphoneos"],
+    'android': ["build/app/intermediates/flutter", "build/app/generated"],
+    'web': ["build/web"],
+}
+# 完全なクリーン時に追加で削除するもの (flutter clean の対象外のもの)
+FULL_CLEAN_PATHS = {
+    'ios': [".dart_tool/flutter_build"],
+    'android': [".dart_tool/flutter_build"],
+    'web': [".dart_tool/flutter_build"],
+}
+# flutter clean の間も退避して残すもの (Gradle のプロジェクト単位のキャッシュは再構成に時間がかかる)
+PRESERVE_PATHS = ["android/.gradle"]
+
+
+def _is_generated(name):
+    return name in GENERATED_NAMES or name.endswith(GENERATED_SUFFIXES)
+
+
+def content_digest(root):
+    """ディレクトリ内のファイル内容のハッシュ (生成物は除外)"""
+    digest = hashlib.sha256()
+    if not os.path.isdir(root):
+        return None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not _is_generated(d))
+        for name in sorted(filenames):
+            if _is_generated(name):
+                continue
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).encode() + b'\0')
+            try:
+                if name == "gradle.properties":
+                    # gradle_tuning.py が書き込む管理範囲の変更ではクリーンしない (利用者の設定は対象)
+                    with open(path, 'r', errors='replace') as f:
+                        digest.update(strip_managed_block(f.read()).encode())
+                    continue
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+
+def _stat_digest(root):
+    """ディレクトリ内のファイルのパス・サイズ・更新日時のハッシュ (ソースの変更検出用)"""
+    digest = hashlib.sha256()
+    if not os.path.isdir(root):
+        return None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, root)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def toolchain_version(platform_name):
+    """ツールチェーンのバージョン文字列 (変わった場合は完全なクリーンが必要)"""
+    versions = []
+    flutter = cached_probe("flutter --version")
+    versions.append(flutter.stdout.splitlines()[0] if flutter.returncode == 0 and flutter.stdout else "flutter:unknown")
+    if platform_name == 'ios':
+        xcode = cached_probe("xcodebuild -version")
+        versions.append(" ".join(xcode.stdout.split()) if xcode.returncode == 0 else "xcode:unknown")
+    return " | ".join(versions)
+
+
+def plugin_set():
+    """pubspec.lock に記録された依存パッケージとバージョンの一覧"""
+    lock_path = os.path.join(PROJECT_ROOT, "pubspec.lock")
+    if not os.path.exists(lock_path):
+        return None
+    packages = parse_pubspec_lock(lock_path)
+    return sorted(f"{name}@{info.get('version', '')}" for name, info in packages.items())
+
+
+def compute_fingerprint(platform_name):
+    """lib/・assets/・pubspec・プラットフォームディレクトリ・ツールチェーンのフィンガープリント"""
+    plugins = plugin_set()
+    return {
+        'toolchain': toolchain_version(platform_name),
+        'plugins': hashlib.sha256("\n".join(plugins).encode()).hexdigest() if plugins is not None else None,
+        'pubspec': file_digest(os.path.join(PROJECT_ROOT, "pubspec.yaml")),
+        'platform': content_digest(os.path.join(PROJECT_ROOT, platform_name)),
+        'lib': _stat_digest(os.path.join(PROJECT_ROOT, "lib")),
+        'assets': _stat_digest(os.path.join(PROJECT_ROOT, "assets")),
+    }
+
+
+def _state_path(platform_name):
+    return os.path.join(STATE_DIR, f"{platform_name}.json")
+
+
+def load_state(platform_name):
+    try:
+        with open(_state_path(platform_name), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def plan_clean(platform_name, force=False):
+    """前回ビルド成功時からの変化をもとに、必要最小限のクリーンの段階を決める
+
+    戻り値は {'level', 'reasons', 'fingerprint'}。ツールチェーンの変更は完全なクリーン、
+    プラグイン構成やプラットフォームディレクトリの変更はプラットフォーム単位のクリーン、
+    lib/・assets/ の変更はインクリメンタルビルドで対応する。
+    """
+    fingerprint = compute_fingerprint(platform_name)
+    previous = load_state(platform_name)
+
+    if force:
+        return {'level': CLEAN_FULL, 'reasons': ["クリーンビルドが指定されました"], 'fingerprint': fingerprint}
+    if previous is None:
+        return {'level': CLEAN_FULL, 'reasons': ["前回のビルド情報がありません"], 'fingerprint': fingerprint}
+
+    reasons = []
+    level = CLEAN_NONE
+    if previous.get('toolchain') != fingerprint['toolchain']:
+        reasons.append(f"ツールチェーンが変更されました ({previous.get('toolchain')} → {fingerprint['toolchain']})")
+        level = CLEAN_FULL
+    if previous.get('plugins') != fingerprint['plugins']:
+        reasons.append("プラグイン構成 (pubspec.lock) が変更されました")
+        level = CLEAN_FULL if level == CLEAN_FULL else CLEAN_PLATFORM
+    if previous.get('platform') != fingerprint['platform']:
+        reasons.append(f"{platform_name}/ ディレクトリが変更されました")
+        level = CLEAN_FULL if level == CLEAN_FULL else CLEAN_PLATFORM
+    for key, label in (('pubspec', "pubspec.yaml"), ('lib', "lib/"), ('assets', "assets/")):
+        if previous.get(key) != fingerprint[key]:
+            reasons.append(f"{label} が変更されました (インクリメンタルビルドで対応)")
+    return {'level': level, 'reasons': reasons, 'fingerprint': fingerprint}
+
+
+def _remove_path(relative):
+    path = os.path.join(PROJECT_ROOT, relative)
+    if not os.path.lexists(path):
+        return
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        print(f"削除: {relative}")
+    except Exception as e:
+        print(f"警告: {relative} の削除に失敗しました - {e}")
+
+
+def _stash_paths(relatives):
+    """指定したパスをキャッシュディレクトリに退避する。退避した (元のパス, 退避先) の一覧を返す"""
+    stashed = []
+    for relative in relatives:
+        source = os.path.join(PROJECT_ROOT, relative)
+        if not os.path.isdir(source):
+            continue
+        destination = os.path.join(CACHE_DIR, "preserve", relative)
+        shutil.rmtree(destination, ignore_errors=True)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(source, destination)
+            stashed.append((source, destination))
+        except OSError:
+            pass
+    return stashed
+
+
+def _unstash_paths(stashed):
+    for source, destination in stashed:
+        if os.path.exists(source):
+            shutil.rmtree(destination, ignore_errors=True)
+        else:
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            os.replace(destination, source)
+
+
+def apply_clean(plan, platform_name, show_progress=True):
+    """plan_clean の結果に従ってクリーンを実行する"""
+    level = plan['level']
+    for reason in plan['reasons']:
+        print(f"  - {reason}")
+    if level == CLEAN_NONE:
+        print("✅ キャッシュは有効です。インクリメンタルビルドを行います")
+        return True
+
+    if level == CLEAN_FULL:
+        print("🧹 完全なクリーンを実行します")
+        preserved = _stash_paths(PRESERVE_PATHS)
+        clean_success, _ = run_command("flutter clean", "Flutterプロジェクトをクリーン", show_progress=show_progress)
+        _unstash_paths(preserved)
+        if not clean_success:
+            print("警告: クリーンに失敗しましたが、ビルドを続行します")
+        for relative in FULL_CLEAN_PATHS.get(platform_name, []):
+            _remove_path(relative)
+    else:
+        print(f"🧹 {platform_name} のビルド成果物とプラグイン連携のみをクリーンします")
+    for relative in PLATFORM_CLEAN_PATHS.get(platform_name, []):
+        _remove_path(relative)
+    return True
+
+
+def mark_built(platform_name, fingerprint=None):
+    """ビルド成功時のフィンガープリントを保存する (ビルド中に変わった分を反映するため再計算する)"""
+    fingerprint = fingerprint or compute_fingerprint(platform_name)
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(_state_path(platform_name), 'w') as f:
+        json.dump(fingerprint, f, ensure_ascii=False, indent=1)
+
+
+def invalidate(platform_name=None):
+    """保存済みのフィンガープリントを削除し、次回のビルドを完全なクリーンにする"""
+    if not os.path.isdir(STATE_DIR):
+        return
+    for filename in os.listdir(STATE_DIR):
+        if platform_name is None or filename == f"{platform_name}.json":
+            os.remove(os.path.join(STATE_DIR, filename))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インクリメンタルビルドの無効化判定")
+    parser.add_argument('platform', choices=['ios', 'android', 'web'], help='対象プラットフォーム')
+    parser.add_argument('--reset', action='store_true', help='保存済みの情報を削除して次回を完全なクリーンにする')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.reset:
+        invalidate(args.platform)
+        print(f"✅ {args.platform} のビルド情報を削除しました")
+        return 0
+    plan = plan_clean(args.platform)
+    print(f"クリーンの段階: {plan['level']}")
+    for reason in plan['reasons']:
+        print(f"  - {reason}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
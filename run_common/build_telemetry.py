@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+
+from command_runner import add_metrics_listener, PROJECT_ROOT
+from build_invalidation import compute_fingerprint
+
+# ビルドの記録の保存先。環境変数 BUILD_TELEMETRY_DB で変更できる
+TELEMETRY_DB = os.environ.get("BUILD_TELEMETRY_DB") or os.path.join(PROJECT_ROOT, "output", "build_telemetry.sqlite3")
+# 環境変数 NO_BUILD_TELEMETRY=1 で記録を無効化する
+TELEMETRY_ENABLED = os.environ.get("NO_BUILD_TELEMETRY", "") not in ("1", "true", "yes")
+
+# 遅くなったと判定する割合 (%)、基準にする直近の成功回数、判定に必要な最小回数
+DEFAULT_THRESHOLD = 20
+DEFAULT_WINDOW = 10
+MIN_BASELINE_SAMPLES = 3
+# 短いステップの揺らぎを無視するため、この秒数以上遅くなった場合のみ判定する
+MIN_REGRESSION_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    script TEXT NOT NULL,
+    platform TEXT,
+    host TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    step TEXT NOT NULL,
+    command TEXT,
+    fingerprint TEXT,
+    duration REAL,
+    returncode INTEGER,
+    success INTEGER,
+    cache TEXT,
+    user_cpu REAL,
+    sys_cpu REAL,
+    max_rss_kb INTEGER,
+    failure TEXT
+);
+CREATE INDEX IF NOT EXISTS steps_by_step ON steps (script, step, started_at);
+"""
+
+# 記録中のセッション (start_telemetry で設定)
+_session = None
+_lock = threading.Lock()
+
+
+def _connect(path=None):
+    path = path or TELEMETRY_DB
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _insert(row):
+    with _lock:
+        try:
+            connection = _connect()
+            with connection:
+                columns = ", ".join(row)
+                connection.execute(f"INSERT INTO steps ({columns}) VALUES ({', '.join('?' * len(row))})",
+                                   list(row.values()))
+            connection.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ ビルドの記録に失敗しました: {e}")
+
+
+def _base_row(kind, step):
+    return {
+        'session': _session['id'],
+        'script': _session['script'],
+        'platform': _session['platform'],
+        'host': _session['host'],
+        'started_at': time.time(),
+        'kind': kind,
+        'step': step,
+        'fingerprint': _session['fingerprint'],
+    }
+
+
+def _record_command(record):
+    """command_runner の記録をデータベースに追加する"""
+    if _session is None:
+        return
+    row = _base_row('command', record['description'] or record['command'])
+    row['started_at'] -= record['wall'] or 0
+    row.update({
+        'command': record['command'],
+        'duration': record['wall'],
+        'returncode': record['returncode'],
+        'success': int(bool(record['success'])),
+        'user_cpu': record['user_cpu'],
+        'sys_cpu': record['sys_cpu'],
+        'max_rss_kb': record['max_rss_kb'],
+        'failure': record['failure'] or ("timeout" if record['timed_out'] else None),
+    })
+    _insert(row)
+
+
+def start_telemetry(script, platform_name=None):
+    """このプロセスで実行するステップの記録を開始する
+
+    入力のフィンガープリントは platform_name の lib/・assets/・pubspec・プラットフォームディレクトリ・
+    ツールチェーンから作成し、同じ入力での実行どうしを比較できるようにする。
+    """
+    global _session
+    if not TELEMETRY_ENABLED:
+        return None
+    fingerprint = None
+    if platform_name:
+        inputs = compute_fingerprint(platform_name)
+        fingerprint = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:16]
+    _session = {'id': uuid.uuid4().hex, 'script': script, 'platform': platform_name,
+                'host': socket.gethostname(), 'fingerprint': fingerprint}
+    add_metrics_listener(_record_command)
+    return _session['id']
+
+
+def record_cache_event(step, hit, fingerprint=None, duration=0.0):
+    """キャッシュの利用結果 (ヒット・ミス) を記録する"""
+    if _session is None:
+        return
+    row = _base_row('cache', step)
+    row.update({'cache': "hit" if hit else "miss", 'duration': duration, 'success': 1})
+    if fingerprint:
+        row['fingerprint'] = fingerprint
+    _insert(row)
+
+
+def record_probe_event(step, ready, duration):
+    """準備完了の待ち時間 (readiness.py) を記録する。タイムアウトした場合は失敗として記録する"""
+    if _session is None:
+        return
+    row = _base_row('probe', step)
+    row['started_at'] -= duration
+    row.update({'duration': duration, 'success': int(bool(ready)), 'failure': None if ready else "timeout"})
+    _insert(row)
+
+
+def percentile(values, fraction):
+    """最近傍順位法による百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _bucket(timestamp, bucket):
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    if bucket == "day":
+        return moment.strftime("%m/%d")
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def find_regressions(durations, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW):
+    """成功した実行時間の列 (古い順) の最新値が、直近 window 回の中央値より threshold% 以上遅ければ
+    (最新値, 基準値) を返す。それ以外はNone"""
+    if len(durations) < MIN_BASELINE_SAMPLES + 1:
+        return None
+    latest = durations[-1]
+    baseline = percentile(durations[-window - 1:-1], 0.5)
+    if latest > baseline * (1 + threshold / 100) and latest - baseline >= MIN_REGRESSION_SECONDS:
+        return latest, baseline
+    return None
+
+
+def build_report(days=30, script=None, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW, bucket="week",
+                 path=None):
+    """ステップごとの集計を作成する (一覧と、遅くなったステップの一覧を返す)"""
+    if not os.path.exists(path or TELEMETRY_DB):
+        return [], []
+    connection = _connect(path)
+    query = "SELECT script, step, kind, started_at, duration, success, cache FROM steps WHERE started_at >= ?"
+    params = [time.time() - days * 86400]
+    if script:
+        query += " AND script = ?"
+        params.append(script)
+    rows = connection.execute(query + " ORDER BY started_at", params).fetchall()
+    connection.close()
+
+    groups = {}
+    for script_name, step, kind, started_at, duration, success, cache in rows:
+        group = groups.setdefault((script_name, step), {'runs': [], 'failures': 0, 'hits': 0, 'lookups': 0})
+        if kind == 'cache':
+            group['lookups'] += 1
+            group['hits'] += cache == "hit"
+        elif success:
+            group['runs'].append((started_at, duration))
+        else:
+            group['failures'] += 1
+
+    report, regressions = [], []
+    for (script_name, step), group in sorted(groups.items()):
+        durations = [duration for _, duration in group['runs']]
+        trend = {}
+        for started_at, duration in group['runs']:
+            trend.setdefault(_bucket(started_at, bucket), []).append(duration)
+        entry = {
+            'script': script_name,
+            'step': step,
+            'runs': len(durations),
+            'failures': group['failures'],
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'last': durations[-1] if durations else None,
+            'trend': [(label, percentile(values, 0.5)) for label, values in list(trend.items())[-4:]],
+            'hit_rate': group['hits'] / group['lookups'] if group['lookups'] else None,
+        }
+        regression = find_regressions(durations, threshold, window)
+        if regression:
+            entry['regression'] = regression
+            regressions.append(entry)
+        report.append(entry)
+    return report, regressions
+
+
+def _seconds(value):
+    return f"{value:.1f}s" if value is not None else "-"
+
+
+def print_report(report, regressions, threshold=DEFAULT_THRESHOLD):
+    """集計を表形式で表示する"""
+    if not report:
+        print("記録がありません")
+        return
+    print(f"{'スクリプト':<16} {'ステップ':<32} | {'回数':>4} | {'失敗':>4} | {'p50':>7} | {'p95':>7} | "
+          f"{'最新':>7} | {'ヒット率':>6} | 推移 (p50)")
+    print("-" * 130)
+    for entry in report:
+        step = entry['step'] if len(entry['step']) <= 32 else entry['step'][:31] + "…"
+        hit_rate = f"{entry['hit_rate']:.0%}" if entry['hit_rate'] is not None else "-"
+        trend = " → ".join(f"{label} {value:.1f}s" for label, value in entry['trend'])
+        mark = " ⚠️" if 'regression' in entry else ""
+        print(f"{entry['script']:<16} {step:<32} | {entry['runs']:>4} | {entry['failures']:>4} | "
+              f"{_seconds(entry['p50']):>7} | {_seconds(entry['p95']):>7} | {_seconds(entry['last']):>7} | "
+              f"{hit_rate:>6} | {trend}{mark}")
+    if regressions:
+        print(f"\n⚠️ 直近の基準より{threshold}%以上遅くなったステップ:")
+        for entry in regressions:
+            latest, baseline = entry['regression']
+            # 基準が0秒 (キャッシュで省略された実行など) の場合は割合を出せないため、増えた秒数を表示する
+            change = f"+{(latest / baseline - 1) * 100:.0f}%" if baseline > 0 else f"+{latest - baseline:.1f}s"
+            print(f"  {entry['script']} / {entry['step']}: {baseline:.1f}s → {latest:.1f}s ({change})")
+    else:
+        print("\n✅ 遅くなったステップはありません")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルドの記録の集計と、遅くなったステップの検出")
+    parser.add_argument('command', nargs='?', default="report", choices=["report", "clear"],
+                        help='report: 集計を表示 / clear: 記録を削除')
+    parser.add_argument('--days', type=int, default=30, help='集計する期間 (日)')
+    parser.add_argument('--script', help='対象のスクリプト (android_build, ios_build など)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='遅くなったと判定する割合 (%%)')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='基準にする直近の成功回数')
+    parser.add_argument('--bucket', choices=["day", "week"], default="week", help='推移の集計単位')
+    parser.add_argument('--json', action='store_true', help='集計をJSONで出力')
+    parser.add_argument('--fail-on-regression', action='store_true', help='遅くなったステップがあれば終了コード1')
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TELEMETRY_DB + suffix):
+                os.remove(TELEMETRY_DB + suffix)
+        print("✅ ビルドの記録を削除しました")
+        return 0
+
+    report, regressions = build_report(args.days, args.script, args.threshold, args.window, args.bucket)
+    if args.json:
+        print(json.dumps({'steps': report, 'regressions': [entry['step'] for entry in regressions]},
+                         ensure_ascii=False, indent=1))
+    else:
+        print(f"ビルドの記録: {TELEMETRY_DB} (直近{args.days}日)\n")
+        print_report(report, regressions, args.threshold)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
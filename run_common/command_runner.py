@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import signal
+import datetime
+import platform
+import selectors
+import threading
+import subprocess
+from collections import deque
+
+from failure_signatures import FailureMatcher
+
+# プログレス表示に使う記号
+PROGRESS_SYMBOLS = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
+# プログレス表示の更新間隔 (秒)
+PROGRESS_INTERVAL = 0.1
+# 強制終了時の正常終了猶予 (秒)
+KILL_GRACE_PERIOD = 2
+
+# プロジェクトのルートディレクトリ
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# ビルドログの保存先
+LOG_DIR = os.path.join(PROJECT_ROOT, "output", "logs")
+# ログ保存時にメモリに保持する末尾の行数
+TAIL_LINES = 200
+# ログの圧縮レベル (速度優先)
+LOG_COMPRESSLEVEL = 3
+# コマンドごとのリソース使用量の記録ファイル名
+METRICS_FILENAME = "command_metrics.jsonl"
+
+# 簡易版の flutter / adb / emulator / pod / xcrun (fake_toolchain.py)
+FAKE_BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_bin")
+# 環境変数 FAKE_TOOLCHAIN=1 で、ツールを簡易版に置き換える (enable_fake_toolchainを参照)
+FAKE_TOOLCHAIN_ENABLED = os.environ.get("FAKE_TOOLCHAIN", "") in ("1", "true", "yes")
+
+# リソース使用量の記録先 (configure_metricsで設定)
+_metrics_path = None
+_metrics_lock = threading.Lock()
+# このプロセス内で実行したコマンドの記録
+session_metrics = []
+# 記録のたびに呼び出す関数 (ビルドの記録用データベースなど)
+_metrics_listeners = []
+
+
+def enable_fake_toolchain(force=False):
+    """FAKE_TOOLCHAIN=1 (または force=True) の場合、このプロセスと子プロセスが使うツールを簡易版に置き換える
+
+    PATHの先頭に簡易版のディレクトリを追加する。各エントリーポイントのmainから呼び出す。
+    置き換えた場合はTrueを返す。
+    """
+    if not (force or FAKE_TOOLCHAIN_ENABLED):
+        return False
+    if FAKE_BIN_DIR not in os.environ.get("PATH", "").split(os.pathsep):
+        os.environ["PATH"] = FAKE_BIN_DIR + os.pathsep + os.environ.get("PATH", "")
+        print(f"🧪 簡易版のツールチェーンを使用します ({FAKE_BIN_DIR})")
+    return True
+
+
+class _StreamReader:
+    """パイプから読み込んだバイト列を行単位に分割して保持する
+
+    sink が指定された場合は全行をsinkに書き出し、メモリには末尾 tail_lines 行のみ保持する。
+    """
+
+    def __init__(self, name, echo, sink=None, tail_lines=None, matcher=None):
+        self.name = name
+        self.echo = echo
+        self.sink = sink
+        self.matcher = matcher
+        self.lines = deque(maxlen=tail_lines) if sink is not None else []
+        self.line_count = 0
+        self._partial = b''
+
+    def feed(self, data):
+        """読み込んだデータを追加し、完成した行を処理する"""
+        data = self._partial + data
+        *complete, self._partial = data.split(b'\n')
+        for raw in complete:
+            self._add_line(raw + b'\n')
+
+    def close(self):
+        """残りの改行なしデータを最終行として処理する"""
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = b''
+
+    def _add_line(self, raw):
+        if self.sink is not None:
+            self.sink.write(raw)
+        line = raw.decode('utf-8', errors='replace')
+        self.lines.append(line)
+        self.line_count += 1
+        if self.echo:
+            print(line, end='', flush=True)
+        if self.matcher is not None:
+            self.matcher.check(line)
+
+    def text(self):
+        return ''.join(self.lines)
+
+
+def build_log_path(log_name):
+    """ログ名からタイムスタンプ付きの圧縮ログファイルのパスを作成する"""
+    safe_name = re.sub(r'[^\w.-]+', '_', log_name).strip('_') or "command"
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(LOG_DIR, f"{safe_name}_{timestamp}.log.gz")
+
+
+def configure_metrics(output_dir):
+    """コマンドごとのリソース使用量の記録先 (output/<platform> など) を設定する"""
+    global _metrics_path
+    os.makedirs(output_dir, exist_ok=True)
+    _metrics_path = os.path.join(output_dir, METRICS_FILENAME)
+    return _metrics_path
+
+
+def _usage_to_dict(usage, wall):
+    """rusageを記録用の辞書に変換する (ru_maxrssはKB単位に揃える)"""
+    metrics = {'wall': round(wall, 3), 'user_cpu': None, 'sys_cpu': None, 'max_rss_kb': None}
+    if usage is not None:
+        # macOSのru_maxrssはバイト単位、Linuxはキロバイト単位
+        max_rss = usage.ru_maxrss // 1024 if platform.system() == "Darwin" else usage.ru_maxrss
+        metrics.update({
+            'user_cpu': round(usage.ru_utime, 3),
+            'sys_cpu': round(usage.ru_stime, 3),
+            'max_rss_kb': max_rss,
+        })
+    return metrics
+
+
+def record_command_metrics(result, description=None):
+    """実行結果のリソース使用量をJSON Linesとして追記し、セッション内の記録にも残す"""
+    record = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'description': description or "",
+        'command': result['command'],
+        'returncode': result['returncode'],
+        'success': result['returncode'] == 0,
+        'timed_out': result['timed_out'],
+        'failure': result['failure']['id'] if result['failure'] else None,
+    }
+    record.update(result['usage'])
+    with _metrics_lock:
+        session_metrics.append(record)
+        if _metrics_path:
+            try:
+                with open(_metrics_path, 'a') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️ リソース使用量の記録に失敗しました: {e}")
+    for listener in list(_metrics_listeners):
+        try:
+            listener(record)
+        except Exception as e:
+            print(f"⚠️ リソース使用量の記録に失敗しました: {e}")
+    return record
+
+
+def add_metrics_listener(listener):
+    """コマンドの記録のたびに listener(record) を呼び出すよう登録する"""
+    if listener not in _metrics_listeners:
+        _metrics_listeners.append(listener)
+
+
+def metrics_checkpoint():
+    """現時点までの記録件数を返す (print_command_metricsのsinceに渡す)"""
+    return len(session_metrics)
+
+
+def print_command_metrics(since=0):
+    """セッション内で実行したコマンドのリソース使用量を表形式で表示する"""
+    records = session_metrics[since:]
+    if not records:
+        return
+    print("\n===== コマンド別リソース使用量 =====")
+    print(f"{'ステップ':<30} | {'実時間':>8} | {'user':>8} | {'sys':>8} | {'最大RSS':>10}")
+    print("-" * 78)
+    for record in records:
+        name = record['description'] or record['command']
+        name = name if len(name) <= 30 else name[:29] + "…"
+        user = f"{record['user_cpu']:.1f}s" if record['user_cpu'] is not None else "-"
+        system = f"{record['sys_cpu']:.1f}s" if record['sys_cpu'] is not None else "-"
+        rss = f"{record['max_rss_kb'] / 1024:.0f} MB" if record['max_rss_kb'] is not None else "-"
+        print(f"{name:<30} | {record['wall']:>7.1f}s | {user:>8} | {system:>8} | {rss:>10}")
+
+
+def _clear_progress_line():
+    print("\r                                        ", end='\r')  # プログレス行をクリア
+
+
+def _reap(process, timeout=None):
+    """子プロセスを回収して終了コードを設定し、os.wait4のリソース使用量を返す
+
+    子プロセスが待機済みの子孫プロセスの使用量も含まれる。wait4が使えない環境ではNoneを返す。
+    """
+    if process.returncode is not None:
+        return None
+    if not hasattr(os, 'wait4'):
+        process.wait(timeout)
+        return None
+
+    deadline = time.time() + timeout if timeout is not None else None
+    while True:
+        try:
+            pid, status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+        except ChildProcessError:
+            process.wait()
+            return None
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if time.time() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(0.05)
+
+
+def _terminate(process, new_session):
+    """プロセス (新しいセッションの場合はプロセスグループごと) を終了させ、リソース使用量を返す"""
+    if os.name == 'nt':
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(KILL_GRACE_PERIOD)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return None
+
+    def send(sig):
+        try:
+            if new_session:
+                os.killpg(process.pid, sig)
+            else:
+                process.send_signal(sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    if process.returncode is not None:
+        return None
+    send(signal.SIGTERM)
+    try:
+        return _reap(process, KILL_GRACE_PERIOD)  # 正常終了の猶予
+    except subprocess.TimeoutExpired:
+        send(signal.SIGKILL)
+        return _reap(process)
+
+
+def _pump_output(process, readers, deadline, show_progress, matcher=None):
+    """selectorsで標準出力と標準エラー出力を読み込む
+
+    戻り値は 'finished' (両方のパイプがEOF)、'timeout'、'aborted' (致命的エラーを検出) のいずれか。
+    """
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, readers[0])
+    selector.register(process.stderr, selectors.EVENT_READ, readers[1])
+
+    start_time = time.time()
+    tick = 0
+    try:
+        while selector.get_map():
+            wait = PROGRESS_INTERVAL if show_progress else None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return 'timeout'
+                wait = remaining if wait is None else min(wait, remaining)
+
+            for key, _ in selector.select(wait):
+                data = os.read(key.fd, 65536)
+                if data:
+                    key.data.feed(data)
+                else:
+                    # EOF: パイプが閉じられた
+                    selector.unregister(key.fileobj)
+                    key.data.close()
+
+            if matcher is not None and matcher.failure is not None:
+                return 'aborted'
+
+            if show_progress:
+                elapsed = int(time.time() - start_time)
+                minutes, seconds = divmod(elapsed, 60)
+                symbol = PROGRESS_SYMBOLS[tick % len(PROGRESS_SYMBOLS)]
+                print(f"\r{symbol} 処理中... ({minutes:02d}:{seconds:02d})", end='', flush=True)
+                tick += 1
+    finally:
+        selector.close()
+    return 'finished'
+
+
+def execute_command(command, description=None, timeout=None, show_output=True,
+                    show_progress=False, interactive=False, env=None, cwd=None,
+                    log_name=None, tail_lines=TAIL_LINES, failure_signatures=None):
+    """コマンドを実行し、結果を辞書で返す
+
+    interactive=True の場合は標準入力を端末に接続したまま実行する (flutter run など)。
+    それ以外は新しいセッションで起動し、タイムアウトや中断時にプロセスグループごと終了させる。
+    log_name を指定すると全出力を output/logs 以下の圧縮ログに逐次書き出し、
+    stdout/stderr には末尾 tail_lines 行だけを保持する (長時間のビルド向け)。
+    failure_signatures を指定すると出力を逐次照合し、既知の致命的エラーを検出した時点で
+    プロセスグループを終了させる。分類結果は result['failure'] に入る。
+    """
+    if description:
+        print(f"\n===== {description} =====")
+    if description or show_output:
+        print(f"実行: {command}")
+
+    new_session = not interactive and os.name != 'nt'
+    echo = show_output and not show_progress  # プログレス表示中は出力しない
+    log_path = None
+    sink = None
+    if log_name:
+        log_path = build_log_path(log_name)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        sink = gzip.open(log_path, 'wb', compresslevel=LOG_COMPRESSLEVEL)
+    matcher = FailureMatcher(failure_signatures) if failure_signatures is not None else None
+    readers = (_StreamReader('stdout', echo, sink, tail_lines, matcher),
+               _StreamReader('stderr', echo, sink, tail_lines, matcher))
+    result = {
+        'command': command,
+        'success': False,
+        'returncode': None,
+        'stdout': '',
+        'stderr': '',
+        'output': '',
+        'timed_out': False,
+        'interrupted': False,
+        'duration': 0.0,
+        'log_path': log_path,
+        'line_count': 0,
+        'failure': None,
+        'usage': None,
+    }
+
+    start_time = time.time()
+    deadline = start_time + timeout if timeout else None
+    process = None
+    usage = None
+    try:
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=None if interactive else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+            start_new_session=new_session
+        )
+
+        if os.name == 'nt':
+            # Windowsのパイプはselectorsに対応していないため一括で読み込む
+            try:
+                out, err = process.communicate(timeout=timeout)
+                readers[0].feed(out)
+                readers[1].feed(err)
+                status = 'finished'
+            except subprocess.TimeoutExpired:
+                status = 'timeout'
+        else:
+            status = _pump_output(process, readers, deadline, show_progress, matcher)
+
+        if status == 'finished' and os.name != 'nt':
+            # パイプがEOFでもプロセスが終了しているとは限らない (出力を閉じて動き続ける場合など)
+            # 残り時間を超えて待たず、超えた場合はタイムアウトと同じ手順で終了させる
+            try:
+                usage = _reap(process, None if deadline is None else max(0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                status = 'timeout'
+
+        if status == 'aborted':
+            if show_progress:
+                _clear_progress_line()
+            failure = matcher.failure
+            print(f"\n❌ 既知の致命的エラーを検出したため中断します: {failure['message']}")
+            print(f"   {failure['line']}")
+            usage = _terminate(process, new_session)
+            result['returncode'] = process.returncode
+            result['failure'] = failure
+            result['output'] = f"{failure['message']}\n{failure['line']}"
+            return result
+
+        if status == 'timeout':
+            if show_progress:
+                _clear_progress_line()
+            print(f"\n\n⚠️ コマンドが{timeout}秒以上応答していないため強制終了します")
+            usage = _terminate(process, new_session)
+            result['returncode'] = process.returncode
+            result['timed_out'] = True
+            result['output'] = "タイムアウトにより中断されました"
+            return result
+
+        result['returncode'] = process.returncode
+    except KeyboardInterrupt:
+        if show_progress:
+            _clear_progress_line()
+        print("\n\n⚠️ ユーザーによって中断されました")
+        if process is not None:
+            usage = _terminate(process, new_session)
+        result['interrupted'] = True
+        result['output'] = "ユーザーによって中断されました"
+        return result
+    except Exception as e:
+        if show_progress:
+            _clear_progress_line()
+        print(f"予期せぬエラーが発生しました: {e}")
+        if process is not None:
+            usage = _terminate(process, new_session)
+        result['output'] = str(e)
+        return result
+    finally:
+        for reader in readers:
+            reader.close()
+        if sink is not None:
+            sink.close()
+            if show_output:
+                print(f"📄 全出力ログ: {log_path}")
+        result['stdout'] = readers[0].text()
+        result['stderr'] = readers[1].text()
+        result['line_count'] = readers[0].line_count + readers[1].line_count
+        result['duration'] = time.time() - start_time
+        if process is not None:
+            result['usage'] = _usage_to_dict(usage, result['duration'])
+            record_command_metrics(result, description)
+
+    if show_progress:
+        _clear_progress_line()
+
+    result['success'] = result['returncode'] == 0
+    if result['success']:
+        result['output'] = result['stdout']
+        if show_output and show_progress and result['stdout']:
+            print(result['stdout'])
+    else:
+        result['output'] = result['stderr'] or result['stdout']
+        if matcher is not None:
+            result['failure'] = matcher.failure
+        if show_output:
+            print(f"エラー発生 (コード: {result['returncode']}):")
+            if show_progress and result['output']:
+                print(f"エラー詳細: {result['output']}")
+    return result
+
+
+def run_command(command, description=None, timeout=None, show_output=True,
+                show_progress=False, interactive=False, log_name=None, failure_signatures=None):
+    """コマンドを実行し、(成功フラグ, 出力) のタプルを返す
+
+    成功時の出力は標準出力、失敗時は標準エラー出力 (空の場合は標準出力)。
+    log_name を指定した場合、出力は末尾のみとなる。
+    """
+    result = execute_command(command, description, timeout=timeout, show_output=show_output,
+                             show_progress=show_progress, interactive=interactive,
+                             log_name=log_name, failure_signatures=failure_signatures)
+    return result['success'], result['output']
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使い方: command_runner.py <コマンド>")
+        sys.exit(2)
+    success, _ = run_command(" ".join(sys.argv[1:]))
+    sys.exit(0 if success else 1)
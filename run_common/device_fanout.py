@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from preflight import run_graph
+from android_abi import find_split_apks, APK_OUTPUT_DIR
+from device_inventory import list_devices, simulator_list
+from emulator_pool import pool_serials
+
+# ビルドしたアプリを接続中のすべてのデバイスに並列にインストールして起動する。
+# 同じ adb サーバー (iOS は devicectl・simctl) と同じ USB ハブへの同時転送数を制限し、
+# デバイスごとのインストール時間と初回起動時間を1つの表にまとめる。
+# 同じ adb サーバー・devicectl・simctl で同時に行うインストールの数。環境変数 FANOUT_PER_SERVER で変更できる
+FANOUT_PER_SERVER = int(os.environ.get("FANOUT_PER_SERVER", "6"))
+# 同じ USB ハブに接続された実機へ同時に転送する数 (ハブの帯域を分け合うため)。環境変数 FANOUT_PER_HUB で変更できる
+FANOUT_PER_HUB = int(os.environ.get("FANOUT_PER_HUB", "2"))
+FANOUT_MAX_WORKERS = 16
+# インストール・起動1回あたりの待ち時間の上限 (秒)
+INSTALL_TIMEOUT = 300
+LAUNCH_TIMEOUT = 60
+
+# アプリのID (applicationId・PRODUCT_BUNDLE_IDENTIFIER) の読み取り先と、iOS のビルドの成果物
+ANDROID_BUILD_GRADLE = [os.path.join(PROJECT_ROOT, "android", "app", name)
+                        for name in ("build.gradle.kts", "build.gradle")]
+IOS_PBXPROJ = os.path.join(PROJECT_ROOT, "ios", "Runner.xcodeproj", "project.pbxproj")
+IOS_DEVICE_APP = os.path.join("build", "ios", "iphoneos", "Runner.app")
+IOS_SIMULATOR_APP = os.path.join("build", "ios", "iphonesimulator", "Runner.app")
+
+_APPLICATION_ID_RE = re.compile(r'applicationId\s*=?\s*"([^"]+)"')
+_BUNDLE_ID_RE = re.compile(r'PRODUCT_BUNDLE_IDENTIFIER = "?([^;"]+)"?;')
+_TOTAL_TIME_RE = re.compile(r'TotalTime:\s*(\d+)')
+_XCTRACE_DEVICE_RE = re.compile(r'^(.+?) \(([\d.]+)\) \(([\w-]+)\)$')
+
+
+def _run(args, timeout):
+    """コマンドを実行して (成功したか, 出力) を返す"""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return False, f"{timeout}秒以内に終了しませんでした"
+    except OSError as e:
+        return False, str(e)
+    return result.returncode == 0, (result.stdout + result.stderr).strip()
+
+
+def android_application_id():
+    for path in ANDROID_BUILD_GRADLE:
+        try:
+            with open(path, 'r') as f:
+                match = _APPLICATION_ID_RE.search(f.read())
+        except OSError:
+            continue
+        if match:
+            return match.group(1)
+    return None
+
+
+def ios_bundle_id():
+    """Runner の PRODUCT_BUNDLE_IDENTIFIER (RunnerTests のものは除く)"""
+    try:
+        with open(IOS_PBXPROJ, 'r') as f:
+            ids = _BUNDLE_ID_RE.findall(f.read())
+    except OSError:
+        return None
+    return next((bundle_id for bundle_id in ids if not bundle_id.endswith("Tests")), None)
+
+
+def usb_hub(location):
+    """adb devices -l の usb: の値から、接続しているハブを表す文字列を作る
+
+    Linux は「バス-ポート.ポート...」(1-1.2 → 1-1)、macOS はロケーションIDの10進数 + X
+    (336592896X = 0x14100000 → 0x14) の形式で、最後のポート番号を除いたものをハブとみなす。
+    """
+    if re.fullmatch(r'\d+-[\d.]+', location):
+        return location.rsplit('.', 1)[0] if '.' in location else location.split('-')[0]
+    if location.endswith('X') and location[:-1].isdigit():
+        digits = f"{int(location[:-1]):x}".rstrip('0')
+        return f"0x{digits[:-1] or digits}"
+    return location
+
+
+def android_targets():
+    """adb に接続中のデバイス・エミュレータ (エミュレータプールが管理しているものは除く)"""
+    ok, output = _run(["adb", "devices", "-l"], 30)
+    if not ok:
+        return []
+    pooled = pool_serials()
+    targets = []
+    for line in output.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 2 or fields[1] != "device" or fields[0] in pooled:
+            continue
+        props = dict(field.split(':', 1) for field in fields[2:] if ':' in field)
+        emulator = fields[0].startswith("emulator-")
+        targets.append({
+            'id': fields[0], 'platform': 'android', 'kind': "emulator" if emulator else "device",
+            'name': props.get('model', fields[0]).replace('_', ' '), 'server': 'adb',
+            # Wi-Fi 接続 (adb connect) の実機とエミュレータは USB ハブを使わない
+            'hub': usb_hub(props['usb']) if 'usb' in props else None,
+        })
+    return targets
+
+
+def ios_targets():
+    """接続中の iOS 実機と、起動中のシミュレータ"""
+    targets = []
+    ok, output = _run(["xcrun", "xctrace", "list", "devices"], 60)
+    section = None
+    for line in output.splitlines() if ok else []:
+        if line.startswith("=="):
+            section = line.strip("= ")
+            continue
+        match = _XCTRACE_DEVICE_RE.match(line.strip())
+        if section == "Devices" and match and ("iPhone" in line or "iPad" in line):
+            targets.append({'id': match.group(3), 'platform': 'ios', 'kind': "device", 'name': match.group(1),
+                            'server': 'devicectl', 'hub': None})
+    simulators = list_devices('ios', kind='simulator', state='Booted')
+    if simulators is None:
+        ok, output = _run(["xcrun", "simctl", "list", "devices", "booted", "--json"], 60)
+        simulators = [device for device in simulator_list(output) if device['state'] == "Booted"] if ok else []
+    for simulator in simulators:
+        targets.append({'id': simulator['id'], 'platform': 'ios', 'kind': "simulator", 'name': simulator['name'],
+                        'server': 'simctl', 'hub': None})
+    return targets
+
+
+def find_targets(platform_name, match=None, kinds=None):
+    """platform_name (android / ios / all) のデバイスのうち、名前・IDが match (正規表現) に一致するもの"""
+    targets = []
+    if platform_name in ("android", "all"):
+        targets += android_targets()
+    if platform_name in ("ios", "all"):
+        targets += ios_targets()
+    pattern = re.compile(match, re.IGNORECASE) if match else None
+    return [target for target in targets
+            if (pattern is None or pattern.search(target['name']) or pattern.search(target['id']))
+            and (not kinds or target['kind'] in kinds)]
+
+
+def _select_apk(target, apks):
+    """デバイスが対応する ABI (優先順) の APK を選ぶ。分割していない APK は 'universal' で渡す"""
+    ok, output = _run(["adb", "-s", target['id'], "shell", "getprop", "ro.product.cpu.abilist"], 30)
+    for abi in output.strip().split(',') if ok else []:
+        if abi in apks:
+            return abi, apks[abi]
+    if 'universal' in apks:
+        return 'universal', apks['universal']
+    return None, None
+
+
+def install_android(target, apks, application_id):
+    record = {'artifact': None, 'install': None, 'launch': None, 'error': None}
+    abi, apk = _select_apk(target, apks)
+    if apk is None:
+        record['error'] = f"対応するABIのAPKがありません ({', '.join(sorted(apks))})"
+        return record
+    record['artifact'] = abi
+    start = time.time()
+    ok, output = _run(["adb", "-s", target['id'], "install", "-r", "-t", apk], INSTALL_TIMEOUT)
+    if not ok or "Success" not in output:
+        record['error'] = f"インストールに失敗しました: {output.splitlines()[-1] if output else '応答なし'}"
+        return record
+    record['install'] = time.time() - start
+    # -S で起動中のアプリを終了させてから起動し、-W で表示の完了 (TotalTime) まで待つ
+    start = time.time()
+    ok, output = _run(["adb", "-s", target['id'], "shell", "am", "start", "-W", "-S",
+                       "-n", f"{application_id}/.MainActivity"], LAUNCH_TIMEOUT)
+    if not ok or "Error" in output:
+        record['error'] = f"起動に失敗しました: {output.splitlines()[-1] if output else '応答なし'}"
+        return record
+    total = _TOTAL_TIME_RE.search(output)
+    record['launch'] = int(total.group(1)) / 1000 if total else time.time() - start
+    return record
+
+
+def install_ios(target, apps, bundle_id):
+    record = {'artifact': None, 'install': None, 'launch': None, 'error': None}
+    app = apps.get(target['kind'])
+    if app is None or not os.path.exists(app):
+        record['error'] = f"{'シミュレータ' if target['kind'] == 'simulator' else '実機'}用のビルドがありません"
+        return record
+    record['artifact'] = os.path.basename(os.path.dirname(app))
+    if target['kind'] == "simulator":
+        install = ["xcrun", "simctl", "install", target['id'], app]
+        launch = ["xcrun", "simctl", "launch", "--terminate-running-process", target['id'], bundle_id]
+    else:
+        install = ["xcrun", "devicectl", "device", "install", "app", "--device", target['id'], app]
+        launch = ["xcrun", "devicectl", "device", "process", "launch", "--terminate-existing",
+                  "--device", target['id'], bundle_id]
+    start = time.time()
+    ok, output = _run(install, INSTALL_TIMEOUT)
+    if not ok:
+        record['error'] = f"インストールに失敗しました: {output.splitlines()[-1] if output else '応答なし'}"
+        return record
+    record['install'] = time.time() - start
+    start = time.time()
+    ok, output = _run(launch, LAUNCH_TIMEOUT)
+    if not ok:
+        record['error'] = f"起動に失敗しました: {output.splitlines()[-1] if output else '応答なし'}"
+        return record
+    record['launch'] = time.time() - start
+    return record
+
+
+def install_and_launch(target, artifacts):
+    """1台にインストールして起動し、結果 ({artifact, install, launch, error}) を返す"""
+    if target['platform'] == 'android':
+        record = install_android(target, artifacts['android'], artifacts['application_id'])
+    else:
+        record = install_ios(target, artifacts['ios'], artifacts['bundle_id'])
+    if record['error']:
+        print(f"  ⚠️ {record['error']}")
+    return record
+
+
+def fan_out(targets, artifacts, title="全デバイスへのインストール"):
+    """targets のすべてに並列にインストールして起動し、結果の表を表示する。戻り値はデバイスごとの結果の一覧
+
+    artifacts は {'android': {abi: APKのパス}, 'application_id': ..., 'ios': {'device'・'simulator': .appのパス},
+    'bundle_id': ...}。adb サーバーなどごとに FANOUT_PER_SERVER 台、USB ハブごとに FANOUT_PER_HUB 台まで同時に転送する。
+    """
+    capacity, steps, records = {}, [], {}
+
+    def run_target(target):
+        records[target['id']] = install_and_launch(target, artifacts)
+        return records[target['id']]['error'] is None
+
+    for target in targets:
+        step = {'name': target['id'], 'func': run_target, 'args': (target,),
+                'description': f"{target['name']} ({target['id']})", target['server']: 1}
+        capacity[target['server']] = FANOUT_PER_SERVER
+        if target['hub']:
+            step[f"hub:{target['hub']}"] = 1
+            capacity[f"hub:{target['hub']}"] = FANOUT_PER_HUB
+        steps.append(step)
+    start = time.time()
+    outcomes = run_graph(steps, FANOUT_MAX_WORKERS, title, capacity)
+    results = []
+    for target in targets:
+        outcome = outcomes[target['id']]
+        record = records.get(target['id']) or {'artifact': None, 'install': None, 'launch': None,
+                                                'error': str(outcome['error'] or "不明なエラー")}
+        results.append(dict(target, **record, ok=record['error'] is None, seconds=outcome['duration']))
+    print_fanout_summary(results, time.time() - start)
+    return results
+
+
+def print_fanout_summary(results, wall):
+    print(f"\n===== インストール・初回起動の結果 ({len(results)}台) =====")
+    print(f"{'デバイス':<24} | {'ID':<26} | {'種類':<9} | {'ハブ':<8} | {'成果物':<15} | "
+          f"{'インストール':>8} | {'初回起動':>7} | 結果")
+    print("-" * 133)
+    for result in sorted(results, key=lambda result: (not result['ok'], result['platform'], result['name'])):
+        install = f"{result['install']:.1f}s" if result['install'] is not None else "-"
+        launch = f"{result['launch']:.2f}s" if result['launch'] is not None else "-"
+        print(f"{result['name'][:24]:<24} | {result['id'][:26]:<26} | {result['kind']:<9} | "
+              f"{result['hub'] or '-':<8} | {result['artifact'] or '-':<15} | {install:>8} | {launch:>7} | "
+              f"{'✅' if result['ok'] else '❌ ' + result['error']}")
+    succeeded = [result for result in results if result['ok']]
+    serial = sum(result['seconds'] for result in results)
+    print(f"\n成功: {len(succeeded)}/{len(results)}台 / 所要時間 {wall:.1f}秒 (1台ずつ行った場合の合計 {serial:.1f}秒)")
+
+
+def built_apks(mode="debug"):
+    """ビルド済みの APK ({abi: パス}、分割していないものは 'universal')"""
+    apks = find_split_apks(mode, APK_OUTPUT_DIR)
+    universal = os.path.join(APK_OUTPUT_DIR, f"app-{mode}.apk")
+    if os.path.exists(universal):
+        apks['universal'] = universal
+    return apks
+
+
+def install_to_all(platform_name, android_apks=None, ios_apps=None, match=None, kinds=None):
+    """ビルドした成果物を、一致するすべてのデバイスにインストールして起動する。1台も無いか、失敗があればFalse"""
+    targets = find_targets(platform_name, match, kinds)
+    if not targets:
+        print("⚠️ インストール先のデバイスが見つかりません")
+        return False
+    artifacts = {'android': android_apks or {}, 'application_id': android_application_id(),
+                 'ios': ios_apps or {}, 'bundle_id': ios_bundle_id()}
+    print(f"\n📲 {len(targets)}台のデバイスにインストールします "
+          f"(同時転送: サーバーごとに{FANOUT_PER_SERVER}台・USBハブごとに{FANOUT_PER_HUB}台)")
+    results = fan_out(targets, artifacts)
+    return all(result['ok'] for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルド済みのアプリを接続中のすべてのデバイスに並列にインストールして起動する")
+    parser.add_argument('--platform', choices=["android", "ios", "all"], default="all", help='対象のプラットフォーム')
+    parser.add_argument('--match', help='対象のデバイスの名前・IDの正規表現 (例: "Pixel|SM-S9")')
+    parser.add_argument('--kind', action='append', choices=["device", "emulator", "simulator"],
+                        help='対象の種類 (複数指定可、省略時はすべて)')
+    parser.add_argument('--mode', choices=["debug", "profile", "release"], default="debug", help='APKのビルドモード')
+    parser.add_argument('--list', action='store_true', help='対象のデバイスを表示するだけ')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    os.chdir(PROJECT_ROOT)
+    if args.list:
+        for target in find_targets(args.platform, args.match, args.kind):
+            print(f"{target['platform']:<8} | {target['kind']:<9} | {target['id']:<38} | {target['hub'] or '-':<8} | "
+                  f"{target['name']}")
+        return 0
+    ios_apps = {'device': IOS_DEVICE_APP, 'simulator': IOS_SIMULATOR_APP}
+    return 0 if install_to_all(args.platform, built_apks(args.mode), ios_apps, args.match, args.kind) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
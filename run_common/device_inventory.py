@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import threading
+import subprocess
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR
+from readiness import wait_until
+
+# 接続デバイスの一覧をバックグラウンドで監視し続けるサービス。
+# adb track-devices の通知と simctl の一覧を受け取って、最新の一覧をファイルに書き出す。
+# スクリプトはこのファイルを読むだけなので、adb devices や flutter devices を毎回実行しなくてよい。
+# 環境変数 DEVICE_INVENTORY_DIR で保存先を変更できる (計測用の環境などでプロジェクトのサービスと分ける)
+INVENTORY_DIR = os.environ.get("DEVICE_INVENTORY_DIR") or CACHE_DIR
+INVENTORY_FILE = os.path.join(INVENTORY_DIR, "device_inventory.json")
+# 実行中のサービスのロック (複数起動しないようにする)
+LOCK_FILE = os.path.join(INVENTORY_DIR, "device_inventory.lock")
+# スクリプトが一覧を参照するたびに更新するファイル (しばらく参照されなければサービスを終了する)
+LEASE_FILE = os.path.join(INVENTORY_DIR, "device_inventory.lease")
+LOG_FILE = os.path.join(INVENTORY_DIR, "device_inventory.log")
+# サービスが生きていることを示すために一覧を書き直す間隔 (秒)
+HEARTBEAT_SECONDS = 5
+# simctl には変更の通知が無いため、この間隔 (秒) で一覧を取り直す。環境変数 SIMCTL_POLL_INTERVAL で変更できる
+SIMCTL_POLL_INTERVAL = float(os.environ.get("SIMCTL_POLL_INTERVAL", "2"))
+# 参照されないまま経過したら終了するまでの時間 (秒)。環境変数 DEVICE_INVENTORY_IDLE で変更できる
+IDLE_SECONDS = int(os.environ.get("DEVICE_INVENTORY_IDLE", "1800"))
+# 監視が異常終了したときに再起動するまでの待ち時間 (秒) の上限
+RESTART_BACKOFF_MAX = 30
+# 環境変数 NO_DEVICE_INVENTORY=1 でサービスを使わず、従来どおり毎回コマンドを実行する
+INVENTORY_ENABLED = os.environ.get("NO_DEVICE_INVENTORY", "") not in ("1", "true", "yes")
+
+
+def _log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def _read_inventory():
+    try:
+        with open(INVENTORY_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _lock_owner():
+    try:
+        with open(LOCK_FILE, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(inventory):
+    """一覧を書いたサービスが実行中 (ロックを持ち、ハートビートが途切れていない) かどうか"""
+    return (inventory is not None and inventory.get('pid') == _lock_owner()
+            and time.time() - inventory.get('heartbeat', 0) < HEARTBEAT_SECONDS * 3)
+
+
+def tool_paths():
+    """監視に使うツールの実体のパス (PATH が変わった場合にサービスを起動し直すため)"""
+    return {tool: shutil.which(tool) for tool in ("adb", "xcrun")}
+
+
+def _probe(args, timeout=10):
+    """短いコマンドを実行して標準出力を返す (失敗した場合はNone)"""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+class DeviceInventory:
+    """デバイスの一覧を保持し、変化するたびに INVENTORY_FILE に書き出す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._sources = {}
+        self._started = time.time()
+        self._stop = threading.Event()
+        self._processes = []
+
+    def update_source(self, source, devices):
+        """source (adb / simctl) のデバイス一覧をまとめて置き換える"""
+        with self._lock:
+            now = time.time()
+            current = {key: device for key, device in self._devices.items() if device['source'] != source}
+            for device in devices:
+                key = f"{source}:{device['id']}"
+                previous = self._devices.get(key)
+                if previous is None or previous['state'] != device['state']:
+                    _log(f"{source}: {device['id']} -> {device['state']}")
+                device['source'] = source
+                device['since'] = previous['since'] if previous and previous['state'] == device['state'] else now
+                current[key] = device
+            for key in set(self._devices) - set(current):
+                if self._devices[key]['source'] == source:
+                    _log(f"{source}: {self._devices[key]['id']} -> 切断")
+            self._devices = current
+            self._sources[source] = {'ok': True, 'updated': now}
+            self._write()
+
+    def source_failed(self, source, message):
+        with self._lock:
+            self._sources[source] = {'ok': False, 'updated': time.time(), 'error': message}
+            self._write()
+
+    def _write(self):
+        if _lock_owner() != os.getpid():
+            # stop されたか、別のサービスに置き換わった
+            self._stop.set()
+            return
+        inventory = {
+            'pid': os.getpid(),
+            'started': self._started,
+            'heartbeat': time.time(),
+            'tools': tool_paths(),
+            'sources': self._sources,
+            'devices': sorted(self._devices.values(), key=lambda device: (device['platform'], device['id'])),
+        }
+        os.makedirs(INVENTORY_DIR, exist_ok=True)
+        tmp_path = f"{INVENTORY_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(inventory, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, INVENTORY_FILE)
+
+    def heartbeat(self):
+        with self._lock:
+            self._write()
+
+    def spawn(self, args):
+        """監視用の常駐コマンドを起動する (サービスの終了時に止める)"""
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        self._processes.append(process)
+        return process
+
+    def watch(self, source, loop):
+        """loop が終了・失敗するたびに、待ち時間を延ばしながら再起動する"""
+        backoff = 1
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                loop(self)
+                message = "監視コマンドが終了しました"
+            except Exception as e:
+                message = str(e)
+            if self._stop.is_set():
+                break
+            self.source_failed(source, message)
+            _log(f"⚠️ {source} の監視を再起動します: {message}")
+            backoff = 1 if time.time() - started > RESTART_BACKOFF_MAX else min(backoff * 2, RESTART_BACKOFF_MAX)
+            self._stop.wait(backoff)
+
+    def stop(self):
+        self._stop.set()
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def stopped(self):
+        return self._stop.is_set()
+
+    def sleep(self, seconds):
+        self._stop.wait(seconds)
+
+
+def _read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _android_device(serial, state, details):
+    """adb のシリアル番号と状態からデバイスの情報を作る (AVD 名などは接続時に1回だけ取得する)"""
+    emulator = serial.startswith("emulator-")
+    if serial not in details and state == "device":
+        if emulator:
+            output = _probe(["adb", "-s", serial, "emu", "avd", "name"])
+            name = output.splitlines()[0].strip() if output else None
+        else:
+            output = _probe(["adb", "-s", serial, "shell", "getprop", "ro.product.model"])
+            name = output.strip() if output else None
+        if name:
+            details[serial] = name
+    name = details.get(serial)
+    device = {'id': serial, 'platform': 'android', 'kind': "emulator" if emulator else "device",
+              'state': state, 'name': name or serial}
+    if emulator:
+        device['avd'] = name
+    return device
+
+
+def track_adb(inventory):
+    """adb track-devices を実行し続け、一覧が通知されるたびに反映する
+
+    出力は「長さ (16進4桁) + "シリアル番号\\t状態\\n" の並び」の繰り返し。
+    """
+    process = inventory.spawn(["adb", "track-devices"])
+    details = {}
+    try:
+        while not inventory.stopped():
+            header = _read_exact(process.stdout, 4)
+            if header is None:
+                break
+            payload = _read_exact(process.stdout, int(header, 16)) if int(header, 16) else b''
+            if payload is None:
+                break
+            devices = []
+            for line in payload.decode(errors='replace').splitlines():
+                parts = line.split('\t')
+                if len(parts) >= 2:
+                    devices.append(_android_device(parts[0], parts[1], details))
+            # 切断されたシリアル番号は別の AVD で再利用されるため、取得した名前を捨てる
+            for serial in set(details) - {device['id'] for device in devices}:
+                del details[serial]
+            inventory.update_source('adb', devices)
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+
+def simulator_list(output):
+    """simctl list devices --json の出力から iOS シミュレータの一覧を作る"""
+    devices = []
+    for runtime, entries in json.loads(output).get('devices', {}).items():
+        if 'iOS' not in runtime:
+            continue
+        version = runtime.rsplit('iOS-', 1)[-1].replace('-', '.') if 'iOS-' in runtime else "不明"
+        for entry in entries:
+            if entry.get('isDeleted', False):
+                continue
+            devices.append({'id': entry.get('udid'), 'platform': 'ios', 'kind': "simulator",
+                            'state': entry.get('state', '不明'), 'name': entry.get('name', '名前不明'),
+                            'ios_version': version, 'runtime': runtime,
+                            'available': entry.get('isAvailable', False)})
+    return devices
+
+
+def poll_simctl(inventory):
+    """simctl list devices --json を定期的に実行し、一覧を反映する"""
+    while not inventory.stopped():
+        output = _probe(["xcrun", "simctl", "list", "devices", "--json"], timeout=30)
+        if output is None:
+            raise RuntimeError("simctl list devices に失敗しました")
+        inventory.update_source('simctl', simulator_list(output))
+        inventory.sleep(SIMCTL_POLL_INTERVAL)
+
+
+def available_sources():
+    """この環境で監視できるもの ({名前: 監視関数})"""
+    sources = {}
+    if shutil.which("adb"):
+        sources['adb'] = track_adb
+    if shutil.which("xcrun"):
+        sources['simctl'] = poll_simctl
+    return sources
+
+
+def _acquire_lock():
+    """ロックを取得する。実行中のサービスがあればFalse (応答が無くなったサービスのロックは取り直す)"""
+    os.makedirs(INVENTORY_DIR, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            inventory = _read_inventory()
+            lock_age = time.time() - os.path.getmtime(LOCK_FILE) if os.path.exists(LOCK_FILE) else 0
+            if _is_fresh(inventory) or lock_age < HEARTBEAT_SECONDS * 3:
+                return False
+            try:
+                os.remove(LOCK_FILE)
+            except FileNotFoundError:
+                pass
+    return False
+
+
+def serve():
+    """サービス本体。参照されないまま IDLE_SECONDS 経過するか stop されるまで監視を続ける"""
+    if not _acquire_lock():
+        _log("既に実行中のため終了します")
+        return 0
+    inventory = DeviceInventory()
+    try:
+        sources = available_sources()
+        _log(f"デバイスの監視を開始します: {', '.join(sources) or 'なし'}")
+        inventory.heartbeat()
+        for source, loop in sources.items():
+            threading.Thread(target=inventory.watch, args=(source, loop), daemon=True).start()
+        while not inventory.stopped():
+            inventory.sleep(HEARTBEAT_SECONDS)
+            idle = time.time() - (os.path.getmtime(LEASE_FILE) if os.path.exists(LEASE_FILE) else inventory._started)
+            if idle > IDLE_SECONDS:
+                _log(f"{IDLE_SECONDS}秒間参照されなかったため終了します")
+                break
+            inventory.heartbeat()
+    finally:
+        inventory.stop()
+        # 別のサービスに置き換わっていなければ自分のファイルを片付ける
+        owned = [INVENTORY_FILE] if (_read_inventory() or {}).get('pid') == os.getpid() else []
+        if _lock_owner() == os.getpid():
+            owned.append(LOCK_FILE)
+        for path in owned:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    _log("終了しました")
+    return 0
+
+
+def start_inventory():
+    """サービスをバックグラウンドで起動する (スクリプトの終了後も動き続ける)"""
+    os.makedirs(INVENTORY_DIR, exist_ok=True)
+    kwargs = {}
+    if platform.system() == "Windows":
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    with open(LOG_FILE, 'w') as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"], cwd=PROJECT_ROOT,
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+
+
+def ensure_inventory(timeout=10):
+    """サービスが動いていなければ起動し、すべての監視対象の最初の一覧が揃うまで待つ
+
+    戻り値は一覧の辞書。使えない場合 (NO_DEVICE_INVENTORY=1、起動の失敗) はNone。
+    """
+    if not INVENTORY_ENABLED:
+        return None
+    inventory = _read_inventory()
+    if _is_fresh(inventory) and inventory.get('tools') != tool_paths():
+        # PATH の違う環境 (FAKE_TOOLCHAIN=1 など) で起動したサービスは使わない
+        stop_inventory()
+        inventory = None
+    if not _is_fresh(inventory):
+        start_inventory()
+    expected = set(available_sources())
+    deadline = time.time() + timeout
+    while True:
+        inventory = _read_inventory()
+        if _is_fresh(inventory) and inventory.get('tools') == tool_paths() and expected <= set(inventory['sources']):
+            break
+        if time.time() > deadline:
+            print("⚠️ デバイス一覧のサービスから応答がありません。コマンドで直接確認します")
+            return None
+        time.sleep(0.05)
+    with open(LEASE_FILE, 'a'):
+        os.utime(LEASE_FILE)
+    return inventory
+
+
+def list_devices(platform_name=None, kind=None, state=None):
+    """サービスが把握しているデバイスの一覧。使えない場合はNone (呼び出し側でコマンドを実行する)"""
+    inventory = ensure_inventory()
+    if inventory is None:
+        return None
+    source_names = {'android': 'adb', 'ios': 'simctl'}
+    if platform_name in source_names and not inventory['sources'].get(source_names[platform_name], {}).get('ok'):
+        return None
+    return [device for device in inventory['devices']
+            if (platform_name is None or device['platform'] == platform_name)
+            and (kind is None or device['kind'] == kind) and (state is None or device['state'] == state)]
+
+
+def wait_for_device(predicate, timeout=60, name="デバイスの接続"):
+    """predicate を満たすデバイスが一覧に現れるまで待ち、そのデバイスを返す (タイムアウト・使えない場合はNone)"""
+    if ensure_inventory() is None:
+        return None
+
+    def find():
+        inventory = _read_inventory() or {'devices': []}
+        return next((device for device in inventory['devices'] if predicate(device)), None)
+    # 一覧はファイルを読むだけで確認できるため、間隔を短く保つ
+    return wait_until(name, find, timeout, max_interval=0.2)
+
+
+def stop_inventory():
+    """実行中のサービスを終了させる (ロックを削除すると次のハートビートで終了する)"""
+    try:
+        os.remove(LOCK_FILE)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def print_inventory(inventory):
+    print(f"{'プラットフォーム':<10} | {'種類':<9} | {'ID':<38} | {'名前':<26} | {'状態':<10}")
+    print("-" * 105)
+    for device in inventory['devices']:
+        print(f"{device['platform']:<10} | {device['kind']:<9} | {device['id']:<38} | {device['name']:<26} | "
+              f"{device['state']:<10}")
+    for source, status in sorted(inventory['sources'].items()):
+        age = time.time() - status['updated']
+        print(f"{source}: {'正常' if status['ok'] else '失敗 (' + status.get('error', '') + ')'} / {age:.1f}秒前に更新")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接続デバイスの一覧を監視し続けるバックグラウンドサービス")
+    parser.add_argument('command', nargs='?', default="list", choices=["list", "serve", "start", "stop"],
+                        help='list: 一覧を表示 (必要なら起動) / serve: フォアグラウンドで実行 / start・stop: 起動・終了')
+    parser.add_argument('--json', action='store_true', help='list の結果をJSONで出力')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.command == "serve":
+        return serve()
+    if args.command == "stop":
+        print("✅ サービスを終了しました" if stop_inventory() else "サービスは実行されていません")
+        return 0
+    inventory = ensure_inventory()
+    if inventory is None:
+        print("エラー: デバイス一覧のサービスを利用できません")
+        return 1
+    if args.command == "start":
+        print(f"✅ サービスを実行中です (pid {inventory['pid']})")
+    elif args.json:
+        print(json.dumps(inventory['devices'], ensure_ascii=False, indent=2))
+    else:
+        print_inventory(inventory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR
+from avd_index import avd_dir, list_avd_names
+from readiness import wait_until
+
+# 起動済みの Android エミュレータを常に用意しておくプール。
+# 画面を持たない (-no-window、ソフトウェア描画の) エミュレータをクイックブート用のスナップショットから起動しておき、
+# 実行ごとに1台を貸し出す。返却されたらスナップショットに戻し、応答しなくなったものは起動し直す。
+POOL_FILE = os.path.join(CACHE_DIR, "emulator_pool.json")
+# 実行中の管理プロセスのロック (複数起動しないようにする)
+POOL_LOCK = os.path.join(CACHE_DIR, "emulator_pool.lock")
+# POOL_FILE を書き換える間だけ取得するロック (管理プロセスと貸し出し・返却の書き込みが重ならないようにする)
+STATE_LOCK = f"{POOL_FILE}.lock"
+LOG_FILE = os.path.join(CACHE_DIR, "emulator_pool.log")
+# エミュレータごとの出力の保存先
+INSTANCE_LOG_DIR = os.path.join(CACHE_DIR, "emulator_pool")
+# 返却時に戻すスナップショットの名前 (起動直後のきれいな状態)
+POOL_SNAPSHOT = "pool_clean"
+# AVD ごとに用意しておく台数。環境変数 EMULATOR_POOL_SIZE で変更できる
+POOL_SIZE = int(os.environ.get("EMULATOR_POOL_SIZE", "2"))
+# プールのエミュレータのコンソールポート。adb が自動で検出するのは 5554〜5584 のため、その後半を使う
+POOL_PORTS = range(5570, 5586, 2)
+# 起動・スナップショットへの復元を待つ時間 (秒)。環境変数 EMULATOR_POOL_BOOT_TIMEOUT で変更できる
+BOOT_TIMEOUT = int(os.environ.get("EMULATOR_POOL_BOOT_TIMEOUT", "300"))
+RESET_TIMEOUT = 60
+# 貸し出していないエミュレータの応答を確認する間隔 (秒)
+HEALTH_INTERVAL = 30
+# 管理プロセスがプールの状態を確認する間隔 (秒)
+TICK_SECONDS = 1.0
+# ハートビートを書き込む間隔と、途切れたとみなす時間 (秒)。ハートビートは別スレッドで書き込むため、
+# スナップショットの作成や復元などの時間のかかる処理の間も途切れない
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_TIMEOUT = 15
+# 起動に続けて失敗した場合に次の起動まで待つ時間 (秒) の上限
+RESTART_BACKOFF_MAX = 60
+# 画面・GPU・音声を使わずに起動する (GPU の無い Linux のサーバーでも動かせるようにする)
+HEADLESS_FLAGS = ["-no-window", "-gpu", "swiftshader_indirect", "-no-audio", "-no-boot-anim"]
+
+
+def _log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def read_pool():
+    try:
+        with open(POOL_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_pool(pool):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{POOL_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(pool, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, POOL_FILE)
+
+
+@contextmanager
+def _state_lock(timeout=10):
+    """POOL_FILE を書き換える間のロック (異常終了で残ったロックは timeout 秒で取り直す)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(STATE_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(STATE_LOCK) > timeout:
+                    os.remove(STATE_LOCK)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError("エミュレータプールの状態ファイルのロックを取得できません")
+            time.sleep(0.02)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(STATE_LOCK)
+        except FileNotFoundError:
+            pass
+
+
+def _update(change):
+    """ロックを取って POOL_FILE を読み、change(pool) で書き換えて保存する。戻り値は change の戻り値"""
+    with _state_lock():
+        pool = read_pool() or {'targets': {}, 'instances': {}}
+        result = change(pool)
+        _write_pool(pool)
+    return result
+
+
+def _owner():
+    try:
+        with open(POOL_LOCK, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+
+
+def is_running(pool=None):
+    """管理プロセスが実行中 (ロックを持ち、プロセスが生きていて、ハートビートが途切れていない) かどうか"""
+    pool = read_pool() if pool is None else pool
+    return bool(pool is not None and pool.get('pid') and pool.get('pid') == _owner() and _pid_alive(pool['pid'])
+                and time.time() - pool.get('heartbeat', 0) < HEARTBEAT_TIMEOUT)
+
+
+def _pid_alive(pid):
+    if not pid or platform.system() == "Windows":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _adb(serial, *args, timeout=10):
+    """adb -s <シリアル番号> を実行して標準出力を返す (失敗した場合はNone)"""
+    try:
+        result = subprocess.run(["adb", "-s", serial] + list(args), capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _booted(serial):
+    return (_adb(serial, "shell", "getprop", "sys.boot_completed") or "").strip() == "1"
+
+
+def has_snapshot(avd):
+    return os.path.isdir(os.path.join(avd_dir(avd), "snapshots", POOL_SNAPSHOT))
+
+
+def _attached_serials():
+    try:
+        output = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return set()
+    return {line.split('\t')[0] for line in output.splitlines()[1:] if '\t' in line}
+
+
+def _free_port(pool):
+    used = {instance['port'] for instance in pool['instances'].values()}
+    attached = _attached_serials()
+    for port in POOL_PORTS:
+        if port not in used and f"emulator-{port}" not in attached:
+            return port
+    return None
+
+
+def _instance_log(port):
+    return os.path.join(INSTANCE_LOG_DIR, f"emulator-{port}.log")
+
+
+def _launch_error(process, port):
+    """起動したエミュレータのプロセスが失敗して終了していれば、その理由 (ログの最後の行)。動作中・正常終了ならNone"""
+    if process is None or not process.poll():
+        return None
+    try:
+        with open(_instance_log(port), 'r', errors='replace') as f:
+            lines = [line.strip() for line in f if line.strip()]
+    except OSError:
+        lines = []
+    return lines[-1] if lines else f"終了コード {process.returncode}"
+
+
+def _launch(avd, port, flags):
+    """エミュレータをバックグラウンドで起動する (管理プロセスが終了しても動き続ける)。戻り値は Popen"""
+    os.makedirs(INSTANCE_LOG_DIR, exist_ok=True)
+    kwargs = {}
+    if platform.system() == "Windows":
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    with open(_instance_log(port), 'w') as log:
+        return subprocess.Popen(["emulator", "-avd", avd, "-port", str(port)] + HEADLESS_FLAGS + flags,
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+
+
+def _kill(serial):
+    _adb(serial, "emu", "kill")
+
+
+def prepare_snapshot(avd):
+    """AVD をコールドブートし、起動直後の状態をプール用のスナップショットとして保存する (初回のみ必要)"""
+    port = _free_port(read_pool() or {'instances': {}})
+    if port is None:
+        _log("⚠️ プール用のポートが空いていません")
+        return False
+    serial = f"emulator-{port}"
+    _log(f"{avd}: スナップショット「{POOL_SNAPSHOT}」を作成します ({serial})")
+    process = _launch(avd, port, ["-no-snapshot-load"])
+    try:
+        # 起動に失敗して終了した場合はタイムアウトを待たずに中断する
+        result = wait_until(f"スナップショット用の起動 ({avd})",
+                            lambda: _launch_error(process, port) or _booted(serial), BOOT_TIMEOUT)
+        if result is not True:
+            _log(f"⚠️ {avd}: 起動できませんでした: {result or 'タイムアウトしました'} (ログ: {_instance_log(port)})")
+            return False
+        output = _adb(serial, "emu", "avd", "snapshot", "save", POOL_SNAPSHOT, timeout=120) or ""
+        if not output.startswith("OK"):
+            _log(f"⚠️ {avd}: スナップショットを保存できませんでした: {output.strip()}")
+            return False
+    finally:
+        _kill(serial)
+    _log(f"{avd}: スナップショットを作成しました")
+    return True
+
+
+class EmulatorPool:
+    """POOL_FILE の targets ({AVD 名: 台数}) に合わせてエミュレータを起動・復元・入れ替える"""
+
+    def __init__(self):
+        self._started = time.time()
+        self._failures = {}
+        self._next_launch = {}
+        self._unprepared = set()
+        self._processes = {}
+
+    def _set(self, serial, expected, **fields):
+        """serial の状態が expected のままであれば fields で更新する (貸し出しと重なった場合は何もしない)"""
+        def change(pool):
+            instance = pool['instances'].get(serial)
+            if instance is None or instance['state'] not in expected:
+                return False
+            instance.update(fields)
+            return True
+        return _update(change)
+
+    def _remove(self, serial):
+        _update(lambda pool: pool['instances'].pop(serial, None))
+
+    def heartbeat(self):
+        """ハートビートを書き込み、現在の状態を返す (ロックを失っていれば何も書かずにNone)"""
+        def change(pool):
+            if _owner() != os.getpid():
+                return None
+            pool.update({'pid': os.getpid(), 'started': self._started, 'heartbeat': time.time()})
+            # 貸し出し先のプロセスが終了していれば返却されたものとして扱う
+            for instance in pool['instances'].values():
+                lease = instance.get('lease')
+                if instance['state'] == 'leased' and lease and not _pid_alive(lease.get('holder_pid')):
+                    _log(f"{instance['serial']}: 貸し出し先 (pid {lease.get('holder_pid')}) が終了したため回収します")
+                    instance.update({'state': 'returned', 'lease': None})
+            return json.loads(json.dumps(pool))
+        return _update(change)
+
+    def check(self, instance):
+        """エミュレータ1台の状態を確認して次の状態へ進める"""
+        serial, state, now = instance['serial'], instance['state'], time.time()
+        if state == 'booting':
+            if _booted(serial):
+                self._failures[instance['avd']] = 0
+                self._set(serial, ['booting'], state='ready', ready_since=now, checked=now,
+                          boot_seconds=round(now - instance['started'], 1))
+                _log(f"{serial}: 準備ができました ({now - instance['started']:.1f}秒)")
+            else:
+                error = _launch_error(self._processes.get(serial), instance['port'])
+                if error or now - instance['started'] > BOOT_TIMEOUT:
+                    self._failures[instance['avd']] = self._failures.get(instance['avd'], 0) + 1
+                    self._set(serial, ['booting'], state='unhealthy', reason=error or "起動がタイムアウトしました")
+        elif state == 'ready' and now - instance.get('checked', 0) > HEALTH_INTERVAL:
+            if _booted(serial):
+                self._set(serial, ['ready'], checked=now)
+            else:
+                self._set(serial, ['ready'], state='unhealthy', reason="応答がありません")
+        elif state == 'returned':
+            self.reset(instance)
+        elif state == 'unhealthy':
+            _log(f"{serial}: 入れ替えます ({instance.get('reason', '不明')})")
+            _kill(serial)
+            self._processes.pop(serial, None)
+            self._remove(serial)
+
+    def reset(self, instance):
+        """返却されたエミュレータをスナップショットに戻す。戻せなければ入れ替える"""
+        serial = instance['serial']
+        if not self._set(serial, ['returned'], state='resetting'):
+            return
+        output = _adb(serial, "emu", "avd", "snapshot", "load", POOL_SNAPSHOT, timeout=RESET_TIMEOUT) or ""
+        if output.startswith("OK") and wait_until(f"スナップショットへの復元 ({serial})",
+                                                  lambda: _booted(serial), RESET_TIMEOUT):
+            now = time.time()
+            self._set(serial, ['resetting'], state='ready', ready_since=now, checked=now)
+            _log(f"{serial}: スナップショットに戻しました")
+        else:
+            self._set(serial, ['resetting'], state='unhealthy',
+                      reason=f"スナップショットに戻せません: {output.strip() or '応答なし'}")
+
+    def trim(self, pool):
+        """targets より多い (台数を減らした・対象から外した) AVD の、貸し出していないエミュレータを終了させる"""
+        for avd in {instance['avd'] for instance in pool['instances'].values()}:
+            active = [instance for instance in pool['instances'].values()
+                      if instance['avd'] == avd and instance['state'] != 'unhealthy']
+            extra = len(active) - pool['targets'].get(avd, 0)
+            for instance in [instance for instance in active if instance['state'] == 'ready'][:max(extra, 0)]:
+                self._set(instance['serial'], ['ready'], state='unhealthy', reason="台数を減らしました")
+
+    def fill(self, pool):
+        """targets の台数に足りない AVD のエミュレータを起動する"""
+        for avd, size in pool['targets'].items():
+            count = sum(1 for instance in pool['instances'].values()
+                        if instance['avd'] == avd and instance['state'] != 'unhealthy')
+            if count >= size or time.time() < self._next_launch.get(avd, 0) or avd in self._unprepared:
+                continue
+            if not has_snapshot(avd) and not prepare_snapshot(avd):
+                # 作り直しても同じ結果になるため、targets が変わるまで起動しない
+                self._unprepared.add(avd)
+                continue
+            port = _free_port(read_pool())
+            if port is None:
+                _log(f"⚠️ {avd}: プール用のポート ({POOL_PORTS[0]}〜{POOL_PORTS[-1]}) が空いていません")
+                continue
+            instance = {'serial': f"emulator-{port}", 'port': port, 'avd': avd, 'state': 'booting', 'lease': None,
+                        'started': time.time(), 'leases_served': 0}
+            _update(lambda pool: pool['instances'].update({instance['serial']: instance}))
+            # 同じ AVD を複数起動するため読み取り専用で起動し、スナップショットは上書きしない
+            self._processes[instance['serial']] = _launch(avd, port, ["-read-only", "-snapshot", POOL_SNAPSHOT,
+                                                                      "-no-snapshot-save"])
+            _log(f"{instance['serial']}: {avd} を起動しています")
+            # 起動に続けて失敗している AVD は間隔を空けて起動する
+            failures = self._failures.get(avd, 0)
+            self._next_launch[avd] = time.time() + (min(2 ** failures, RESTART_BACKOFF_MAX) if failures else 0)
+
+    def shutdown(self, serials):
+        for serial in serials:
+            _log(f"{serial}: 終了します")
+            _kill(serial)
+
+    def _beat(self, stop):
+        """stop されるまで (ロックを失うまで) ハートビートを書き込み続ける"""
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                if self.heartbeat() is None:
+                    return
+            except (OSError, TimeoutError) as e:
+                _log(f"⚠️ ハートビートを書き込めませんでした: {e}")
+
+    def run(self):
+        """stop されるまで (ロックを失うまで) 状態の確認を繰り返す"""
+        if self.heartbeat() is None:
+            return
+        stop = threading.Event()
+        beat = threading.Thread(target=self._beat, args=(stop,), daemon=True)
+        beat.start()
+        targets = None
+        try:
+            while _owner() == os.getpid():
+                pool = read_pool()
+                if pool['targets'] != targets:
+                    targets = pool['targets']
+                    self._unprepared.clear()
+                self.trim(pool)
+                for instance in pool['instances'].values():
+                    self.check(instance)
+                self.fill(read_pool())
+                time.sleep(TICK_SECONDS)
+        finally:
+            stop.set()
+            beat.join()
+
+
+def _holder_alive(owner):
+    """ロックを持つ管理プロセスが生きているか (プロセスを確認できない Windows ではハートビートで判断する)"""
+    if platform.system() == "Windows":
+        return is_running()
+    return _pid_alive(owner)
+
+
+def _acquire_service_lock():
+    """管理プロセスのロックを取る。ロックを持つプロセスが終了していれば引き継ぐ
+
+    ロックの古さやハートビートの途切れでは引き継がない (時間のかかる処理中の管理プロセスが2つにならないようにする)。
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _state_lock():
+        for _ in range(2):
+            try:
+                fd = os.open(POOL_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return True
+            except FileExistsError:
+                owner = _owner()
+                if not owner:
+                    # 書き込み途中のロックは、作成したプロセスが書き終えるまで待つ
+                    try:
+                        if time.time() - os.path.getmtime(POOL_LOCK) < HEARTBEAT_TIMEOUT:
+                            return False
+                    except FileNotFoundError:
+                        continue
+                elif _holder_alive(owner):
+                    return False
+                _log(f"終了した管理プロセス (pid {owner}) のロックを引き継ぎます")
+                try:
+                    os.remove(POOL_LOCK)
+                except FileNotFoundError:
+                    pass
+    return False
+
+
+def _release_service_lock():
+    """ロックを手放し、終了させるエミュレータのシリアル番号を返す
+
+    stop された (ロックが削除された) か、まだロックを持っている場合だけプールを空にする。
+    後継の管理プロセスにロックが移っている場合は、そのプロセスが引き継ぐためエミュレータも状態も残す。
+    """
+    with _state_lock():
+        owner = _owner()
+        if owner and owner != os.getpid():
+            _log(f"管理プロセス (pid {owner}) に引き継がれたため、エミュレータは終了しません")
+            return []
+        if owner == os.getpid():
+            os.remove(POOL_LOCK)
+        pool = read_pool() or {'targets': {}, 'instances': {}}
+        serials = list(pool['instances'])
+        # 対象の AVD と台数は残し、次の start で同じ構成に戻せるようにする
+        pool.update({'instances': {}, 'pid': None})
+        _write_pool(pool)
+    return serials
+
+
+def serve():
+    """管理プロセス本体。stop されるまでプールの台数を保つ (終了時にプールのエミュレータも終了する)"""
+    if not _acquire_service_lock():
+        _log("既に実行中のため終了します")
+        return 0
+    if platform.system() == "Linux" and not os.path.exists("/dev/kvm"):
+        _log("⚠️ /dev/kvm がありません。ハードウェア仮想化を使えないため起動に時間がかかります")
+    pool = EmulatorPool()
+    try:
+        _log(f"エミュレータプールを開始します: {(read_pool() or {}).get('targets', {})}")
+        pool.run()
+    finally:
+        pool.shutdown(_release_service_lock())
+    _log("終了しました")
+    return 0
+
+
+def start_pool():
+    """管理プロセスをバックグラウンドで起動する (スクリプトの終了後も動き続ける)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    kwargs = {}
+    if platform.system() == "Windows":
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    with open(LOG_FILE, 'a') as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"], cwd=PROJECT_ROOT,
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+
+
+def ensure_pool(avd, size=None):
+    """avd のエミュレータをプールに加え (size 台、既に加えてあれば台数はそのまま)、管理プロセスを起動する"""
+    def change(pool):
+        if size is not None or avd not in pool['targets']:
+            pool['targets'][avd] = POOL_SIZE if size is None else size
+    _update(change)
+    if not is_running():
+        start_pool()
+        return wait_until("エミュレータプールの起動", is_running, 10, max_interval=0.2) is not None
+    return True
+
+
+def acquire(avd, timeout=BOOT_TIMEOUT, holder_pid=None):
+    """準備のできた avd のエミュレータを1台借りる
+
+    戻り値は貸し出しの情報 ({id, serial, avd, ...})。timeout 秒以内に借りられなければNone。
+    holder_pid のプロセス (省略時はこのプロセス) が終了すると、返却しなくても回収される。
+    """
+    if not ensure_pool(avd):
+        print("⚠️ エミュレータプールを起動できませんでした")
+        return None
+    lease_info = {'id': uuid.uuid4().hex[:12], 'holder_pid': holder_pid or os.getpid(), 'since': time.time()}
+
+    def take(pool):
+        ready = [instance for instance in pool['instances'].values()
+                 if instance['avd'] == avd and instance['state'] == 'ready']
+        if not ready:
+            return None
+        instance = min(ready, key=lambda instance: instance['leases_served'])
+        instance.update({'state': 'leased', 'lease': lease_info})
+        return dict(instance['lease'], serial=instance['serial'], avd=avd, port=instance['port'])
+
+    def take_healthy():
+        # 応答の確認は HEALTH_INTERVAL ごとのため、借りた時点でも確認し、応答が無ければ入れ替えさせて次を待つ
+        info = _update(take)
+        if info and not _booted(info['serial']):
+            _update(lambda pool: pool['instances'].get(info['serial'], {}).update(
+                {'state': 'unhealthy', 'lease': None, 'reason': "貸し出し時に応答がありません"}))
+            return None
+        return info
+    return wait_until(f"エミュレータプールの貸し出し ({avd})", take_healthy, timeout, max_interval=0.5)
+
+
+def release(lease_id):
+    """借りたエミュレータを返す (管理プロセスがスナップショットに戻す)。該当する貸し出しが無ければFalse"""
+    def change(pool):
+        for instance in pool['instances'].values():
+            if instance['state'] == 'leased' and (instance.get('lease') or {}).get('id') == lease_id:
+                instance.update({'state': 'returned', 'lease': None, 'leases_served': instance['leases_served'] + 1})
+                return True
+        return False
+    return _update(change)
+
+
+@contextmanager
+def lease(avd, timeout=BOOT_TIMEOUT):
+    """with lease(avd) as info: の間だけエミュレータを借りる (借りられなければ info はNone)"""
+    info = acquire(avd, timeout)
+    try:
+        yield info
+    finally:
+        if info:
+            release(info['id'])
+
+
+def pool_serials():
+    """プールが管理しているエミュレータのシリアル番号 (通常の起動・選択の対象から外すため)"""
+    pool = read_pool()
+    if not is_running(pool):
+        return set()
+    return set(pool['instances'])
+
+
+def stop_pool():
+    """管理プロセスを終了させる (ロックを削除すると、次の確認でエミュレータを終了してから終了する)"""
+    try:
+        os.remove(POOL_LOCK)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def print_pool(pool):
+    print(f"{'シリアル番号':<16} | {'AVD':<24} | {'状態':<10} | {'貸し出し回数':>6} | 貸し出し先")
+    print("-" * 85)
+    for instance in sorted(pool['instances'].values(), key=lambda instance: instance['port']):
+        lease_info = instance.get('lease')
+        holder = f"pid {lease_info['holder_pid']} ({time.time() - lease_info['since']:.0f}秒)" if lease_info else ""
+        print(f"{instance['serial']:<16} | {instance['avd']:<24} | {instance['state']:<10} | "
+              f"{instance['leases_served']:>6} | {holder}")
+    targets = ", ".join(f"{avd} x{size}" for avd, size in pool['targets'].items()) or "なし"
+    print(f"\n対象: {targets} / 管理プロセス: {'実行中 (pid ' + str(pool['pid']) + ')' if is_running(pool) else '停止中'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動済みの Android エミュレータを貸し出すプール")
+    parser.add_argument('command', nargs='?', default="status",
+                        choices=["status", "start", "stop", "serve", "prepare", "lease", "release"],
+                        help='status: 状態を表示 / start: --avd を --size 台用意 / stop: すべて終了 / '
+                             'prepare: スナップショットを作成 / lease・release: 1台を借りる・返す / serve: フォアグラウンドで実行')
+    parser.add_argument('lease_id', nargs='?', help='release する貸し出しのID')
+    parser.add_argument('--avd', help='対象の AVD 名 (省略時は最初の AVD)')
+    parser.add_argument('--size', type=int, help='start で用意する台数')
+    parser.add_argument('--timeout', type=float, default=BOOT_TIMEOUT, help='lease で待つ時間 (秒)')
+    parser.add_argument('--holder', type=int, help='lease の貸し出し先のプロセスID (省略時は呼び出し元のシェル)')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.command == "serve":
+        return serve()
+    if args.command == "stop":
+        print("✅ エミュレータプールを終了します" if stop_pool() else "エミュレータプールは実行されていません")
+        return 0
+    if args.command == "release":
+        if not args.lease_id:
+            parser.error("release には貸し出しのIDが必要です")
+        if not release(args.lease_id):
+            print(f"エラー: 貸し出し {args.lease_id} が見つかりません")
+            return 1
+        print("✅ 返却しました")
+        return 0
+    if args.command == "status":
+        pool = read_pool()
+        if pool is None:
+            print("エミュレータプールは実行されていません")
+            return 0
+        if args.json:
+            print(json.dumps(pool, ensure_ascii=False, indent=2))
+        else:
+            print_pool(pool)
+        return 0
+
+    avd = args.avd or next(iter(list_avd_names() or []), None)
+    if avd is None:
+        print("エラー: AVD が見つかりません")
+        return 1
+    if args.command == "prepare":
+        return 0 if prepare_snapshot(avd) else 1
+    if args.command == "start":
+        if not ensure_pool(avd, args.size):
+            print("エラー: エミュレータプールを起動できませんでした")
+            return 1
+        print(f"✅ エミュレータプールを実行中です: {avd} x{read_pool()['targets'][avd]} (ログ: {LOG_FILE})")
+        return 0
+    info = acquire(avd, args.timeout, args.holder or os.getppid())
+    if info is None:
+        print(f"エラー: {args.timeout:.0f}秒以内に {avd} のエミュレータを借りられませんでした")
+        return 1
+    print(json.dumps(info, ensure_ascii=False) if args.json else f"{info['serial']} {info['id']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
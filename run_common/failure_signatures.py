@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+
+# 既知の致命的エラーのカタログ
+# 上から順に照合し、最初に一致したものを採用する。
+# keyword は正規表現を評価する前の高速な絞り込みに使う (行にこの文字列が含まれる場合のみ照合)。
+FAILURE_SIGNATURES = [
+    {
+        'id': 'audioplayers_darwin_swift',
+        'category': 'swift_compile',
+        'keyword': 'audioplayers_darwin',
+        'pattern': re.compile(r'audioplayers_darwin[^\s]*/\S+\.swift:\d+:\d+: error: (.+)'),
+        'message': "audioplayers_darwin の Swift コンパイルエラー",
+    },
+    {
+        'id': 'swift_compile_error',
+        'category': 'swift_compile',
+        'keyword': '.swift:',
+        'pattern': re.compile(r'(\S+\.swift):\d+:\d+: error: (.+)'),
+        'message': "Swift コンパイルエラー",
+    },
+    {
+        'id': 'ndk_version_mismatch',
+        'category': 'android_ndk',
+        'keyword': 'disagrees with android.ndkVersion',
+        'pattern': re.compile(r'NDK from ndk\.dir at .+ had version \[([0-9.]+)\] '
+                              r'which disagrees with android\.ndkVersion \[([0-9.]+)\]'),
+        'message': "NDK バージョン不一致 (ndk.dir と android.ndkVersion)",
+    },
+    {
+        'id': 'cocoapods_incompatible_versions',
+        'category': 'cocoapods',
+        'keyword': 'CocoaPods could not find compatible versions',
+        'pattern': re.compile(r'CocoaPods could not find compatible versions for pod "([^"]+)"'),
+        'message': "CocoaPods の依存バージョンが解決できません",
+    },
+    {
+        'id': 'cocoapods_spec_not_found',
+        'category': 'cocoapods',
+        'keyword': 'Unable to find a specification for',
+        'pattern': re.compile(r'Unable to find a specification for [`"]?([^`"\s]+)'),
+        'message': "CocoaPods の spec が見つかりません",
+    },
+    {
+        'id': 'cocoapods_invalid_podspec',
+        'category': 'cocoapods',
+        'keyword': 'podspec',
+        'pattern': re.compile(r'\[!\] (?:Invalid|Failed to load) [`\']?(\S+\.podspec)'),
+        'message': "podspec ファイルが不正です",
+    },
+]
+
+
+class FailureMatcher:
+    """出力行を既知の致命的エラーのカタログと照合する"""
+
+    def __init__(self, signatures=None):
+        self.signatures = FAILURE_SIGNATURES if signatures is None else signatures
+        self.failure = None
+
+    def check(self, line):
+        """行を照合し、一致した場合は分類結果の辞書を返す (最初の一致のみ記録する)"""
+        if self.failure is not None:
+            return self.failure
+        for signature in self.signatures:
+            if signature['keyword'] not in line:
+                continue
+            match = signature['pattern'].search(line)
+            if match:
+                self.failure = {
+                    'id': signature['id'],
+                    'category': signature['category'],
+                    'message': signature['message'],
+                    'groups': match.groups(),
+                    'line': line.rstrip('\n'),
+                }
+                return self.failure
+        return None
+
+
+def classify_output(text, signatures=None):
+    """出力全体を照合し、最初に一致した分類結果を返す (一致しなければNone)"""
+    matcher = FailureMatcher(signatures)
+    for line in text.splitlines():
+        if matcher.check(line):
+            break
+    return matcher.failure
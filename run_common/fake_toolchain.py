@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import hashlib
+import tempfile
+
+# run_common/fake_bin の flutter / adb / emulator / pod / xcrun から呼び出される簡易版のツールチェーン。
+# 実機やSDKの無い環境 (Linux など) でスクリプトの処理そのものを計測・確認するために使う。
+# 環境変数 FAKE_TOOLCHAIN=1 で実行すると、各スクリプトの main が (command_runner.enable_fake_toolchain で) PATH の先頭に fake_bin を追加する。
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# ビルド系コマンドが出力する行数と、1秒あたりの出力行数 (0は制限なし)
+OUTPUT_LINES = _env_int("FAKE_OUTPUT_LINES", "2000")
+LINE_RATE = float(os.environ.get("FAKE_LINE_RATE", "0"))
+# 1回の実行ごとに待つ時間 (ミリ秒)。FAKE_<ツール名>_LATENCY_MS (例: FAKE_XCRUN_LATENCY_MS) でツールごとに指定できる
+LATENCY_MS = _env_int("FAKE_LATENCY_MS", "0")
+
+# デバイスの台数 (AVD、起動済みのエミュレータ、シミュレータ、接続済みの実機)
+AVD_COUNT = _env_int("FAKE_AVD_COUNT", "4")
+RUNNING_EMULATORS = _env_int("FAKE_RUNNING_EMULATORS", "1")
+SIMULATOR_COUNT = _env_int("FAKE_SIMULATOR_COUNT", "12")
+PHYSICAL_DEVICES = _env_int("FAKE_DEVICE_COUNT", "1")
+
+# アプリのインストールにかかる時間 (ミリ秒、adb install・simctl install・devicectl device install)
+INSTALL_MS = _env_int("FAKE_INSTALL_MS", "0")
+
+# 失敗させるコマンドの先頭部分 (カンマ区切り、例: "flutter build,pod install") と失敗させる確率
+FAIL_COMMANDS = [item.strip() for item in os.environ.get("FAKE_FAIL", "").split(",") if item.strip()]
+FAIL_RATE = float(os.environ.get("FAKE_FAIL_RATE", "1.0"))
+
+# 起動したエミュレータ・シミュレータを記録するファイル (ツールの呼び出しをまたいで状態を保つ)
+STATE_FILE = os.environ.get("FAKE_TOOLCHAIN_STATE") or os.path.join(tempfile.gettempdir(), "fake_toolchain_state.json")
+
+FLUTTER_VERSION = "3.29.3"
+DART_VERSION = "3.7.2"
+POD_VERSION = "1.16.2"
+
+IOS_RUNTIMES = ["17-5", "18-2"]
+SIMULATOR_MODELS = ["iPhone 15", "iPhone 15 Pro", "iPhone 16", "iPhone 16 Pro Max", "iPad Air 11-inch (M2)",
+                    "iPad Pro 13-inch (M4)"]
+APK_ABIS = {'android-arm': "armeabi-v7a", 'android-arm64': "arm64-v8a", 'android-x64': "x86_64"}
+
+# 失敗させた場合に出力するエラー (failure_signatures.py のカタログに一致するもの)
+FAILURE_LINES = {
+    'flutter build apk': "NDK from ndk.dir at /sdk/ndk/25.1.8937393 had version [25.1.8937393] "
+                         "which disagrees with android.ndkVersion [27.0.12077973]",
+    'flutter build ios': "/pub-cache/hosted/pub.dev/audioplayers_darwin-5.0.2/ios/Classes/"
+                         "SwiftAudioplayersDarwinPlugin.swift:12:8: error: cannot find type 'AudioContext' in scope",
+    'pod install': "[!] CocoaPods could not find compatible versions for pod \"Flutter\"",
+}
+
+
+def _uuid(kind, index):
+    """種類と番号から決まった UDID を作る (実行ごとに同じ値にする)"""
+    value = hashlib.md5(f"{kind}:{index}".encode()).hexdigest().upper()
+    return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:32]}"
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'emulators': [], 'simulators': []}
+
+
+def save_state(state):
+    tmp_path = f"{STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def emit(lines, rate=None, stream=None):
+    """lines を出力する。rate (行/秒) を指定した場合はその速さに合わせて出力する"""
+    stream = stream or sys.stdout
+    rate = LINE_RATE if rate is None else rate
+    start = time.time()
+    for count, line in enumerate(lines, 1):
+        stream.write(line + "\n")
+        if rate > 0 and count % 50 == 0:
+            stream.flush()
+            delay = start + count / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+    stream.flush()
+
+
+def should_fail(tool, args):
+    """FAKE_FAIL に一致するコマンドかどうか (FAKE_FAIL_RATE の確率で失敗させる)"""
+    command = " ".join([tool] + args)
+    if not any(command.startswith(prefix) for prefix in FAIL_COMMANDS):
+        return False
+    return random.random() < FAIL_RATE
+
+
+def fail(tool, args, partial_lines=()):
+    """途中までの出力と既知のエラーを出力して失敗する"""
+    command = " ".join([tool] + args)
+    emit(list(partial_lines))
+    message = next((line for prefix, line in FAILURE_LINES.items() if command.startswith(prefix)),
+                   f"{tool}: simulated failure")
+    print(message, file=sys.stderr)
+    return 1
+
+
+def build_log_lines(tool, count):
+    """ビルド中の出力に似た行を count 行作る"""
+    if tool == "pod":
+        templates = ["Installing Plugin{0} (1.{1}.0)", "-> Generating Pods project for target {0}",
+                     "Analyzing dependencies for Plugin{0}", "Downloading dependencies ({1}/{0})"]
+    elif tool == "xcode":
+        templates = ["CompileSwift normal arm64 /src/ios/Runner/File{0}.swift (in target 'Runner')",
+                     "Ld /build/ios/Debug-iphoneos/Plugin{1}.framework/Plugin{1} normal",
+                     "CodeSign /build/ios/Debug-iphoneos/Runner.app/Frameworks/Plugin{1}.framework",
+                     "ProcessInfoPlistFile /build/ios/Debug-iphoneos/Plugin{1}.framework/Info.plist"]
+    else:
+        templates = ["> Task :app:compileFlutterBuildRelease{0} UP-TO-DATE",
+                     "[  +{1} ms] executing: [/src/android/] ./gradlew -Pverbose=true assembleRelease",
+                     "> Task :plugin{1}:compileReleaseKotlin FROM-CACHE",
+                     "[        ] w: /src/lib/file{0}.dart: unused import (warning {1})"]
+    return [templates[i % len(templates)].format(i, i % 97) for i in range(count)]
+
+
+def _option(args, name, default=None):
+    for index, arg in enumerate(args):
+        if arg == name and index + 1 < len(args):
+            return args[index + 1]
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def _write_output(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def write_build_outputs(target, args):
+    """flutter build と同じ場所に成果物 (中身はダミー) を作り、作ったパスを返す"""
+    mode = "debug" if "--debug" in args else "profile" if "--profile" in args else "release"
+    stamp = f"fake {target} {mode} {time.time()}\n"
+    if target in ("apk", "appbundle"):
+        if "--split-per-abi" in args:
+            platforms = (_option(args, "--target-platform") or ",".join(APK_ABIS)).split(",")
+            paths = [os.path.join("build", "app", "outputs", "flutter-apk", f"app-{APK_ABIS[name]}-{mode}.apk")
+                     for name in platforms if name in APK_ABIS]
+        else:
+            paths = [os.path.join("build", "app", "outputs", "flutter-apk", f"app-{mode}.apk")]
+    elif target == "ios":
+        directory = "iphonesimulator" if "--simulator" in args else "iphoneos"
+        paths = [os.path.join("build", "ios", directory, "Runner.app", name) for name in ("Runner", "Info.plist")]
+    elif target == "web":
+        paths = [os.path.join("build", "web", name) for name in ("index.html", "main.dart.js", "flutter.js")]
+    else:
+        return []
+    for path in paths:
+        _write_output(path, stamp)
+    return paths
+
+
+def fake_flutter(args):
+    if not args or args[0] in ("--version", "version"):
+        if "--machine" in args:
+            print(json.dumps({'frameworkVersion': FLUTTER_VERSION, 'channel': "stable",
+                              'dartSdkVersion': DART_VERSION}))
+        else:
+            print(f"Flutter {FLUTTER_VERSION} • channel stable • https://github.com/flutter/flutter.git")
+            print(f"Tools • Dart {DART_VERSION} • DevTools 2.42.3")
+        return 0
+    command = args[0]
+    if command == "doctor":
+        emit(["Doctor summary (to see all details, run flutter doctor -v):",
+              f"[✓] Flutter (Channel stable, {FLUTTER_VERSION})",
+              "[✓] Android toolchain - develop for Android devices", "[✓] Xcode - develop for iOS and macOS",
+              "[✓] Chrome - develop for the web", "", "• No issues found!"])
+        return 0
+    if command == "pub":
+        if should_fail("flutter", args):
+            return fail("flutter", args)
+        emit(["Resolving dependencies..."] + [f"  package_{i} 1.{i}.0" for i in range(40)] + ["Got dependencies!"])
+        return 0
+    if command == "build":
+        target = args[1] if len(args) > 1 else "apk"
+        lines = build_log_lines("xcode" if target in ("ios", "ipa") else "flutter", OUTPUT_LINES)
+        if should_fail("flutter", args):
+            return fail("flutter", args, lines[:len(lines) // 2])
+        emit(lines)
+        if "-v" in args and target in ("apk", "appbundle"):
+            print(f"BUILD SUCCESSFUL in 12s\n{OUTPUT_LINES // 10} actionable tasks: "
+                  f"{OUTPUT_LINES // 40} executed, {OUTPUT_LINES // 20} from cache, "
+                  f"{OUTPUT_LINES // 10 - OUTPUT_LINES // 40 - OUTPUT_LINES // 20} up-to-date")
+        for path in write_build_outputs(target, args):
+            print(f"✓ Built {path}")
+        return 0
+    if command == "devices":
+        emulators = running_emulators()
+        print(f"Found {len(emulators) + 1} connected devices:")
+        for serial in emulators:
+            print(f"  sdk gphone64 arm64 (mobile) • {serial} • android-arm64 • Android 15 (API 35)")
+        print("  Chrome (web)                 • chrome        • web-javascript • Google Chrome 126.0")
+        return 0
+    if command == "run":
+        return fake_flutter_run(args)
+    # clean, config, create, precache など出力の少ないコマンド
+    print(f"Running \"flutter {command}\"...")
+    return 0
+
+
+def fake_flutter_run(args):
+    """flutter run の対話操作 (r: ホットリロード、R: ホットリスタート、q: 終了) を再現する"""
+    if should_fail("flutter", args):
+        return fail("flutter", args)
+    emit(build_log_lines("flutter", min(OUTPUT_LINES, 200)))
+    port = _option(args, "--web-port")
+    if port:
+        # Webのデバイスでは開発用サーバーのポートを開いたままにする (終了時に閉じる)
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", int(port)))
+        server.listen()
+    print("Syncing files to device... 412ms")
+    print("Flutter run key commands.\nr Hot reload. 🔥🔥🔥\nR Hot restart.\nq Quit (terminate the application).",
+          flush=True)
+    for line in sys.stdin:
+        key = line.strip()
+        if key == "r":
+            time.sleep(0.05)
+            print("Performing hot reload...\nReloaded 3 of 812 libraries in 123ms (compile: 40 ms, reload: 50 ms).",
+                  flush=True)
+        elif key == "R":
+            time.sleep(0.1)
+            print("Performing hot restart...\nRestarted application in 321ms.", flush=True)
+        elif key == "q":
+            print("Application finished.", flush=True)
+            return 0
+    return 0
+
+
+def _started_emulators(state=None):
+    """emulator -avd で起動したエミュレータ ({serial, avd, read_only, ready_at} の一覧)"""
+    state = state or load_state()
+    return [entry for entry in state['emulators'] if isinstance(entry, dict)]
+
+
+def running_emulator_avds():
+    """起動中のエミュレータのシリアル番号と AVD 名の対応 (起動した順)"""
+    names = avd_names()
+    avds = {f"emulator-{5554 + index * 2}": names[index % len(names)] if names else ""
+            for index in range(RUNNING_EMULATORS)}
+    for entry in _started_emulators():
+        avds[entry['serial']] = entry['avd']
+    return avds
+
+
+def running_emulators():
+    """起動中のエミュレータのシリアル番号 (emulator-5554 など)"""
+    return list(running_emulator_avds())
+
+
+def _emulator_booted(serial):
+    """起動にかかる時間 (FAKE_EMULATOR_BOOT_MS など) が経過したかどうか"""
+    entry = next((entry for entry in _started_emulators() if entry['serial'] == serial), None)
+    return entry is None or time.time() >= entry.get('ready_at', 0)
+
+
+def _adb_device_lines():
+    return ([f"{serial}\t{'device' if _emulator_booted(serial) else 'offline'}" for serial in running_emulators()]
+            + [f"R5CT{index:08d}\tdevice" for index in range(PHYSICAL_DEVICES)])
+
+
+def track_devices():
+    """adb track-devices と同じく、接続デバイスが変わるたびに長さ (16進4桁) 付きの一覧を出力する"""
+    parent = os.getppid()
+    previous = None
+    while os.getppid() == parent:
+        payload = "".join(line + "\n" for line in _adb_device_lines())
+        if payload != previous:
+            sys.stdout.write(f"{len(payload.encode()):04x}{payload}")
+            sys.stdout.flush()
+            previous = payload
+        time.sleep(0.2)
+    return 0
+
+
+def fake_adb(args):
+    if should_fail("adb", args):
+        return fail("adb", args)
+    serial = None
+    if args[:1] == ["-s"]:
+        serial, args = args[1] if len(args) > 1 else None, args[2:]
+    if args[:2] == ["devices", "-l"]:
+        # 実機は4ポートのハブ (1-1.1〜1-1.4、1-2.1〜) に順に接続されているものとする
+        lines = [f"{serial:<22} {'device' if _emulator_booted(serial) else 'offline'} product:sdk_gphone64_x86_64 "
+                 f"model:sdk_gphone64_x86_64 device:emu64xa transport_id:{index + 1}"
+                 for index, serial in enumerate(running_emulators())]
+        lines += [f"{f'R5CT{index:08d}':<22} device usb:1-{index // 4 + 1}.{index % 4 + 1} product:dm1qxxx "
+                  f"model:SM_S911B device:dm1q transport_id:{100 + index}" for index in range(PHYSICAL_DEVICES)]
+        emit(["List of devices attached"] + lines + [""])
+        return 0
+    if args and args[0] == "devices":
+        emit(["List of devices attached"] + _adb_device_lines() + [""])
+        return 0
+    if args and args[0] == "track-devices":
+        return track_devices()
+    if serial and args[:1] in (["shell"], ["emu"], ["install"]) and not any(line.startswith(serial + "\t")
+                                                             for line in _adb_device_lines()):
+        print(f"error: device '{serial}' not found", file=sys.stderr)
+        return 1
+    if args and args[0] == "shell":
+        if "sys.boot_completed" in args:
+            print("1" if _emulator_booted(serial) else "")
+        elif "init.svc.bootanim" in args:
+            print("stopped" if _emulator_booted(serial) else "running")
+        elif "ro.product.cpu.abilist" in args:
+            print("x86_64,arm64-v8a" if serial and serial.startswith("emulator-") else "arm64-v8a,armeabi-v7a,armeabi")
+        elif args[1:3] == ["am", "start"]:
+            component = _option(args, "-n", "")
+            print(f"Starting: Intent {{ cmp={component} }}\nStatus: ok\nLaunchState: COLD\nActivity: {component}\n"
+                  f"TotalTime: {random.randint(600, 1200)}\nWaitTime: 1250\nComplete")
+        elif "ro.product.model" in args:
+            print("sdk_gphone64_arm64" if serial and serial.startswith("emulator-") else "SM-S911B")
+        else:
+            print("")
+        return 0
+    if args[:3] == ["emu", "avd", "name"]:
+        name = running_emulator_avds().get(serial)
+        if name is None:
+            print(f"error: device '{serial}' not found", file=sys.stderr)
+            return 1
+        print(f"{name}\nOK")
+        return 0
+    if args[:4] in (["emu", "avd", "snapshot", "save"], ["emu", "avd", "snapshot", "load"]) and len(args) > 4:
+        return emulator_snapshot(serial, args[3], args[4])
+    if args[:2] == ["emu", "kill"]:
+        state = load_state()
+        started = _started_emulators(state)
+        if serial:
+            started = [entry for entry in started if entry['serial'] != serial]
+        state['emulators'] = started if serial else started[:-1]
+        save_state(state)
+        print("OK: killing emulator, bye bye")
+        return 0
+    if args and args[0] == "install":
+        if not os.path.exists(args[-1]):
+            print(f"adb: failed to stat {args[-1]}: No such file or directory", file=sys.stderr)
+            return 1
+        time.sleep(INSTALL_MS / 1000)
+        print("Performing Streamed Install\nSuccess")
+        return 0
+    if args and args[0] == "version":
+        print("Android Debug Bridge version 1.0.41")
+        return 0
+    return 0
+
+
+def avd_names():
+    return [f"Pixel_{index % 9 + 1}_API_{30 + index % 6}" + (f"_{index}" if index >= 9 else "")
+            for index in range(AVD_COUNT)]
+
+
+def fake_emulator(args):
+    if should_fail("emulator", args):
+        return fail("emulator", args)
+    if "-list-avds" in args:
+        emit(avd_names())
+        return 0
+    name = _option(args, "-avd")
+    if name:
+        if name not in avd_names():
+            print(f"PANIC: Unknown AVD name [{name}], use -list-avds to see valid values.", file=sys.stderr)
+            return 1
+        state = load_state()
+        started = _started_emulators(state)
+        running = running_emulator_avds()
+        writable = {serial: avd for serial, avd in running.items()
+                    if not any(entry['serial'] == serial and entry['read_only'] for entry in started)}
+        if name in writable.values() and "-read-only" not in args:
+            print("ERROR   | Running multiple emulators with the same AVD is an experimental feature. "
+                  "Please use -read-only flag to enable this feature.", file=sys.stderr)
+            return 1
+        port = _option(args, "-port")
+        if port is None:
+            port = next(port for port in range(5554, 5682, 2) if f"emulator-{port}" not in running)
+        serial = f"emulator-{port}"
+        if serial in running:
+            print(f"ERROR   | console port {port} is busy", file=sys.stderr)
+            return 1
+        snapshot = _option(args, "-snapshot")
+        from_snapshot = snapshot and snapshot in state.get('snapshots', {}).get(name, [])
+        boot_ms = _env_int("FAKE_SNAPSHOT_BOOT_MS" if from_snapshot else "FAKE_EMULATOR_BOOT_MS", "0")
+        started.append({'avd': name, 'serial': serial, 'read_only': "-read-only" in args,
+                        'ready_at': time.time() + boot_ms / 1000})
+        state['emulators'] = started
+        save_state(state)
+    print("INFO    | Android emulator version 35.2.10.0")
+    return 0
+
+
+def emulator_snapshot(serial, action, name):
+    """adb emu avd snapshot save / load (結果は OK / KO: で出力する)"""
+    state = load_state()
+    entry = next((entry for entry in _started_emulators(state) if entry['serial'] == serial), None)
+    if entry is None:
+        print(f"error: device '{serial}' not found", file=sys.stderr)
+        return 1
+    snapshots = state.setdefault('snapshots', {}).setdefault(entry['avd'], [])
+    if action == "save":
+        if entry['read_only']:
+            print("KO: Snapshot save is not supported in read-only mode")
+            return 0
+        if name not in snapshots:
+            snapshots.append(name)
+        save_state(state)
+        avd_dir = os.path.expanduser(f"~/.android/avd/{entry['avd']}.avd")
+        if os.path.isdir(avd_dir):
+            _write_output(os.path.join(avd_dir, "snapshots", name, "snapshot.pb"), "")
+    elif name not in snapshots:
+        print(f"KO: snapshot '{name}' does not exist")
+        return 0
+    else:
+        entry['ready_at'] = time.time() + _env_int("FAKE_SNAPSHOT_LOAD_MS", "0") / 1000
+        save_state(state)
+    print("OK")
+    return 0
+
+
+def fake_pod(args):
+    if not args or args[0] == "--version":
+        print(POD_VERSION)
+        return 0
+    if args[0] in ("install", "update"):
+        lines = build_log_lines("pod", OUTPUT_LINES // 4)
+        if should_fail("pod", args):
+            return fail("pod", args, lines[:len(lines) // 2])
+        _install_pods(os.getcwd())
+        emit(lines + ["Pod installation complete!"])
+        return 0
+    return 0
+
+
+def _install_pods(ios_dir):
+    """カレントディレクトリ (ios/) に最小限の Pods を作り、実行回数を記録する (キャッシュの確認用)"""
+    try:
+        with open(os.path.join(ios_dir, "Podfile.lock"), 'r') as f:
+            manifest = f.read()
+    except OSError:
+        manifest = "PODFILE CHECKSUM: fake\n"
+    files = {
+        "Manifest.lock": manifest,
+        "Pods.xcodeproj/project.pbxproj": "// !$*UTF8*$!\n{ archiveVersion = 1; }\n",
+        "Target Support Files/Pods-Runner/Pods-Runner.debug.xcconfig": "FRAMEWORK_SEARCH_PATHS = $(inherited)\n",
+        "Flutter/Flutter.h": "// fake Flutter header\n",
+    }
+    for relative, content in files.items():
+        path = os.path.join(ios_dir, "Pods", relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+    state = load_state()
+    state['pod_installs'] = state.get('pod_installs', 0) + 1
+    save_state(state)
+
+
+def simulator_devices():
+    """simctl list devices --json と同じ形式の辞書を作る"""
+    booted = set(load_state()['simulators'])
+    devices = {}
+    for index in range(SIMULATOR_COUNT):
+        runtime = f"com.apple.CoreSimulator.SimRuntime.iOS-{IOS_RUNTIMES[index % len(IOS_RUNTIMES)]}"
+        udid = _uuid("simulator", index)
+        devices.setdefault(runtime, []).append({
+            'udid': udid,
+            'name': SIMULATOR_MODELS[index % len(SIMULATOR_MODELS)] + (f" ({index})" if index >= 6 else ""),
+            'state': "Booted" if index == 0 or udid in booted else "Shutdown",
+            'isAvailable': True,
+            'deviceTypeIdentifier': "com.apple.CoreSimulator.SimDeviceType.iPhone-15",
+        })
+    return {'devices': devices}
+
+
+def fake_simctl(args):
+    if args[:1] == ["list"]:
+        if args[1:2] == ["runtimes"]:
+            for runtime in IOS_RUNTIMES:
+                print(f"iOS {runtime.replace('-', '.')} (22C150) - com.apple.CoreSimulator.SimRuntime.iOS-{runtime}")
+            return 0
+        if "--json" in args or "-j" in args:
+            print(json.dumps(simulator_devices(), indent=2))
+            return 0
+        for runtime, devices in simulator_devices()['devices'].items():
+            print(f"-- iOS {runtime.rsplit('iOS-', 1)[-1].replace('-', '.')} --")
+            emit([f"    {d['name']} ({d['udid']}) ({d['state']})" for d in devices])
+        return 0
+    if args[:1] in (["boot"], ["shutdown"]) and len(args) > 1:
+        udids = {d['udid'] for devices in simulator_devices()['devices'].values() for d in devices}
+        if args[1] not in udids:
+            print(f"Invalid device: {args[1]}", file=sys.stderr)
+            return 1
+        state = load_state()
+        booted = [udid for udid in state['simulators'] if udid != args[1]]
+        state['simulators'] = booted + [args[1]] if args[0] == "boot" else booted
+        save_state(state)
+        return 0
+    if args[:1] == ["create"]:
+        print(_uuid("created", args[1] if len(args) > 1 else ""))
+        return 0
+    if args[:1] == ["bootstatus"]:
+        print("Device already booted, nothing to do.")
+        return 0
+    if args[:1] == ["install"]:
+        time.sleep(INSTALL_MS / 1000)
+        return 0
+    if args[:1] == ["launch"]:
+        print(f"{args[-1]}: {random.randint(20000, 60000)}")
+        return 0
+    return 0
+
+
+def fake_xcrun(args):
+    if should_fail("xcrun", args):
+        return fail("xcrun", args)
+    if args[:1] == ["simctl"]:
+        return fake_simctl(args[1:])
+    if args[:3] == ["xctrace", "list", "devices"]:
+        lines = ["== Devices ==", "build-mac (00006000-000A1B2C3D4E5F60)"]
+        lines += [f"iPhone {13 + index % 4} ({17 + index % 2}.{index % 6}) ({_uuid('device', index)})"
+                  for index in range(PHYSICAL_DEVICES)]
+        lines += ["", "== Simulators =="]
+        lines += [f"{d['name']} Simulator (17.5) ({d['udid']})"
+                  for devices in simulator_devices()['devices'].values() for d in devices]
+        emit(lines)
+        return 0
+    if args[:3] == ["devicectl", "device", "install"]:
+        time.sleep(INSTALL_MS / 1000)
+        print(f"App installed:\n• bundleID: com.example.app\n• installationURL: file://{args[-1]}")
+        return 0
+    if args[:3] == ["devicectl", "device", "process"]:
+        print(f"Launched application with {args[-1]} bundle identifier.")
+        return 0
+    return 0
+
+
+def prepare_home(home):
+    """簡易版のツールに合わせたホームディレクトリ (Android SDK・NDK、AVD、pub キャッシュ) を作る
+
+    スクリプトは ~/Android/Sdk や ~/.android/avd を直接参照するため、HOME をこのディレクトリにして実行する。
+    """
+    ndk_dir = os.path.join(home, "Android", "Sdk", "ndk", "27.0.12077973")
+    _write_output(os.path.join(ndk_dir, "source.properties"), "Pkg.Desc = Android NDK\nPkg.Revision = 27.0.12077973\n")
+    for name in avd_names():
+        avd_dir = os.path.join(home, ".android", "avd")
+        _write_output(os.path.join(avd_dir, f"{name}.ini"), f"avd.ini.encoding=UTF-8\npath={avd_dir}/{name}.avd\n")
+        _write_output(os.path.join(avd_dir, f"{name}.avd", "config.ini"),
+                      "".join(f"hw.option{i}=yes\n" for i in range(40))
+                      + f"hw.device.name={name.split('_API')[0].lower()}\nhw.ramSize=2048\n"
+                      + "target=android-33\nabi.type=x86_64\n")
+    classes_dir = os.path.join(home, ".pub-cache", "hosted", "pub.dev", "audioplayers_darwin-5.0.2", "ios", "Classes")
+    for name in ("SwiftAudioplayersDarwinPlugin.swift", "AudioPlayersStreamHandler.swift",
+                 "WrappedMediaPlayer.swift", "AudioContext.swift"):
+        _write_output(os.path.join(classes_dir, name), "import Foundation\n" * 200)
+    return home
+
+
+TOOLS = {
+    'flutter': fake_flutter,
+    'adb': fake_adb,
+    'emulator': fake_emulator,
+    'pod': fake_pod,
+    'xcrun': fake_xcrun,
+}
+
+
+def main(tool, args):
+    latency = _env_int(f"FAKE_{tool.upper()}_LATENCY_MS", LATENCY_MS)
+    if latency > 0:
+        time.sleep(latency / 1000)
+    try:
+        return TOOLS[tool](args)
+    except BrokenPipeError:
+        return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "prepare-home":
+        print(f"✅ 簡易版のツール用のホームディレクトリを作成しました: {prepare_home(sys.argv[2])}")
+        sys.exit(0)
+    if len(sys.argv) < 2 or sys.argv[1] not in TOOLS:
+        print(f"使い方: fake_toolchain.py <{'|'.join(TOOLS)}> [引数...] | prepare-home <ディレクトリ>")
+        print("環境変数: FAKE_OUTPUT_LINES, FAKE_LINE_RATE, FAKE_LATENCY_MS, FAKE_<TOOL>_LATENCY_MS, "
+              "FAKE_AVD_COUNT, FAKE_RUNNING_EMULATORS, FAKE_SIMULATOR_COUNT, FAKE_DEVICE_COUNT, "
+              "FAKE_FAIL, FAKE_FAIL_RATE, FAKE_INSTALL_MS, FAKE_EMULATOR_BOOT_MS, FAKE_SNAPSHOT_BOOT_MS, FAKE_SNAPSHOT_LOAD_MS, "
+              "FAKE_TOOLCHAIN_STATE")
+        sys.exit(2)
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import gzip
+import argparse
+
+from command_runner import execute_command, PROJECT_ROOT, enable_fake_toolchain
+
+ANDROID_DIR = os.path.join(PROJECT_ROOT, "android")
+GRADLE_PROPERTIES = os.path.join(ANDROID_DIR, "gradle.properties")
+
+# android/gradle.properties の中でこのスクリプトが管理する範囲 (範囲外の設定には触れない)
+MANAGED_BEGIN = "# >>> run_common/gradle_tuning.py が管理する設定 (手動で編集しないでください) >>>"
+MANAGED_END = "# <<< run_common/gradle_tuning.py <<<"
+MANAGED_PROPERTIES = {
+    # デーモンを常駐させ、連続したビルドでJVMの起動とウォームアップを省く
+    'org.gradle.daemon': "true",
+    # 3時間アイドルでも終了させない (既定値の3時間と同じだが明示しておく)
+    'org.gradle.daemon.idletimeout': "10800000",
+    # タスクの出力をビルドキャッシュから再利用する
+    'org.gradle.caching': "true",
+    # 独立したサブプロジェクト (プラグイン) を並列に構成・実行する
+    'org.gradle.parallel': "true",
+    # ファイルシステムの監視で変更検出を高速化する
+    'org.gradle.vfs.watch': "true",
+}
+
+# ローカルビルドキャッシュの上限 (MB)。環境変数 GRADLE_BUILD_CACHE_MAX_MB で変更できる
+BUILD_CACHE_MAX_MB = int(os.environ.get("GRADLE_BUILD_CACHE_MAX_MB", "5120"))
+
+# Gradle のタスク実行結果の集計行 (flutter の詳細出力に含まれる)
+_ACTIONABLE_RE = re.compile(r'(\d+) actionable tasks?: (.+)')
+_OUTCOME_RE = re.compile(r'(\d+) (executed|from cache|up-to-date)')
+
+
+def strip_managed_block(content):
+    """gradle.properties の内容から、このモジュールが管理する範囲を取り除いたものを返す"""
+    begin, end = content.find(MANAGED_BEGIN), content.find(MANAGED_END)
+    if begin == -1 or end == -1:
+        return content
+    return content[:begin] + content[end + len(MANAGED_END):].lstrip("\n")
+
+
+def gradle_user_home():
+    return os.environ.get("GRADLE_USER_HOME") or os.path.expanduser("~/.gradle")
+
+
+def build_cache_dir():
+    """Gradle のローカルビルドキャッシュのディレクトリ"""
+    return os.path.join(gradle_user_home(), "caches", "build-cache-1")
+
+
+def ensure_gradle_properties(path=GRADLE_PROPERTIES):
+    """gradle.properties の管理範囲を最新の設定に更新する。変更した場合はTrueを返す
+
+    管理範囲の外で同じキーが設定されている場合は、利用者の設定を優先してそのキーは書き込まない。
+    """
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r') as f:
+        content = f.read()
+
+    outside = strip_managed_block(content)
+    user_keys = {line.split("=", 1)[0].strip() for line in outside.splitlines()
+                 if "=" in line and not line.lstrip().startswith("#")}
+
+    lines = [MANAGED_BEGIN]
+    lines += [f"{key}={value}" for key, value in MANAGED_PROPERTIES.items() if key not in user_keys]
+    lines.append(MANAGED_END)
+    block = "\n".join(lines) + "\n"
+
+    updated = outside.rstrip("\n") + "\n" + block if outside.strip() else block
+    if updated == content:
+        return False
+    with open(path, 'w') as f:
+        f.write(updated)
+    print("⚙️ android/gradle.properties のビルドキャッシュ・デーモン設定を更新しました")
+    return True
+
+
+def warm_gradle_daemon():
+    """Gradle デーモンを事前に起動し、プロジェクトの構成まで済ませておく
+
+    ビルドと同時に実行するとデーモンが使用中になり別のデーモンが起動してしまうため、
+    ビルドの前 (事前チェックなど) に完了させること。
+    """
+    gradlew = os.path.join(ANDROID_DIR, "gradlew.bat" if os.name == 'nt' else "gradlew")
+    if not os.path.exists(gradlew):
+        # gradlew は初回の flutter build で生成される
+        print("gradlew がまだ生成されていないため、デーモンの事前起動をスキップします")
+        return True
+    result = execute_command(f"\"{gradlew}\" --daemon -q help", show_output=False, timeout=300, cwd=ANDROID_DIR)
+    if result['success']:
+        print(f"🔥 Gradle デーモンを準備しました ({result['duration']:.1f}秒)")
+    else:
+        print("⚠️ Gradle デーモンの事前起動に失敗しました (ビルド時に起動します)")
+    return True
+
+
+def stop_gradle_daemon():
+    gradlew = os.path.join(ANDROID_DIR, "gradlew.bat" if os.name == 'nt' else "gradlew")
+    if os.path.exists(gradlew):
+        execute_command(f"\"{gradlew}\" --stop", show_output=True, cwd=ANDROID_DIR)
+
+
+def parse_task_outcomes(lines):
+    """Gradle の出力からタスクの実行結果を集計する (集計行が無ければNone)"""
+    stats = None
+    for line in lines:
+        match = _ACTIONABLE_RE.search(line)
+        if not match:
+            continue
+        stats = {'actionable': int(match.group(1)), 'executed': 0, 'from_cache': 0, 'up_to_date': 0}
+        for count, outcome in _OUTCOME_RE.findall(match.group(2)):
+            stats[outcome.replace(" ", "_").replace("-", "_")] = int(count)
+    if stats is not None:
+        cacheable = stats['executed'] + stats['from_cache']
+        stats['hit_rate'] = stats['from_cache'] / cacheable if cacheable else 1.0
+    return stats
+
+
+def _read_log_lines(log_path):
+    try:
+        with gzip.open(log_path, 'rt', errors='replace') as f:
+            for line in f:
+                yield line
+    except OSError:
+        return
+
+
+def run_gradle_build(command, description, log_name, verbose=False, show_progress=True, **kwargs):
+    """flutter build をGradleの詳細出力付きで実行し、(結果の辞書, タスク集計) を返す
+
+    flutter は通常 Gradle を -q で実行するため、集計行を得るために -v を付けて全出力をログに残す。
+    画面には verbose の場合のみ出力し、それ以外は show_progress に従ってプログレス表示にする。
+    """
+    result = execute_command(f"{command} -v", description, show_output=verbose,
+                             show_progress=show_progress and not verbose,
+                             log_name=log_name, **kwargs)
+    stats = parse_task_outcomes(_read_log_lines(result['log_path'])) if result.get('log_path') else None
+    if not result['success'] and not verbose:
+        # 詳細出力は表示していないため、失敗時は末尾だけを表示する
+        tail = (result['stderr'] or result['stdout']).splitlines()[-30:]
+        print("\n".join(tail))
+    return result, stats
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def prune_build_cache(max_mb=None):
+    """ローカルビルドキャッシュを上限以下になるまで古いエントリから削除する。削除した件数を返す"""
+    max_mb = BUILD_CACHE_MAX_MB if max_mb is None else max_mb
+    cache_dir = build_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not os.path.isfile(path) or name.endswith(".lock") or name.endswith(".properties"):
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    limit = max_mb * 1024 * 1024
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def print_gradle_cache_report(stats_by_job, prune=True):
+    """ジョブごとのタスク集計とビルドキャッシュのヒット率・サイズを表示する (pruneの場合は上限まで削減)"""
+    print("\n===== Gradle ビルドキャッシュ =====")
+    any_stats = False
+    for job, stats in stats_by_job.items():
+        if not stats:
+            print(f"{job:<28} | 集計なし")
+            continue
+        any_stats = True
+        print(f"{job:<28} | タスク {stats['actionable']:>4} | 実行 {stats['executed']:>4} | "
+              f"キャッシュ {stats['from_cache']:>4} | 最新 {stats['up_to_date']:>4} | ヒット率 {stats['hit_rate']:.0%}")
+    if stats_by_job and not any_stats:
+        print("(Gradle の集計行が見つかりませんでした)")
+    removed = prune_build_cache() if prune else 0
+    cache_dir = build_cache_dir()
+    if os.path.isdir(cache_dir):
+        size_mb = directory_size(cache_dir) / (1024 * 1024)
+        note = f" / 上限を超えた{removed}件を削除" if removed else ""
+        print(f"キャッシュ: {cache_dir} ({size_mb:.0f}MB / 上限 {BUILD_CACHE_MAX_MB}MB{note})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gradle デーモンとビルドキャッシュの管理")
+    parser.add_argument('--apply', action='store_true', help='gradle.properties の管理範囲を更新')
+    parser.add_argument('--warm', action='store_true', help='Gradle デーモンを事前に起動')
+    parser.add_argument('--stop', action='store_true', help='Gradle デーモンを停止')
+    parser.add_argument('--prune', type=int, nargs='?', const=BUILD_CACHE_MAX_MB, metavar='MB',
+                        help='ビルドキャッシュを上限 (MB) 以下に削減')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.apply:
+        ensure_gradle_properties()
+    if args.warm:
+        warm_gradle_daemon()
+    if args.stop:
+        stop_gradle_daemon()
+    if args.prune is not None:
+        print(f"✅ {prune_build_cache(args.prune)}件のキャッシュエントリを削除しました")
+    if not (args.apply or args.warm or args.stop or args.prune is not None):
+        print_gradle_cache_report({}, prune=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import time
+import shlex
+import struct
+import select
+import ctypes
+import ctypes.util
+import argparse
+import platform
+import threading
+import subprocess
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from build_invalidation import GENERATED_NAMES, GENERATED_SUFFIXES
+from step_cache import run_pub_get
+from readiness import LineTrigger
+
+# 変更をまとめて扱うための待ち時間 (秒)。保存時に複数のファイルが続けて書き換わるため
+# 最後の変更からこの時間だけ静かになってから反映する。環境変数 HOT_RELOAD_DEBOUNCE_MS で変更できる
+DEBOUNCE_SECONDS = int(os.environ.get("HOT_RELOAD_DEBOUNCE_MS", "150")) / 1000
+# inotify が使えない環境 (macOS など) でのファイル走査の間隔 (秒)
+POLL_INTERVAL = 0.5
+# r / R を送ってから完了の出力を待つ時間 (秒)
+RELOAD_TIMEOUT = 60
+
+# 監視するディレクトリ (再帰的に監視するかどうか)
+WATCH_TARGETS = [("lib", True), ("assets", True), (".", False), ("android", True), ("ios", True), ("web", True)]
+# 変更時にアプリの再ビルドが必要なもの (pubspec の変更は依存関係の解決も行う)
+PUBSPEC_FILES = ("pubspec.yaml", "pubspec.lock")
+NATIVE_DIRS = ("android", "ios", "web")
+
+# 変更の種類 (数字が大きいほど重い対応が必要)
+ACTION_RELOAD = 1   # r: ホットリロード
+ACTION_RESTART = 2  # R: ホットリスタート
+ACTION_REBUILD = 3  # flutter run をやり直す
+ACTION_LABELS = {ACTION_RELOAD: "ホットリロード", ACTION_RESTART: "ホットリスタート", ACTION_REBUILD: "再ビルド"}
+
+# エディタの一時ファイル
+_EDITOR_TEMP_RE = re.compile(r'(^\.#|^#.*#$|~$|\.sw[a-p]$|^4913$|\.tmp$)')
+# flutter run の出力から準備完了とリロードの完了を検出する
+_READY_RE = re.compile(r'Flutter run key commands|To hot reload changes')
+_DONE_RE = re.compile(r'(Reloaded|Restarted).* in ([\d,.]+)\s*ms')
+_RELOAD_FAILED_RE = re.compile(r'(Hot reload|Hot restart) was rejected|Try performing a hot restart instead')
+
+# inotify の定数 (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_ignored_dir(name):
+    return name in GENERATED_NAMES or name.startswith(".")
+
+
+def classify_change(relative):
+    """変更されたファイル (プロジェクトからの相対パス) に必要な対応を返す (無関係ならNone)"""
+    parts = relative.replace(os.sep, "/").split("/")
+    name = parts[-1]
+    if _EDITOR_TEMP_RE.search(name):
+        return None
+    if len(parts) == 1:
+        return ACTION_REBUILD if name in PUBSPEC_FILES else None
+    if parts[0] == "lib":
+        return ACTION_RELOAD if name.endswith(".dart") else ACTION_RESTART
+    if parts[0] == "assets":
+        return ACTION_RESTART
+    if parts[0] in NATIVE_DIRS:
+        # ビルドやツールが生成するものは無視する (ビルドのたびに再ビルドが繰り返されないように)
+        if any(_is_ignored_dir(part) for part in parts[1:-1]) or name in GENERATED_NAMES \
+                or name.endswith(GENERATED_SUFFIXES) or name.startswith("."):
+            return None
+        return ACTION_REBUILD
+    return None
+
+
+class InotifyWatcher:
+    """inotify でディレクトリを監視する (Linux)"""
+
+    def __init__(self, targets):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        self._dirs = {}
+        self._recursive = set()
+        for relative, recursive in targets:
+            path = os.path.normpath(os.path.join(PROJECT_ROOT, relative))
+            if os.path.isdir(path):
+                self._add(path, recursive)
+
+    def _add(self, path, recursive):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return
+        self._dirs[wd] = path
+        if not recursive:
+            return
+        self._recursive.add(wd)
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return
+        for name in names:
+            child = os.path.join(path, name)
+            if not _is_ignored_dir(name) and os.path.isdir(child) and not os.path.islink(child):
+                self._add(child, True)
+
+    def wait(self, timeout):
+        """timeout 秒まで待ち、変更されたファイルのパスの一覧を返す"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # イベントがあふれた場合は内容が分からないため再ビルドとして扱う
+                changed.append(os.path.join(PROJECT_ROOT, "pubspec.yaml"))
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and wd in self._recursive and not _is_ignored_dir(name):
+                    self._add(path, True)
+                continue
+            changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """ファイルの更新日時とサイズを定期的に比較して監視する (inotify が使えない環境用)"""
+
+    def __init__(self, targets):
+        self._targets = targets
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for relative, recursive in self._targets:
+            root = os.path.normpath(os.path.join(PROJECT_ROOT, relative))
+            if not os.path.isdir(root):
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if recursive and not _is_ignored_dir(d)]
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, POLL_INTERVAL))
+        snapshot = self._scan()
+        changed = [path for path in set(snapshot) | set(self._snapshot)
+                   if snapshot.get(path) != self._snapshot.get(path)]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(targets=WATCH_TARGETS):
+    """使える中で最も効率のよい監視方法を選ぶ"""
+    if platform.system() == "Linux":
+        try:
+            return InotifyWatcher(targets)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(targets)
+
+
+class FlutterRunSession:
+    """標準入力をつないだまま flutter run を実行し続け、r / R を送る"""
+
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        # 起動してからキー操作を受け付けるまでの時間を記録する
+        self.ready = LineTrigger("flutter run の起動", _READY_RE)
+        self._done = threading.Event()
+        self._result = None
+
+    def start(self):
+        self.ready.clear()
+        self.process = subprocess.Popen(shlex.split(self.command), cwd=PROJECT_ROOT, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+        threading.Thread(target=self._read_output, args=(self.process,), daemon=True).start()
+
+    def _read_output(self, process):
+        for raw in iter(process.stdout.readline, b''):
+            line = raw.decode(errors='replace')
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            self.ready.feed(line)
+            match = _DONE_RE.search(line)
+            if match:
+                self._result = (True, float(match.group(2).replace(",", "")))
+                self._done.set()
+            elif _RELOAD_FAILED_RE.search(line):
+                self._result = (False, None)
+                self._done.set()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, keys):
+        """flutter run にキー入力を送る"""
+        if not self.alive():
+            return False
+        try:
+            self.process.stdin.write(keys.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return False
+        return True
+
+    def trigger(self, key):
+        """r / R を送り、完了まで待つ。(成功したか, flutter が報告した時間ms) を返す"""
+        self._done.clear()
+        self._result = None
+        if not self.send(key):
+            return False, None
+        if not self._done.wait(RELOAD_TIMEOUT):
+            return False, None
+        return self._result
+
+    def stop(self):
+        if not self.alive():
+            return
+        self.send("q")
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def _forward_keyboard(session):
+    """端末からの入力を flutter run に転送する (行単位で入力された文字をそのまま送る)"""
+    for line in sys.stdin:
+        session.send(line.strip())
+
+
+def _collect_changes(watcher, first_events):
+    """最後の変更から DEBOUNCE_SECONDS だけ変更が無くなるまでイベントを集める"""
+    changes = set(first_events)
+    while True:
+        more = watcher.wait(DEBOUNCE_SECONDS)
+        if not more:
+            return changes
+        changes.update(more)
+
+
+def run_hot_reload_session(command, verbose=False):
+    """flutter run を1回だけ起動し、ファイルの変更に応じてホットリロード・リスタート・再ビルドを行う
+
+    command は flutter run のコマンド (デバイス指定を含む)。flutter run が終了するまで戻らない。
+    """
+    watcher = create_watcher()
+    session = FlutterRunSession(command)
+    print(f"👀 lib/ と assets/ を監視しています ({type(watcher).__name__}, 待ち時間 {DEBOUNCE_SECONDS * 1000:.0f}ms)")
+    print("💡 ファイルを保存すると自動で反映します。終了するには q を入力するかCtrl+Cを押してください")
+    session.start()
+    if sys.stdin.isatty():
+        threading.Thread(target=_forward_keyboard, args=(session,), daemon=True).start()
+
+    # 反映待ちの変更 {相対パス: 対応} と、最初に検出した時刻 (起動中の変更は準備完了後にまとめて反映する)
+    pending = {}
+    detected_at = None
+    try:
+        while session.alive():
+            events = watcher.wait(POLL_INTERVAL)
+            if events:
+                first_seen = time.time()
+                for path in _collect_changes(watcher, events):
+                    relative = os.path.relpath(path, PROJECT_ROOT)
+                    action = classify_change(relative)
+                    if action:
+                        pending[relative] = max(action, pending.get(relative, 0))
+                if pending and detected_at is None:
+                    detected_at = first_seen
+            if not pending or not session.ready.is_set():
+                continue
+
+            action = max(pending.values())
+            changed = sorted(pending)
+            started_at = detected_at
+            pending, detected_at = {}, None
+            summary = ", ".join(changed[:3]) + (f" ほか{len(changed) - 3}件" if len(changed) > 3 else "")
+            print(f"\n🔄 {ACTION_LABELS[action]}: {summary}")
+
+            if action == ACTION_REBUILD:
+                session.stop()
+                if any(path in PUBSPEC_FILES for path in changed):
+                    run_pub_get("依存関係の解決", show_output=verbose)
+                session.start()
+                continue
+
+            ok, reported = session.trigger("r" if action == ACTION_RELOAD else "R")
+            if not ok and action == ACTION_RELOAD:
+                # リロードできない変更 (ジェネリクスや main の変更など) はリスタートで反映する
+                print("↪️ ホットリロードできない変更のため、ホットリスタートを行います")
+                ok, reported = session.trigger("R")
+            latency = time.time() - started_at
+            if ok:
+                detail = f" (flutter: {reported:.0f}ms)" if reported is not None else ""
+                print(f"⚡ 変更の検出から{latency:.2f}秒で反映しました{detail}")
+            else:
+                print("⚠️ 変更を反映できませんでした。上の出力を確認してください")
+    except KeyboardInterrupt:
+        print("\n⚠️ ユーザーにより中断されました")
+    finally:
+        session.stop()
+        watcher.close()
+    return session.process.returncode in (0, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ファイルの変更を監視して flutter run にホットリロードを送る")
+    parser.add_argument('-d', '--device', required=True, help='flutter run のデバイスID (chrome など)')
+    parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='flutter run に渡す追加の引数')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    os.chdir(PROJECT_ROOT)
+    command = f"flutter run -d {shlex.quote(args.device)} " + " ".join(shlex.quote(arg) for arg in args.args)
+    return 0 if run_hot_reload_session(command.strip(), args.verbose) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import stat
+import time
+import shutil
+import hashlib
+import argparse
+import datetime
+
+from command_runner import PROJECT_ROOT
+
+# 出力フォルダ (output/android など) の成果物の実体の保存先
+# objects/<sha256の先頭2文字>/<sha256> にファイルの内容を保存し、出力フォルダにはハードリンクを置く。
+# builds/<フォルダ名>/<ビルドID>.json に各ビルドのファイル名・内容のハッシュ・タグを記録する。
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, "output")
+STORE_DIR = os.path.join(OUTPUT_DIR, ".store")
+# フォルダごとに残す最新のビルド数。環境変数 OUTPUT_KEEP_LAST で変更できる
+OUTPUT_KEEP_LAST = int(os.environ.get("OUTPUT_KEEP_LAST", "10"))
+# 保存する成果物の合計の上限 (MB)。環境変数 OUTPUT_MAX_MB で変更できる
+OUTPUT_MAX_MB = int(os.environ.get("OUTPUT_MAX_MB", "5120"))
+# どのビルドからも参照されていなくても、この時間 (秒) 以内に保存・再利用された実体は削除しない
+# (別のプロセスの publish_build が記録を書き込む前の実体を、保持ポリシーが消してしまわないようにする)
+PRUNE_GRACE_SECONDS = 3600
+
+
+def _object_path(sha):
+    return os.path.join(STORE_DIR, "objects", sha[:2], sha)
+
+
+def _folder_name(folder):
+    return os.path.relpath(os.path.join(PROJECT_ROOT, folder), OUTPUT_DIR).replace(os.sep, "_")
+
+
+def _build_path(folder, build_id):
+    return os.path.join(STORE_DIR, "builds", _folder_name(folder), f"{build_id}.json")
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_object(source):
+    """ファイルを内容のハッシュで保存し、(sha256, サイズ) を返す
+
+    実体は読み取り専用にし、出力フォルダのリンクを書き換えて他のビルドの成果物が壊れないようにする。
+    """
+    sha = _hash_file(source)
+    path = _object_path(sha)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp_path, path)
+    else:
+        # 既存の実体を再利用する場合も、削除の猶予期間が始まるよう更新時刻を新しくする
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return sha, os.path.getsize(path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except PermissionError:
+        # Windows では読み取り専用のファイルを削除できない
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _place(sha, destination):
+    """保存した実体を destination にハードリンクする (リンクできないファイルシステムではコピー)"""
+    _remove_file(destination)
+    try:
+        os.link(_object_path(sha), destination)
+        return True
+    except OSError:
+        shutil.copyfile(_object_path(sha), destination)
+        return False
+
+
+def _save_record(record):
+    path = _build_path(record['folder'], record['id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def publish_build(folder, files, build_id=None, meta=None):
+    """files ({出力ファイル名: 元のパス}) を folder に置き、1つのビルドとして記録する
+
+    同じ内容のファイルは実体を1つだけ保存し、出力フォルダにはハードリンクを置く。
+    戻り値は記録の辞書 (files に各ファイルの name・sha256・size が入る)。
+    """
+    os.makedirs(folder, exist_ok=True)
+    build_id = build_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    record = {'id': build_id, 'folder': os.path.relpath(os.path.join(PROJECT_ROOT, folder), PROJECT_ROOT),
+              'created': time.time(), 'files': [], 'extras': [], 'tags': [], 'meta': meta or {}}
+    linked = 0
+    for name, source in sorted(files.items()):
+        sha, size = _store_object(source)
+        linked += _place(sha, os.path.join(folder, name))
+        record['files'].append({'name': name, 'sha256': sha, 'size': size})
+    _save_record(record)
+    if linked < len(files):
+        print("⚠️ ハードリンクを作成できなかったため、一部の成果物はコピーしました")
+    return record
+
+
+def attach_files(record, names):
+    """ビルドと一緒に削除する付属ファイル (マニフェストなど、folder 内のファイル名) を記録に追加する"""
+    record['extras'].extend(name for name in names if name not in record['extras'])
+    _save_record(record)
+
+
+def load_builds(folder=None):
+    """記録されたビルドの一覧 (新しい順)。folder を指定した場合はそのフォルダのみ"""
+    builds_dir = os.path.join(STORE_DIR, "builds")
+    if folder is not None:
+        folders = [_folder_name(folder)]
+    else:
+        folders = sorted(os.listdir(builds_dir)) if os.path.isdir(builds_dir) else []
+    records = []
+    for name in folders:
+        directory = os.path.join(builds_dir, name)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename), 'r') as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    records.sort(key=lambda record: record['created'], reverse=True)
+    return records
+
+
+def find_build(build_id):
+    for record in load_builds():
+        if record['id'] == build_id or f"{record['folder']}/{record['id']}" == build_id:
+            return record
+    return None
+
+
+def set_tag(build_id, tag, remove=False):
+    """ビルドにタグを付ける (タグ付きのビルドは保持ポリシーで削除されない)。対象が無ければNone"""
+    record = find_build(build_id)
+    if record is None:
+        return None
+    tags = [t for t in record['tags'] if t != tag]
+    record['tags'] = tags if remove else tags + [tag]
+    _save_record(record)
+    return record
+
+
+def _unique_size(records):
+    blobs = {item['sha256']: item['size'] for record in records for item in record['files']}
+    return sum(blobs.values())
+
+
+def _evict(record):
+    folder = os.path.join(PROJECT_ROOT, record['folder'])
+    for name in [item['name'] for item in record['files']] + record['extras']:
+        _remove_file(os.path.join(folder, name))
+    _remove_file(_build_path(record['folder'], record['id']))
+
+
+def apply_retention(keep_last=None, max_mb=None, dry_run=False):
+    """保持ポリシーに従って古いビルドを削除し、削除したビルドの一覧を返す
+
+    1. タグ付きのビルドは常に残す
+    2. フォルダごとに最新の keep_last 件を残し、それより古いものを削除する
+    3. 残りの実体の合計が max_mb を超える場合は、古いものから削除する (各フォルダの最新のビルドは残す)
+    どのビルドからも参照されなくなった実体は最後に削除する (PRUNE_GRACE_SECONDS 以内に保存・再利用された
+    ものは、記録を書き込む前のビルドのものである可能性があるため残す)。
+    """
+    keep_last = OUTPUT_KEEP_LAST if keep_last is None else keep_last
+    max_mb = OUTPUT_MAX_MB if max_mb is None else max_mb
+    records = load_builds()
+
+    kept, evicted, seen, newest = [], [], {}, set()
+    for record in records:
+        position = seen.get(record['folder'], 0)
+        seen[record['folder']] = position + 1
+        if position == 0:
+            newest.add((record['folder'], record['id']))
+        if record['tags'] or position < keep_last:
+            kept.append(record)
+        else:
+            evicted.append(record)
+
+    limit = max_mb * 1024 * 1024
+    for record in reversed(list(kept)):
+        if _unique_size(kept) <= limit:
+            break
+        if record['tags'] or (record['folder'], record['id']) in newest:
+            continue
+        kept.remove(record)
+        evicted.append(record)
+
+    if dry_run:
+        return evicted
+    for record in evicted:
+        _evict(record)
+
+    referenced = {item['sha256'] for record in kept for item in record['files']}
+    objects_dir = os.path.join(STORE_DIR, "objects")
+    cutoff = time.time() - PRUNE_GRACE_SECONDS
+    for dirpath, _, filenames in os.walk(objects_dir):
+        for name in filenames:
+            if name in referenced or name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    _remove_file(path)
+            except OSError:
+                pass
+    return evicted
+
+
+def store_usage(records=None):
+    """(各ビルドのファイルの合計, 実体の合計) をバイト単位で返す"""
+    records = load_builds() if records is None else records
+    logical = sum(item['size'] for record in records for item in record['files'])
+    return logical, _unique_size(records)
+
+
+def print_retention_summary(evicted, keep_last=None, max_mb=None):
+    """保持ポリシーの適用結果と出力フォルダの使用量を表示する"""
+    keep_last = OUTPUT_KEEP_LAST if keep_last is None else keep_last
+    max_mb = OUTPUT_MAX_MB if max_mb is None else max_mb
+    logical, actual = store_usage()
+    if evicted:
+        print(f"🧹 保持ポリシーにより古いビルドを{len(evicted)}件削除しました "
+              f"(最新{keep_last}件とタグ付きを保持 / 上限 {max_mb}MB)")
+    print(f"💽 出力フォルダの成果物: {actual / (1024 * 1024):.1f}MB "
+          f"(重複排除なしの場合 {logical / (1024 * 1024):.1f}MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="出力フォルダのビルド成果物の一覧・タグ付け・保持ポリシーの適用")
+    parser.add_argument('command', nargs='?', default="list", choices=["list", "tag", "untag", "prune"],
+                        help='list: 一覧 / tag・untag: タグの付け外し / prune: 保持ポリシーを適用')
+    parser.add_argument('build', nargs='?', help='tag・untag の対象のビルドID (例: android/gyroscope_app_20250512_031002)')
+    parser.add_argument('tag', nargs='?', help='タグ名 (例: release-1.2.0)')
+    parser.add_argument('--folder', help='list の対象の出力フォルダ (例: output/android)')
+    parser.add_argument('--keep-last', type=int, default=OUTPUT_KEEP_LAST, help='フォルダごとに残す最新のビルド数')
+    parser.add_argument('--max-mb', type=int, default=OUTPUT_MAX_MB, help='成果物の合計の上限 (MB)')
+    parser.add_argument('--dry-run', action='store_true', help='prune で削除対象を表示するだけにする')
+    args = parser.parse_args()
+
+    if args.command in ("tag", "untag"):
+        if not args.build or not args.tag:
+            parser.error(f"{args.command} にはビルドIDとタグ名が必要です")
+        record = set_tag(args.build, args.tag, remove=args.command == "untag")
+        if record is None:
+            print(f"エラー: ビルド {args.build} が見つかりません")
+            return 1
+        print(f"✅ {record['folder']}/{record['id']} のタグ: {', '.join(record['tags']) or 'なし'}")
+        return 0
+
+    if args.command == "prune":
+        evicted = apply_retention(args.keep_last, args.max_mb, dry_run=args.dry_run)
+        for record in evicted:
+            print(f"{'削除対象' if args.dry_run else '削除'}: {record['folder']}/{record['id']}")
+        if not args.dry_run:
+            print_retention_summary(evicted, args.keep_last, args.max_mb)
+        return 0
+
+    records = load_builds(args.folder)
+    print(f"{'ビルド':<44} | {'ファイル':>6} | {'サイズ':>9} | {'経過':>8} | タグ")
+    print("-" * 90)
+    for record in records:
+        size_mb = sum(item['size'] for item in record['files']) / (1024 * 1024)
+        age_hours = (time.time() - record['created']) / 3600
+        print(f"{record['folder'] + '/' + record['id']:<44} | {len(record['files']):>6} | {size_mb:>7.1f}MB | "
+              f"{age_hours:>7.1f}h | {', '.join(record['tags'])}")
+    logical, actual = store_usage(records)
+    print(f"\n{len(records)}件 / 実体 {actual / (1024 * 1024):.1f}MB (重複排除なしの場合 {logical / (1024 * 1024):.1f}MB)"
+          f" / 保持: 最新{OUTPUT_KEEP_LAST}件とタグ付き・上限 {OUTPUT_MAX_MB}MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import subprocess
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR, tool_fingerprint
+from pubspec_lock import parse_pubspec_lock
+
+# インストール済み Pods ツリーのキャッシュの保存先
+PODS_CACHE_DIR = os.path.join(CACHE_DIR, "pods")
+# 保持するキャッシュの数 (古いものから削除する)。環境変数 PODS_CACHE_MAX_ENTRIES で変更できる
+MAX_ENTRIES = int(os.environ.get("PODS_CACHE_MAX_ENTRIES", "5"))
+# 環境変数 NO_PODS_CACHE=1 でキャッシュを無効化する
+PODS_CACHE_ENABLED = os.environ.get("NO_PODS_CACHE", "") not in ("1", "true", "yes")
+
+PODS_DIR = os.path.join(PROJECT_ROOT, "ios", "Pods")
+PODFILE = os.path.join(PROJECT_ROOT, "ios", "Podfile")
+PODFILE_LOCK = os.path.join(PROJECT_ROOT, "ios", "Podfile.lock")
+PUBSPEC_LOCK = os.path.join(PROJECT_ROOT, "pubspec.lock")
+
+# pod install がその場で書き換えるため、ハードリンクではなく複製で復元するもの
+MUTABLE_NAMES = ("Manifest.lock",)
+MUTABLE_SUFFIXES = (".xcodeproj", ".xcconfig", ".xcfilelist", ".sh", ".modulemap", ".plist", ".markdown")
+
+
+def pods_cache_key():
+    """Podfile・Podfile.lock・プラグインのバージョン・pod本体からキャッシュのキーを作成する"""
+    if not os.path.exists(PODFILE_LOCK):
+        return None
+    digest = hashlib.sha256()
+    for path in (PODFILE, PODFILE_LOCK):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    if os.path.exists(PUBSPEC_LOCK):
+        for name, info in sorted(parse_pubspec_lock(PUBSPEC_LOCK).items()):
+            digest.update(f"{name}@{info.get('version', '')}\n".encode())
+    digest.update(f"pod:{tool_fingerprint('pod')}".encode())
+    return digest.hexdigest()[:32]
+
+
+def _entry_path(key):
+    return os.path.join(PODS_CACHE_DIR, key)
+
+
+def _is_mutable(name):
+    return name in MUTABLE_NAMES or name.endswith(MUTABLE_SUFFIXES)
+
+
+def _reflink_tree(source, destination):
+    """コピーオンライトで木を複製する (APFS の clonefile / Linux の reflink)。未対応ならFalse"""
+    if platform.system() == "Darwin":
+        command = ["cp", "-cR", source, destination]
+    else:
+        command = ["cp", "-a", "--reflink=always", source, destination]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    if result.returncode != 0:
+        shutil.rmtree(destination, ignore_errors=True)
+        return False
+    return True
+
+
+def _link_tree(source, destination):
+    """ハードリンクで木を複製する (書き換えられるファイルとリンク不可の場合は複製)。リンク数を返す"""
+    linked = 0
+    for dirpath, dirnames, filenames in os.walk(source):
+        relative = os.path.relpath(dirpath, source)
+        target_dir = os.path.normpath(os.path.join(destination, relative))
+        os.makedirs(target_dir, exist_ok=True)
+        mutable_dir = any(_is_mutable(part) for part in relative.split(os.sep))
+        for name in dirnames + filenames:
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(target_dir, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                if name in dirnames:
+                    dirnames.remove(name)
+                continue
+            if name in dirnames:
+                continue
+            if mutable_dir or _is_mutable(name):
+                shutil.copy2(src, dst)
+                continue
+            try:
+                os.link(src, dst)
+                linked += 1
+            except OSError:
+                shutil.copy2(src, dst)
+    return linked
+
+
+def _materialize(source, destination):
+    """キャッシュとプロジェクトの間で木を複製する。使った方式を返す"""
+    if _reflink_tree(source, destination):
+        return "reflink"
+    _link_tree(source, destination)
+    return "hardlink"
+
+
+def store_pods(key=None):
+    """インストール済みの ios/Pods をキャッシュに保存する"""
+    key = key or pods_cache_key()
+    if not PODS_CACHE_ENABLED or key is None or not os.path.isdir(PODS_DIR):
+        return False
+    entry = _entry_path(key)
+    if os.path.isdir(entry):
+        os.utime(entry)
+        return True
+
+    os.makedirs(PODS_CACHE_DIR, exist_ok=True)
+    tmp_entry = f"{entry}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    try:
+        method = _materialize(PODS_DIR, tmp_entry)
+        os.replace(tmp_entry, entry)
+    except OSError as e:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        print(f"警告: Podsのキャッシュ保存に失敗しました - {e}")
+        return False
+    print(f"💾 Podsをキャッシュに保存しました ({key[:12]}, {method})")
+    prune_pods_cache()
+    return True
+
+
+def restore_pods(key=None):
+    """キーが一致するキャッシュがあれば ios/Pods を置き換える (pod install の代わり)"""
+    key = key or pods_cache_key()
+    if not PODS_CACHE_ENABLED or key is None:
+        return False
+    entry = _entry_path(key)
+    if not os.path.isdir(entry):
+        return False
+
+    start = time.time()
+    tmp_pods = f"{PODS_DIR}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_pods, ignore_errors=True)
+    try:
+        method = _materialize(entry, tmp_pods)
+        if os.path.lexists(PODS_DIR):
+            shutil.rmtree(PODS_DIR)
+        os.replace(tmp_pods, PODS_DIR)
+    except OSError as e:
+        shutil.rmtree(tmp_pods, ignore_errors=True)
+        print(f"警告: Podsのキャッシュ復元に失敗しました - {e}")
+        return False
+    os.utime(entry)
+    print(f"♻️ キャッシュからPodsを復元しました ({key[:12]}, {method}, {time.time() - start:.1f}秒)")
+    return True
+
+
+def prune_pods_cache(max_entries=None):
+    """最近使われていないキャッシュを削除し、max_entries 個以内に保つ"""
+    max_entries = MAX_ENTRIES if max_entries is None else max_entries
+    if not os.path.isdir(PODS_CACHE_DIR):
+        return []
+    entries = [os.path.join(PODS_CACHE_DIR, name) for name in os.listdir(PODS_CACHE_DIR)
+               if not name.endswith(".tmp")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    removed = entries[max_entries:]
+    for entry in removed:
+        shutil.rmtree(entry, ignore_errors=True)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インストール済みPodsのキャッシュ管理")
+    parser.add_argument('--store', action='store_true', help='現在の ios/Pods をキャッシュに保存')
+    parser.add_argument('--restore', action='store_true', help='一致するキャッシュから ios/Pods を復元')
+    parser.add_argument('--prune', type=int, metavar='N', help='最近使われたN個を残して削除')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    key = pods_cache_key()
+    if args.store:
+        return 0 if store_pods(key) else 1
+    if args.restore:
+        if restore_pods(key):
+            return 0
+        print("一致するキャッシュがありません")
+        return 1
+    if args.prune is not None:
+        removed = prune_pods_cache(args.prune)
+        print(f"✅ {len(removed)}件のキャッシュを削除しました")
+        return 0
+
+    print(f"現在のキー: {key or '(Podfile.lock がありません)'}")
+    if os.path.isdir(PODS_CACHE_DIR):
+        for name in sorted(os.listdir(PODS_CACHE_DIR)):
+            mark = "*" if name == key else " "
+            age = int(time.time() - os.path.getmtime(_entry_path(name)))
+            print(f"{mark} {name} | {age:>8}秒前")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
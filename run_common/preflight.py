@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 同時に実行する事前チェックの最大数 (ほとんどが外部コマンドの待ち時間のためCPU数とは無関係)
+DEFAULT_MAX_WORKERS = 8
+# 資源を考慮して並列実行する際に、OSや他のアプリのために残しておくメモリ (MB)
+MEMORY_RESERVE_MB = 2048
+
+
+class _ThreadLocalOutput(io.TextIOBase):
+    """スレッドごとに出力をバッファし、並列実行したステップの出力が混ざらないようにする"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def isatty(self):
+        return False
+
+
+def host_capacity(memory_reserve_mb=MEMORY_RESERVE_MB):
+    """このマシンで使えるCPUコア数と空きメモリ (MB) を返す"""
+    cpus = os.cpu_count() or 1
+    memory_mb = None
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    memory_mb = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+    if memory_mb is None:
+        try:
+            # macOSなど /proc が無い環境では物理メモリの3/4を使えるものとみなす
+            memory_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024) * 3 // 4
+        except (ValueError, OSError, AttributeError):
+            memory_mb = 8192
+    return {'cpus': cpus, 'memory_mb': max(memory_mb - memory_reserve_mb, 1024)}
+
+
+def _validate(steps):
+    """依存関係に未定義のステップや循環がないか確認し、名前をキーとした辞書を返す"""
+    by_name = {}
+    for step in steps:
+        if step['name'] in by_name:
+            raise ValueError(f"ステップ名が重複しています: {step['name']}")
+        by_name[step['name']] = step
+    for step in steps:
+        for dep in step.get('deps', []):
+            if dep not in by_name:
+                raise ValueError(f"ステップ {step['name']} の依存先 {dep} が定義されていません")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"ステップの依存関係が循環しています: {name}")
+        visiting.add(name)
+        for dep in by_name[name].get('deps', []):
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in by_name:
+        visit(name)
+    return by_name
+
+
+def _run_step(step, output):
+    """ステップを実行し、結果・所要時間・出力を返す (ワーカースレッドで実行)"""
+    buffered = not step.get('exclusive')
+    if buffered:
+        output.local.buffer = io.StringIO()
+    start = time.time()
+    outcome = {'result': None, 'ok': False, 'error': None, 'skipped': False}
+    try:
+        outcome['result'] = step['func'](*step.get('args', ()))
+        outcome['ok'] = outcome['result'] is not False
+    except Exception as e:
+        outcome['error'] = e
+    finally:
+        outcome['duration'] = time.time() - start
+        if buffered:
+            outcome['output'] = output.local.buffer.getvalue()
+            output.local.buffer = None
+        else:
+            outcome['output'] = ''
+    return outcome
+
+
+def _demand(step, capacity):
+    """ステップが要求する資源 (容量を超える要求は容量に丸め、実行できなくならないようにする)"""
+    return {resource: min(step.get(resource, 0), limit) for resource, limit in capacity.items()}
+
+
+def run_graph(steps, max_workers=DEFAULT_MAX_WORKERS, title="事前チェック", capacity=None, announce=False):
+    """依存関係を宣言したステップを、依存が満たされたものから並列に実行する
+
+    各ステップは {'name', 'func', 'deps', 'description', 'args', 'exclusive', 'locks'} の辞書。
+    func が False を返すか例外を送出したステップは失敗とし、それに依存するステップはスキップする。
+    exclusive なステップ (入力待ちがあるものなど) は他のステップが終わるのを待ってから単独で実行する。
+    同じ名前の locks を持つステップは同時に実行しない (同じ出力先を使うビルドなど)。
+    capacity に {'cpus': 32, 'memory_mb': 65536} のような上限を渡すと、各ステップの同名キーの
+    要求量の合計が上限を超えないように同時実行数を抑える。
+    各ステップの出力は完了時にまとめて表示する。戻り値はステップ名をキーとした結果の辞書。
+    """
+    if not steps:
+        return {}
+    by_name = _validate(steps)
+    capacity = capacity or {}
+    order = [step['name'] for step in steps]
+    results = {}
+    pending = list(order)
+    running = {}
+    in_use = {resource: 0 for resource in capacity}
+    held_locks = set()
+    output = _ThreadLocalOutput(sys.stdout)
+
+    def fits(step):
+        if held_locks.intersection(step.get('locks', [])):
+            return False
+        demand = _demand(step, capacity)
+        return all(in_use[resource] + amount <= capacity[resource] for resource, amount in demand.items())
+
+    def acquire(step, sign):
+        for resource, amount in _demand(step, capacity).items():
+            in_use[resource] += sign * amount
+        locks = set(step.get('locks', []))
+        if sign > 0:
+            held_locks.update(locks)
+        else:
+            held_locks.difference_update(locks)
+
+    print(f"\n🔎 {title}を並列実行しています ({len(steps)}ステップ)...")
+    start = time.time()
+    original_stdout = sys.stdout
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                exclusive_running = any(by_name[name].get('exclusive') for name in running.values())
+                for name in list(pending):
+                    step = by_name[name]
+                    deps = step.get('deps', [])
+                    if any(dep not in results for dep in deps):
+                        continue
+                    failed = [dep for dep in deps if not results[dep]['ok']]
+                    if failed:
+                        pending.remove(name)
+                        results[name] = {'result': None, 'ok': False, 'error': None, 'skipped': True,
+                                         'duration': 0.0, 'output': ''}
+                        output.stream.write(f"⏭️ {step.get('description', name)}: "
+                                            f"{', '.join(failed)} が失敗したためスキップしました\n")
+                        continue
+                    if exclusive_running or (step.get('exclusive') and running):
+                        break
+                    if not fits(step):
+                        continue
+                    pending.remove(name)
+                    acquire(step, 1)
+                    if announce:
+                        output.stream.write(f"▶️ 開始: {step.get('description', name)}\n")
+                    running[executor.submit(_run_step, step, output)] = name
+                    if step.get('exclusive'):
+                        break
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    outcome = future.result()
+                    results[name] = outcome
+                    step = by_name[name]
+                    acquire(step, -1)
+                    mark = "✅" if outcome['ok'] else "❌"
+                    output.stream.write(f"\n{mark} {step.get('description', name)} ({outcome['duration']:.1f}秒)\n")
+                    if outcome['output']:
+                        output.stream.write(outcome['output'])
+                    if outcome['error'] is not None:
+                        output.stream.write(f"⚠️ エラー: {outcome['error']}\n")
+    finally:
+        sys.stdout = original_stdout
+
+    wall = time.time() - start
+    serial = sum(outcome['duration'] for outcome in results.values())
+    print(f"\n⏱️ {title}: {wall:.1f}秒 (逐次実行した場合の合計 {serial:.1f}秒)")
+    return results
+
+
+def run_preflight(steps, max_workers=DEFAULT_MAX_WORKERS, title="事前チェック"):
+    """独立した事前チェックを並列に実行する (run_graph を参照)"""
+    return run_graph(steps, max_workers, title)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+
+from command_runner import execute_command, PROJECT_ROOT, enable_fake_toolchain
+
+# ビルド用キャッシュのルートディレクトリ
+CACHE_DIR = os.path.join(PROJECT_ROOT, ".build_cache")
+# プローブ結果のキャッシュファイル
+PROBE_CACHE_FILE = os.path.join(CACHE_DIR, "probes.json")
+# キャッシュの有効期限 (秒)。環境変数 PROBE_CACHE_TTL で変更できる
+DEFAULT_TTL = int(os.environ.get("PROBE_CACHE_TTL", "3600"))
+# 接続デバイスの一覧など変わりやすい情報の有効期限 (秒)
+DEVICE_PROBE_TTL = int(os.environ.get("DEVICE_PROBE_TTL", "30"))
+
+# バイナリ以外にバージョン変化を反映するファイル (バイナリのディレクトリからの相対パス)
+# flutter はシェルスクリプトのため、upgrade してもバイナリの更新日時が変わらないことがある
+STAMP_FILES = {
+    'flutter': ["../version", "cache/flutter.version.json"],
+}
+
+_lock = threading.Lock()
+
+
+def _load_cache():
+    try:
+        with open(PROBE_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{PROBE_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, PROBE_CACHE_FILE)
+
+
+def tool_fingerprint(tool):
+    """ツールの実体パスと更新日時からキャッシュのキーを作成する (見つからない場合はNone)"""
+    tool_path = shutil.which(tool)
+    if not tool_path:
+        return None
+    real_path = os.path.realpath(tool_path)
+    stamps = [f"{real_path}@{os.stat(real_path).st_mtime_ns}"]
+    for relative in STAMP_FILES.get(os.path.basename(tool), []):
+        stamp_path = os.path.normpath(os.path.join(os.path.dirname(real_path), relative))
+        if os.path.exists(stamp_path):
+            stamps.append(f"{stamp_path}@{os.stat(stamp_path).st_mtime_ns}")
+    return "|".join(stamps)
+
+
+def cached_probe(command, tool=None, ttl=None, timeout=None):
+    """冪等なツールチェーン確認コマンドを実行し、結果をキャッシュする
+
+    キーはコマンド文字列とツール本体のパス・更新日時。成功した結果のみキャッシュする。
+    戻り値は subprocess.run と同じ CompletedProcess (stdout/stderrは文字列)。
+    """
+    tool = tool or command.split()[0]
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    fingerprint = tool_fingerprint(tool)
+
+    if fingerprint is not None and ttl > 0:
+        with _lock:
+            entry = _load_cache().get(command)
+        if entry and entry['fingerprint'] == fingerprint and time.time() - entry['time'] < ttl:
+            return subprocess.CompletedProcess(command, entry['returncode'], entry['stdout'], entry['stderr'])
+
+    result = execute_command(command, show_output=False, timeout=timeout)
+    returncode = result['returncode'] if result['returncode'] is not None else -1
+    completed = subprocess.CompletedProcess(command, returncode, result['stdout'], result['stderr'])
+
+    if fingerprint is not None and returncode == 0:
+        with _lock:
+            cache = _load_cache()
+            cache[command] = {
+                'fingerprint': fingerprint,
+                'time': time.time(),
+                'returncode': returncode,
+                'stdout': result['stdout'],
+                'stderr': result['stderr'],
+            }
+            _save_cache(cache)
+    return completed
+
+
+def invalidate_probes(tool=None):
+    """キャッシュを破棄する (toolを指定した場合はそのツールのコマンドのみ)"""
+    with _lock:
+        if tool is None:
+            if os.path.exists(PROBE_CACHE_FILE):
+                os.remove(PROBE_CACHE_FILE)
+            return
+        cache = _load_cache()
+        cache = {command: entry for command, entry in cache.items() if command.split()[0] != tool}
+        _save_cache(cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ツールチェーン確認結果のキャッシュ管理")
+    parser.add_argument('--clear', nargs='?', const='', metavar='TOOL', help='キャッシュを破棄 (ツール名を指定するとそのツールのみ)')
+    parser.add_argument('--list', action='store_true', help='キャッシュ済みのコマンドを表示')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.clear is not None:
+        invalidate_probes(args.clear or None)
+        print("✅ プローブキャッシュを破棄しました")
+    if args.list or args.clear is None:
+        for command, entry in _load_cache().items():
+            age = int(time.time() - entry['time'])
+            print(f"{command:<40} | {age:>6}秒前 | {entry['stdout'].splitlines()[0] if entry['stdout'] else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
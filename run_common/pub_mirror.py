@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import argparse
+import platform
+import subprocess
+from urllib.parse import urlparse
+
+from command_runner import PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR
+from pubspec_lock import hosted_packages
+
+# pubspec.lock が参照するパッケージのスナップショットの保存先 (pub cache と同じ構成)
+# PUB_CACHE にこのディレクトリを指定すれば、それ自体をオフライン用の pub cache として使える
+PUB_MIRROR_DIR = os.path.join(CACHE_DIR, "pub_mirror")
+PUBSPEC_LOCK = os.path.join(PROJECT_ROOT, "pubspec.lock")
+# 環境変数 NO_PUB_MIRROR=1 でミラーを無効化する
+PUB_MIRROR_ENABLED = os.environ.get("NO_PUB_MIRROR", "") not in ("1", "true", "yes")
+
+
+def pub_cache_dir():
+    """pub cache のディレクトリ (環境変数 PUB_CACHE が優先)"""
+    if os.environ.get("PUB_CACHE"):
+        return os.environ["PUB_CACHE"]
+    if platform.system() == "Windows":
+        return os.path.join(os.environ.get("LOCALAPPDATA", ""), "Pub", "Cache")
+    return os.path.expanduser("~/.pub-cache")
+
+
+def _host_dir(url):
+    """hosted パッケージの URL から pub cache 内のホスト名ディレクトリを求める"""
+    parsed = urlparse(url or "https://pub.dev")
+    host = parsed.netloc or "pub.dev"
+    return host.replace(":", "%58")
+
+
+def package_entries(lock_path=PUBSPEC_LOCK):
+    """pubspec.lock の hosted パッケージごとに、pub cache 内の相対パスを返す"""
+    entries = []
+    for name, info in sorted(hosted_packages(lock_path).items()):
+        host = _host_dir(info.get('url'))
+        package_dir = f"{info.get('name', name)}-{info['version']}"
+        entries.append({
+            'package': name,
+            'version': info['version'],
+            'dir': os.path.join("hosted", host, package_dir),
+            'hash': os.path.join("hosted-hashes", host, f"{package_dir}.sha256"),
+        })
+    return entries
+
+
+def _is_complete(package_path):
+    return os.path.isfile(os.path.join(package_path, "pubspec.yaml"))
+
+
+def _copy_tree(source, destination):
+    """パッケージを複製する (コピーオンライトが使える場合はクローン)。pub cache 側の修正が波及しないよう実体を分ける"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_destination = f"{destination}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_destination, ignore_errors=True)
+    if platform.system() == "Darwin":
+        command = ["cp", "-cR", source, tmp_destination]
+    else:
+        command = ["cp", "-a", "--reflink=auto", source, tmp_destination]
+    try:
+        cloned = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        cloned = False
+    if not cloned:
+        shutil.rmtree(tmp_destination, ignore_errors=True)
+        shutil.copytree(source, tmp_destination, symlinks=True)
+    if os.path.exists(destination):
+        shutil.rmtree(destination)
+    os.replace(tmp_destination, destination)
+
+
+def _copy_file(source, destination):
+    if os.path.isfile(source):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy2(source, destination)
+
+
+def snapshot_packages(lock_path=PUBSPEC_LOCK):
+    """pub cache にある pubspec.lock のパッケージのうち、ミラーに無いものを保存する
+
+    一度保存したパッケージは上書きしない (pub cache 側のパッチで汚れないよう、取得直後の状態を保つ)。
+    戻り値は追加したパッケージ数。
+    """
+    if not PUB_MIRROR_ENABLED or not os.path.exists(lock_path):
+        return 0
+    cache = pub_cache_dir()
+    added = 0
+    for entry in package_entries(lock_path):
+        mirror_path = os.path.join(PUB_MIRROR_DIR, entry['dir'])
+        cache_path = os.path.join(cache, entry['dir'])
+        if _is_complete(mirror_path) or not _is_complete(cache_path):
+            continue
+        try:
+            _copy_tree(cache_path, mirror_path)
+            _copy_file(os.path.join(cache, entry['hash']), os.path.join(PUB_MIRROR_DIR, entry['hash']))
+            added += 1
+        except OSError as e:
+            print(f"警告: {entry['package']} のミラー保存に失敗しました - {e}")
+    if added:
+        print(f"💾 {added}個のパッケージをオフラインミラーに保存しました")
+    return added
+
+
+def restore_packages(lock_path=PUBSPEC_LOCK, force=False):
+    """pub cache に無い (または force の場合はすべての) パッケージをミラーから復元する
+
+    戻り値は (復元したパッケージ数, ミラーにも無いパッケージ名の一覧)。
+    force は pub cache repair の代わりで、ネットワークを使わず取得時の状態に戻す。
+    """
+    if not PUB_MIRROR_ENABLED or not os.path.exists(lock_path):
+        return 0, []
+    cache = pub_cache_dir()
+    restored, missing = 0, []
+    for entry in package_entries(lock_path):
+        mirror_path = os.path.join(PUB_MIRROR_DIR, entry['dir'])
+        cache_path = os.path.join(cache, entry['dir'])
+        if _is_complete(cache_path) and not force:
+            continue
+        if not _is_complete(mirror_path):
+            if not _is_complete(cache_path):
+                missing.append(entry['package'])
+            continue
+        try:
+            _copy_tree(mirror_path, cache_path)
+            _copy_file(os.path.join(PUB_MIRROR_DIR, entry['hash']), os.path.join(cache, entry['hash']))
+            restored += 1
+        except OSError as e:
+            print(f"警告: {entry['package']} の復元に失敗しました - {e}")
+            missing.append(entry['package'])
+    if restored:
+        print(f"♻️ オフラインミラーから{restored}個のパッケージを pub cache に復元しました")
+    return restored, missing
+
+
+def offline_ready(lock_path=PUBSPEC_LOCK):
+    """pubspec.lock のすべての hosted パッケージが pub cache にあれば True (--offline で解決できる)"""
+    if not os.path.exists(lock_path):
+        return False
+    cache = pub_cache_dir()
+    return all(_is_complete(os.path.join(cache, entry['dir'])) for entry in package_entries(lock_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pubspec.lock のパッケージのオフラインミラー管理")
+    parser.add_argument('--snapshot', action='store_true', help='pub cache からミラーに保存')
+    parser.add_argument('--restore', action='store_true', help='ミラーから pub cache に復元')
+    parser.add_argument('--force', action='store_true', help='--restore で既存のパッケージも取得時の状態に戻す')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.snapshot:
+        snapshot_packages()
+    if args.restore:
+        _, missing = restore_packages(force=args.force)
+        if missing:
+            print(f"⚠️ ミラーに無いパッケージ: {', '.join(missing)}")
+            return 1
+    if args.snapshot or args.restore:
+        return 0
+
+    cache = pub_cache_dir()
+    entries = package_entries() if os.path.exists(PUBSPEC_LOCK) else []
+    for entry in entries:
+        in_mirror = "○" if _is_complete(os.path.join(PUB_MIRROR_DIR, entry['dir'])) else "×"
+        in_cache = "○" if _is_complete(os.path.join(cache, entry['dir'])) else "×"
+        print(f"{entry['package']:<36} {entry['version']:<12} | ミラー {in_mirror} | pub cache {in_cache}")
+    print(f"\nオフラインで解決可能: {'はい' if offline_ready() else 'いいえ'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
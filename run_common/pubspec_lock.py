@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+
+# pubspec.lock はpubが生成する固定形式のYAMLのため、必要な項目だけを行単位で解析する
+_PACKAGE_RE = re.compile(r'^  ([\w-]+):\s*$')
+_FIELD_RE = re.compile(r'^    (\w+):\s*(.*)$')
+_DESCRIPTION_FIELD_RE = re.compile(r'^      (\w+):\s*(.*)$')
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+        return value[1:-1]
+    return value
+
+
+def parse_pubspec_lock(path):
+    """pubspec.lock を解析し、パッケージ名をキーとした辞書を返す
+
+    各値は dependency, source, version と、hosted パッケージの場合は name, sha256, url を持つ。
+    """
+    packages = {}
+    current = None
+    in_packages = False
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if not line.startswith(' '):
+                in_packages = line.startswith('packages:')
+                current = None
+                continue
+            if not in_packages:
+                continue
+
+            match = _PACKAGE_RE.match(line)
+            if match:
+                current = {'package': match.group(1)}
+                packages[match.group(1)] = current
+                continue
+            if current is None:
+                continue
+
+            match = _FIELD_RE.match(line)
+            if match:
+                key, value = match.groups()
+                if value:
+                    current[key] = _unquote(value)
+                continue
+            match = _DESCRIPTION_FIELD_RE.match(line)
+            if match:
+                key, value = match.groups()
+                current[key] = _unquote(value)
+    return packages
+
+
+def hosted_packages(path):
+    """pubspec.lock から hosted (pub.dev など) のパッケージのみを返す"""
+    return {name: info for name, info in parse_pubspec_lock(path).items() if info.get('source') == 'hosted'}
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+
+from build_telemetry import record_probe_event
+
+# 確認の間隔 (秒)。最初は短く、準備ができていなければ FACTOR 倍ずつ MAX_INTERVAL まで延ばす
+INITIAL_INTERVAL = 0.05
+BACKOFF_FACTOR = 2.0
+MAX_INTERVAL = 1.0
+# 何も指定しない場合の待ち時間の上限 (秒)
+DEFAULT_TIMEOUT = 60
+# ポートへの接続1回あたりの待ち時間 (秒)
+CONNECT_TIMEOUT = 0.5
+
+# このプロセス内で待った記録 (print_probe_metrics で表示する)
+probe_metrics = []
+_metrics_lock = threading.Lock()
+
+
+def _record(name, ready, started, attempts):
+    record = {'name': name, 'ready': bool(ready), 'seconds': round(time.time() - started, 3), 'attempts': attempts}
+    with _metrics_lock:
+        probe_metrics.append(record)
+    record_probe_event(name, ready, record['seconds'])
+    return record
+
+
+def wait_until(name, check, timeout=DEFAULT_TIMEOUT, interval=INITIAL_INTERVAL, max_interval=MAX_INTERVAL):
+    """check() が真の値を返すまで、確認の間隔を指数的に延ばしながら繰り返す
+
+    戻り値は check() の最後の値 (タイムアウトした場合はNone)。check() の例外は「まだ準備ができていない」とみなす。
+    かかった時間と確認の回数は probe_metrics とビルドの記録に残す。
+    """
+    started = time.time()
+    deadline = started + timeout
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            value = check()
+        except Exception:
+            value = None
+        if value:
+            _record(name, True, started, attempts)
+            return value
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            _record(name, False, started, attempts)
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * BACKOFF_FACTOR, max_interval)
+
+
+def _run(args, timeout):
+    """コマンドを実行して (終了コード, 標準出力) を返す (タイムアウト・起動できない場合は (None, ""))"""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=max(timeout, 0.1),
+                                shell=isinstance(args, str))
+    except (OSError, subprocess.TimeoutExpired):
+        return None, ""
+    return result.returncode, result.stdout
+
+
+def wait_for_command(name, args, timeout=DEFAULT_TIMEOUT):
+    """準備ができるまで終了しないコマンド (adb wait-for-device、simctl bootstatus など) で待つ
+
+    コマンドが失敗した場合 (デバイスがまだ無いなど) は間隔を延ばしながら実行し直す。
+    """
+    deadline = time.time() + timeout
+    return wait_until(name, lambda: _run(args, deadline - time.time())[0] == 0, timeout) is not None
+
+
+def command_output(args, expected, timeout=5):
+    """コマンドの出力が expected (正規表現) に一致するかどうかを確認する関数を作る"""
+    pattern = re.compile(expected)
+    return lambda: pattern.search(_run(args, timeout)[1] or "")
+
+
+def port_open(port, host="127.0.0.1"):
+    """ポートに接続できるかどうか"""
+    try:
+        with socket.create_connection((host, port), timeout=CONNECT_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+
+def wait_for_port(port, host="127.0.0.1", timeout=DEFAULT_TIMEOUT, name=None):
+    """ポートに接続できるようになるまで待つ"""
+    return wait_until(name or f"ポート {port} の応答", lambda: port_open(port, host), timeout) is not None
+
+
+class LineTrigger:
+    """出力の行が pattern に一致したら準備完了とする (threading.Event と同じ is_set / wait / clear を持つ)
+
+    clear() から最初に一致するまでの時間を probe_metrics とビルドの記録に残す。
+    """
+
+    def __init__(self, name, pattern):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.match = None
+        self._event = threading.Event()
+        self._started = time.time()
+
+    def clear(self):
+        self.match = None
+        self._event.clear()
+        self._started = time.time()
+
+    def feed(self, line):
+        """出力の1行を渡す。一致した場合は True"""
+        if self._event.is_set():
+            return False
+        match = self.pattern.search(line)
+        if match:
+            self.match = match
+            self._event.set()
+            _record(self.name, True, self._started, 1)
+        return bool(match)
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """一致するまで待つ。タイムアウトした場合は False (待ち時間の記録にも残す)"""
+        if self._event.wait(timeout):
+            return True
+        _record(self.name, False, self._started, 1)
+        return False
+
+
+def print_probe_metrics(since=0):
+    """このプロセス内で待った時間を表形式で表示する"""
+    records = probe_metrics[since:]
+    if not records:
+        return
+    print("\n===== 準備完了までの待ち時間 =====")
+    print(f"{'待機対象':<36} | {'結果':<8} | {'待ち時間':>8} | {'確認回数':>6}")
+    print("-" * 70)
+    for record in records:
+        name = record['name'] if len(record['name']) <= 36 else record['name'][:35] + "…"
+        print(f"{name:<36} | {'完了' if record['ready'] else 'タイムアウト':<8} | {record['seconds']:>7.2f}s | "
+              f"{record['attempts']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ポートやコマンドの準備完了を待つ")
+    parser.add_argument('--port', type=int, help='接続できるようになるまで待つポート番号')
+    parser.add_argument('--host', default="127.0.0.1", help='--port の接続先')
+    parser.add_argument('--command', help='成功するまで繰り返し実行するコマンド')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='待ち時間の上限 (秒)')
+    args = parser.parse_args()
+
+    if args.port:
+        wait_for_port(args.port, args.host, args.timeout)
+    if args.command:
+        wait_for_command(args.command, args.command, args.timeout)
+    print_probe_metrics()
+    return 0 if probe_metrics and all(record['ready'] for record in probe_metrics) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+from command_runner import execute_command, PROJECT_ROOT, enable_fake_toolchain
+from probe_cache import CACHE_DIR, tool_fingerprint
+from pods_cache import restore_pods, store_pods
+from pub_mirror import restore_packages, snapshot_packages, offline_ready, PUB_MIRROR_ENABLED
+from build_telemetry import record_cache_event
+
+# ステップごとのスタンプの保存先
+STEP_CACHE_DIR = os.path.join(CACHE_DIR, "steps")
+# 環境変数 NO_STEP_CACHE=1 でスキップを無効化する
+STEP_CACHE_ENABLED = os.environ.get("NO_STEP_CACHE", "") not in ("1", "true", "yes")
+
+# flutter pub get の入力と出力
+PUB_GET_INPUTS = ["pubspec.yaml", "pubspec.lock"]
+PUB_GET_OUTPUTS = [".dart_tool/package_config.json", "pubspec.lock"]
+# pod install の入力と出力 (.symlinks はリンク先のパスのみをハッシュする)
+POD_INSTALL_INPUTS = ["ios/Podfile", "ios/Podfile.lock", "ios/.symlinks/plugins"]
+POD_INSTALL_OUTPUTS = ["ios/Pods/Manifest.lock", "ios/Podfile.lock"]
+
+
+def _update_with_path(digest, path, relative):
+    """ファイル・ディレクトリ・シンボリックリンクの内容をハッシュに加える"""
+    if os.path.islink(path):
+        # シンボリックリンクは実体を辿らずリンク先のパスだけを記録する
+        digest.update(f"link:{relative}->{os.readlink(path)}\n".encode())
+    elif os.path.isdir(path):
+        digest.update(f"dir:{relative}\n".encode())
+        for name in sorted(os.listdir(path)):
+            _update_with_path(digest, os.path.join(path, name), f"{relative}/{name}")
+    elif os.path.isfile(path):
+        digest.update(f"file:{relative}\n".encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        digest.update(f"missing:{relative}\n".encode())
+
+
+def hash_inputs(inputs, extra=None):
+    """宣言された入力 (プロジェクトルートからの相対パス) の内容からハッシュを計算する"""
+    digest = hashlib.sha256()
+    for relative in inputs:
+        _update_with_path(digest, os.path.join(PROJECT_ROOT, relative), relative)
+    for value in extra or []:
+        digest.update(f"extra:{value}\n".encode())
+    return digest.hexdigest()
+
+
+def output_stamps(outputs):
+    """出力ファイルの更新日時とサイズを取得する (存在しない出力があればNone)"""
+    stamps = {}
+    for relative in outputs:
+        path = os.path.join(PROJECT_ROOT, relative)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        stamps[relative] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def _stamp_path(name):
+    return os.path.join(STEP_CACHE_DIR, f"{name}.json")
+
+
+def is_step_fresh(name, inputs, outputs, extra=None):
+    """前回成功時から入力と出力が変わっていなければTrueを返す"""
+    try:
+        with open(_stamp_path(name), 'r') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (stamp.get('inputs') == hash_inputs(inputs, extra)
+            and stamp.get('outputs') == output_stamps(outputs))
+
+
+def save_step_stamp(name, inputs, outputs, extra=None):
+    """ステップ成功後の入力ハッシュと出力スタンプを保存する"""
+    os.makedirs(STEP_CACHE_DIR, exist_ok=True)
+    stamp = {'inputs': hash_inputs(inputs, extra), 'outputs': output_stamps(outputs)}
+    with open(_stamp_path(name), 'w') as f:
+        json.dump(stamp, f, indent=1)
+
+
+def invalidate_step(name=None):
+    """ステップのスタンプを削除する (nameを省略した場合はすべて)"""
+    if not os.path.isdir(STEP_CACHE_DIR):
+        return
+    for filename in os.listdir(STEP_CACHE_DIR):
+        if name is None or filename == f"{name}.json":
+            os.remove(os.path.join(STEP_CACHE_DIR, filename))
+
+
+def run_cached_step(name, command, inputs, outputs, description=None, extra=None, force=False, **kwargs):
+    """入力と出力が前回成功時から変わっていなければスキップし、それ以外はコマンドを実行する
+
+    戻り値は run_command と同じ (成功フラグ, 出力)。スキップした場合の出力は空文字列。
+    入力はステップ実行中に書き換わることがあるため (pubspec.lock など)、スタンプは実行後に計算する。
+    """
+    if STEP_CACHE_ENABLED and not force and is_step_fresh(name, inputs, outputs, extra):
+        label = description or name
+        print(f"\n⏭️ {label}: 入力に変更がないためスキップします")
+        record_cache_event(name, True)
+        return True, ""
+    if STEP_CACHE_ENABLED and not force:
+        record_cache_event(name, False)
+
+    result = execute_command(command, description, **kwargs)
+    if result['success']:
+        save_step_stamp(name, inputs, outputs, extra)
+    else:
+        invalidate_step(name)
+    return result['success'], result['output']
+
+
+def run_pub_get(description="Flutter依存関係の解決", force=False, **kwargs):
+    """flutter pub get を実行する (pubspec と Flutter SDK が前回から変わっていなければスキップ)
+
+    pubspec.lock のパッケージがすべて pub cache にある (またはオフラインミラーから復元できる) 場合は
+    --offline で解決し、ネットワークを待たない。オフラインで失敗した場合のみ通常の pub get を行う。
+    """
+    extra = [tool_fingerprint("flutter")]
+    if STEP_CACHE_ENABLED and not force and is_step_fresh("pub_get", PUB_GET_INPUTS, PUB_GET_OUTPUTS, extra):
+        print(f"\n⏭️ {description}: 入力に変更がないためスキップします")
+        record_cache_event("pub_get", True)
+        return True, ""
+    record_cache_event("pub_get", False)
+
+    restore_packages()
+    success, output = False, ""
+    if PUB_MIRROR_ENABLED and offline_ready():
+        success, output = run_cached_step("pub_get", "flutter pub get --offline", PUB_GET_INPUTS, PUB_GET_OUTPUTS,
+                                          f"{description} (オフライン)", extra=extra, force=True, **kwargs)
+    if not success:
+        success, output = run_cached_step("pub_get", "flutter pub get", PUB_GET_INPUTS, PUB_GET_OUTPUTS,
+                                          description, extra=extra, force=True, **kwargs)
+    if success:
+        snapshot_packages()
+    return success, output
+
+
+def run_pod_install(command="cd ios && pod install", description="CocoaPodsのインストール", force=False, **kwargs):
+    """pod install を実行する (Podfile・Podfile.lock・プラグインのリンク先が変わっていなければスキップ)
+
+    ios/Pods が失われていても、同じ Podfile.lock とプラグイン構成でインストール済みの Pods が
+    キャッシュにあればリンクで復元してインストールを省略する。成功したインストール結果はキャッシュに保存する。
+    """
+    extra = [tool_fingerprint("pod")]
+    if STEP_CACHE_ENABLED and not force:
+        if is_step_fresh("pod_install", POD_INSTALL_INPUTS, POD_INSTALL_OUTPUTS, extra):
+            print(f"\n⏭️ {description}: 入力に変更がないためスキップします")
+            record_cache_event("pod_install", True)
+            return True, ""
+        if restore_pods():
+            save_step_stamp("pod_install", POD_INSTALL_INPUTS, POD_INSTALL_OUTPUTS, extra)
+            record_cache_event("pod_install", True)
+            return True, ""
+    record_cache_event("pod_install", False)
+
+    success, output = run_cached_step("pod_install", command, POD_INSTALL_INPUTS, POD_INSTALL_OUTPUTS,
+                                      description, extra=extra, force=True, **kwargs)
+    if success:
+        store_pods()
+    return success, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルドステップのスキップ判定用スタンプの管理")
+    parser.add_argument('--clear', nargs='?', const='', metavar='STEP', help='スタンプを削除 (ステップ名を指定するとそのステップのみ)')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.clear is not None:
+        invalidate_step(args.clear or None)
+        print("✅ ステップキャッシュを削除しました")
+        return 0
+
+    checks = [("pub_get", PUB_GET_INPUTS, PUB_GET_OUTPUTS, [tool_fingerprint("flutter")]),
+              ("pod_install", POD_INSTALL_INPUTS, POD_INSTALL_OUTPUTS, [tool_fingerprint("pod")])]
+    for name, inputs, outputs, extra in checks:
+        state = "最新" if is_step_fresh(name, inputs, outputs, extra) else "要実行"
+        print(f"{name:<12} | {state}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
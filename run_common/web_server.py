@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import gzip
+import hashlib
+import argparse
+import mimetypes
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from probe_cache import CACHE_DIR
+
+try:
+    import brotli
+except ImportError:
+    # brotli が無い環境では gzip のみで配信する
+    brotli = None
+
+# 圧縮済みファイルの保存先 (内容のハッシュごとに保存し、同じ内容は再圧縮しない)
+PRECOMPRESSED_DIR = os.path.join(CACHE_DIR, "web_precompressed")
+# 事前圧縮の対象 (画像や音声など圧縮済みの形式は対象外)
+COMPRESSIBLE_SUFFIXES = (".js", ".mjs", ".css", ".html", ".json", ".wasm", ".svg", ".txt", ".map",
+                         ".otf", ".ttf", ".xml", ".frag")
+MIN_COMPRESS_SIZE = 1024
+DEFAULT_PORT = 8080
+
+# ファイル名に内容のハッシュを含むもの (例: main.3f2a9c1b.js) は変更されないため長期間キャッシュさせる
+HASHED_NAME_RE = re.compile(r'[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# それ以外は毎回 ETag で確認させる (変更がなければ 304 で本文を送らない)
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/javascript", ".mjs")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _precompress(path, sha):
+    """ファイルを gzip (と brotli) で圧縮し、{エンコーディング: パス} を返す"""
+    variants = {}
+    with open(path, 'rb') as f:
+        data = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding == "br" and brotli is None:
+                continue
+            target = os.path.join(PRECOMPRESSED_DIR, sha[:2], sha + suffix)
+            if not os.path.exists(target):
+                if data is None:
+                    data = f.read()
+                compressed = brotli.compress(data) if encoding == "br" else gzip.compress(data, 9, mtime=0)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp_target = f"{target}.{os.getpid()}.tmp"
+                with open(tmp_target, 'wb') as out:
+                    out.write(compressed)
+                os.replace(tmp_target, target)
+            variants[encoding] = target
+    # 圧縮しても小さくならないものは配信しない
+    size = os.path.getsize(path)
+    return {encoding: target for encoding, target in variants.items() if os.path.getsize(target) < size}
+
+
+def index_directory(root):
+    """配信するファイルの一覧を作る ({URLパス: {path, size, etag, mtime, type, encodings, immutable}})"""
+    files = {}
+    compressed = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            url_path = "/" + os.path.relpath(path, root).replace(os.sep, "/")
+            stat = os.stat(path)
+            sha = _sha256(path)
+            encodings = {}
+            if name.endswith(COMPRESSIBLE_SUFFIXES) and stat.st_size >= MIN_COMPRESS_SIZE:
+                encodings = _precompress(path, sha)
+                compressed += bool(encodings)
+            files[url_path] = {
+                'path': path,
+                'size': stat.st_size,
+                'etag': f'"{sha[:32]}"',
+                'mtime': formatdate(stat.st_mtime, usegmt=True),
+                'type': mimetypes.guess_type(name)[0] or "application/octet-stream",
+                'encodings': encodings,
+                'immutable': bool(HASHED_NAME_RE.search(name)),
+            }
+    return files, compressed
+
+
+class StaticHandler(BaseHTTPRequestHandler):
+    """事前圧縮・ETag・Range に対応した静的ファイルの配信"""
+    files = {}
+    protocol_version = "HTTP/1.1"
+
+    def _lookup(self):
+        path = unquote(urlsplit(self.path).path)
+        if path.endswith("/"):
+            path += "index.html"
+        if path in self.files:
+            return self.files[path]
+        # 拡張子の無いパスはアプリ内のルートとして index.html を返す
+        if "." not in path.rsplit("/", 1)[-1]:
+            return self.files.get("/index.html")
+        return None
+
+    def _choose_encoding(self, info):
+        accepted = {item.split(";")[0].strip() for item in self.headers.get("Accept-Encoding", "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in info['encodings']:
+                return encoding
+        return None
+
+    def _send_status(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    @staticmethod
+    def _etag(info, encoding=None):
+        """表現ごとの ETag (圧縮したものは元のファイルと区別する)"""
+        return f'{info["etag"][:-1]}-{encoding}"' if encoding else info['etag']
+
+    def _common_headers(self, info, encoding):
+        self.send_header("Content-Type", info['type'])
+        self.send_header("ETag", self._etag(info, encoding))
+        self.send_header("Last-Modified", info['mtime'])
+        self.send_header("Cache-Control", IMMUTABLE_CACHE_CONTROL if info['immutable'] else REVALIDATE_CACHE_CONTROL)
+        self.send_header("Accept-Ranges", "bytes")
+        if info['encodings']:
+            self.send_header("Vary", "Accept-Encoding")
+
+    def _parse_range(self, size, etag):
+        """Range ヘッダーを (開始, 終了) に変換する。指定なしはNone、満たせない場合は False"""
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != etag:
+            return None
+        match = _RANGE_RE.match(header.strip())
+        if not match or match.groups() == ('', ''):
+            # 複数範囲などの未対応の指定は全体を返す
+            return None
+        first, last = match.groups()
+        if first == '':
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        info = self._lookup()
+        if info is None:
+            return self._send_status(404)
+        encoding = self._choose_encoding(info)
+        if self._etag(info, encoding) in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", self._etag(info, encoding))
+            self.send_header("Cache-Control",
+                             IMMUTABLE_CACHE_CONTROL if info['immutable'] else REVALIDATE_CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        byte_range = self._parse_range(info['size'], info['etag'])
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{info['size']}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        # 範囲指定は元のファイルに対して行う (圧縮済みのものは全体を返す場合のみ使う)
+        encoding = None if byte_range else encoding
+        path = info['encodings'][encoding] if encoding else info['path']
+        size = os.path.getsize(path)
+        start, end = byte_range if byte_range else (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self._common_headers(info, encoding)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(max(end - start + 1, 0)))
+        self.end_headers()
+        if not send_body:
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(root, port=DEFAULT_PORT, host="127.0.0.1"):
+    """root を配信するサーバーを作成する (起動時にファイルの索引と事前圧縮を行う)"""
+    files, compressed = index_directory(root)
+    handler = type("BoundStaticHandler", (StaticHandler,), {'files': files})
+    server = ThreadingHTTPServer((host, port), handler)
+    encodings = "brotli, gzip" if brotli is not None else "gzip"
+    print(f"📦 {len(files)}ファイルを配信します ({compressed}ファイルを事前圧縮: {encodings})")
+    return server
+
+
+def serve_directory(root, port=DEFAULT_PORT, host="127.0.0.1", on_ready=None):
+    """root を配信する (Ctrl+Cで終了)。on_ready には起動後に URL を渡して呼び出す"""
+    if not os.path.isfile(os.path.join(root, "index.html")):
+        print(f"エラー: {root} に index.html がありません")
+        return False
+    server = create_server(root, port, host)
+    url = f"http://{'localhost' if host in ('127.0.0.1', '0.0.0.0') else host}:{server.server_address[1]}/"
+    print(f"🌐 {url} で配信しています (終了するにはCtrl+C)")
+    if on_ready:
+        on_ready(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n配信を終了しました")
+    finally:
+        server.server_close()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビルド済みのWebアプリを配信する静的サーバー")
+    parser.add_argument('root', nargs='?', default="build/web", help='配信するディレクトリ')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='ポート番号')
+    parser.add_argument('--host', default="127.0.0.1", help='待ち受けるアドレス (0.0.0.0 で他の端末からも接続可能)')
+    args = parser.parse_args()
+    return 0 if serve_directory(args.root, args.port, args.host) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,50 +6,27 @@ import argparse
 import platform
 import datetime
 import sys
-import subprocess
 import time
 import shutil
 import json
 import re
+import threading
 
-def run_command(cmd, description="", timeout=None, show_output=True, show_progress=False):
-    """コマンドを実行し、結果を表示する"""
-    if description:
-        print(f"\n===== {description} =====")
-        print(f"実行: {cmd}")
-    
-    try:
-        if show_output:
-            if show_progress:
-                process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-                for line in iter(process.stdout.readline, ''):
-                    if line:  # 空行をスキップ
-                        print(line.rstrip())
-                process.stdout.close()
-                return_code = process.wait(timeout=timeout)
-            else:
-                result = subprocess.run(cmd, shell=True, check=False, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-                if result.stdout:
-                    print(result.stdout)
-                return_code = result.returncode
-        else:
-            result = subprocess.run(cmd, shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-            return_code = result.returncode
-            stdout = result.stdout
-        
-        if return_code != 0 and show_output:
-            print(f"エラー発生 (コード: {return_code})")
-            if not show_progress:
-                print(f"エラー詳細: {result.stdout}")
-            return False, None
-        
-        return True, stdout if not show_output else None
-    except subprocess.TimeoutExpired:
-        print(f"タイムアウト: {cmd}")
-        return False, None
-    except Exception as e:
-        print(f"例外発生: {e}")
-        return False, None
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+from command_runner import run_command, execute_command, configure_metrics, enable_fake_toolchain
+from failure_signatures import FAILURE_SIGNATURES
+from probe_cache import cached_probe, invalidate_probes
+from step_cache import run_pub_get
+from build_invalidation import plan_clean, apply_clean, mark_built
+from build_telemetry import start_telemetry
+from gradle_tuning import ensure_gradle_properties, warm_gradle_daemon, print_gradle_cache_report, run_gradle_build
+from hot_reload import run_hot_reload_session
+from device_inventory import list_devices, wait_for_device
+from avd_index import list_avd_names, load_avd_configs, running_avds
+from readiness import wait_until, wait_for_command, command_output, print_probe_metrics
+from emulator_pool import acquire, release, pool_serials
+from device_fanout import install_to_all, built_apks
 
 def check_flutter_installation():
     """Flutter SDKのインストールを確認する"""
@@ -66,7 +43,9 @@ def check_flutter_installation():
 def get_flutter_version():
     """Flutterのバージョン情報を取得する"""
     try:
-        result = subprocess.run("flutter --version", shell=True, check=True, text=True, capture_output=True)
+        result = cached_probe("flutter --version")
+        if result.returncode != 0:
+            return "不明"
         version_line = result.stdout.strip().split('\n')[0]
         return version_line
     except:
@@ -145,94 +124,33 @@ def get_available_emulators():
     """利用可能なAndroidエミュレータの一覧を取得する"""
     print("\n🔍 利用可能なAndroidエミュレータを検索しています...")
     
-    # 実行中のエミュレータを先に検出
-    running_emulators = []
-    success, adb_output = run_command("adb devices", show_output=False)
-    if success and adb_output:
-        adb_output = adb_output.decode('utf-8') if isinstance(adb_output, bytes) else adb_output
-        for line in adb_output.strip().split('\n')[1:]:  # ヘッダー行をスキップ
-            if "emulator-" in line and "device" in line:
-                # エミュレータが起動している
-                emulator_id = line.split()[0]
-                # エミュレータIDからポート番号を抽出 (例: emulator-5554 -> 5554)
-                port = emulator_id.split('-')[1]
-                running_emulators.append(port)
-    
     # 利用可能なエミュレータリストを取得
-    success, output = run_command("emulator -list-avds", show_output=False)
-    if not success or not output:
+    avd_names = list_avd_names()
+    if avd_names is None:
         print("⚠️ エミュレータの一覧取得に失敗しました。")
         return []
     
+    # 実行中のエミュレータの AVD 名はデバイス一覧のサービスから取得する。
+    # サービスを使えない場合は、起動中のエミュレータがあればプロセスの一覧を1回だけ確認する
+    devices = list_devices('android', kind='emulator', state='device')
+    if devices is not None:
+        running = {device['avd'] for device in devices if device.get('avd')}
+    else:
+        success, adb_output = run_command("adb devices", show_output=False)
+        if isinstance(adb_output, bytes):
+            adb_output = adb_output.decode('utf-8')
+        has_emulator = success and adb_output and any(
+            "emulator-" in line and "device" in line for line in adb_output.strip().split('\n')[1:])
+        running = running_avds(avd_names) if has_emulator else set()
+    
+    # APIレベル・ABIなどは config.ini の解析結果のキャッシュから取得する
+    configs = load_avd_configs(avd_names)
     emulators = []
-    if isinstance(output, bytes):
-        output = output.decode('utf-8')
-    
-    # エミュレータ名のリストを取得
-    avd_names = output.strip().split('\n')
-    
-    # 各エミュレータの詳細情報を取得
-    for i, name in enumerate(avd_names):
-        if name:  # 空行をスキップ
-            # エミュレータ詳細情報を取得
-            avd_info = {}
-            avd_info['name'] = name
-            avd_info['id'] = name  # Androidではエミュレータ名がIDとなる
-            
-            # デフォルトは停止中
-            avd_info['state'] = "停止中"
-            
-            # 実行中のエミュレータリストと照合（より正確な検出）
-            if running_emulators:
-                # AVDプロセスと起動済みエミュレータのマッピングを取得
-                try:
-                    # エミュレータが起動しているか確認（様々な方法で）
-                    success, emu_ps = run_command("ps aux | grep 'qemu.*" + name + "' | grep -v grep", show_output=False)
-                    if success and emu_ps and len(emu_ps) > 0:
-                        avd_info['state'] = "実行中"
-                except:
-                    pass
-            
-            # エミュレータのAPIレベルやバージョンを取得（可能であれば）
-            try:
-                avd_info_path = os.path.expanduser(f"~/.android/avd/{name}.avd/config.ini")
-                if os.path.exists(avd_info_path):
-                    with open(avd_info_path, 'r') as f:
-                        for line in f:
-                            if line.startswith('target='):
-                                api_target = line.strip().split('=')[1]
-                                # APIレベルを解析（例: "android-33" -> "33"）
-                                api_match = re.search(r'android-(\d+)', api_target)
-                                api_level = api_match.group(1) if api_match else "不明"
-                                avd_info['api_level'] = api_level
-                                
-                                # APIレベルからAndroidバージョンを推定
-                                api_to_version = {
-                                    '33': '13.0', '32': '12.1', '31': '12.0', 
-                                    '30': '11.0', '29': '10.0', '28': '9.0',
-                                    '27': '8.1', '26': '8.0', '25': '7.1',
-                                    '24': '7.0', '23': '6.0', '22': '5.1'
-                                }
-                                avd_info['android_version'] = api_to_version.get(api_level, f"API {api_level}")
-                                break
-            except Exception as e:
-                print(f"  ⚠️ エミュレータ情報の読み取りエラー ({name}): {e}")
-                avd_info['api_level'] = "不明"
-                avd_info['android_version'] = "不明"
-            
-            # ABIアーキテクチャを取得
-            try:
-                avd_info_path = os.path.expanduser(f"~/.android/avd/{name}.avd/config.ini")
-                if os.path.exists(avd_info_path):
-                    with open(avd_info_path, 'r') as f:
-                        for line in f:
-                            if line.startswith('abi.type='):
-                                avd_info['abi'] = line.strip().split('=')[1]
-                                break
-            except:
-                avd_info['abi'] = "不明"
-            
-            emulators.append(avd_info)
+    for name in avd_names:
+        avd_info = {'name': name, 'id': name}  # Androidではエミュレータ名がIDとなる
+        avd_info.update(configs[name])
+        avd_info['state'] = "実行中" if name in running else "停止中"
+        emulators.append(avd_info)
     
     print(f"🔍 検出したエミュレータ: {len(emulators)}台 (実行中: {len([e for e in emulators if e['state'] == '実行中'])}台)")
     return emulators
@@ -254,26 +172,47 @@ def print_emulator_list(emulators):
         state = emu.get('state', '不明')
         print(f"{i+1:^4} | {emu['name']:<25} | {android_ver:<15} | {api_level:<5} | {abi:<10} | {state:<10}")
 
+def find_running_emulator(emulator_name):
+    """起動済みの emulator_name の AVD のシリアル番号 (見つからない・デバイス一覧のサービスを使えない場合はNone)"""
+    pooled = pool_serials()
+    for device in list_devices('android', kind='emulator', state='device') or []:
+        if device.get('avd') == emulator_name and device['id'] not in pooled:
+            return device['id']
+    return None
+
+def _is_emulator_ready(device, emulator_name, pooled=()):
+    # エミュレータプールのエミュレータは貸し出し専用のため対象にしない
+    return (device['platform'] == 'android' and device.get('avd') == emulator_name and device['state'] == 'device'
+            and device['id'] not in pooled)
+
 def boot_emulator(emulator_name, wait_time=60):
-    """エミュレータを起動する"""
+    """エミュレータを起動し、(成功したか, シリアル番号) を返す
+
+    シリアル番号はデバイス一覧のサービスで特定できた場合のみ (それ以外はNone)。
+    """
     print(f"\n🚀 エミュレータ「{emulator_name}」を起動しています...")
     
-    # より正確に実行中のエミュレータを検出
-    success, adb_output = run_command("adb devices", show_output=False)
-    success2, ps_output = run_command(f"ps aux | grep '{emulator_name}' | grep -v grep", show_output=False)
-    
-    is_running = False
-    if success and adb_output:
-        adb_text = adb_output.decode('utf-8') if isinstance(adb_output, bytes) else adb_output
-        if "emulator-" in adb_text and "device" in adb_text:
+    # デバイス一覧のサービスから AVD 名で起動済みかどうかを判定する
+    devices = list_devices('android', kind='emulator')
+    pooled = pool_serials()
+    if devices is not None:
+        is_running = any(_is_emulator_ready(device, emulator_name, pooled) for device in devices)
+    else:
+        # サービスを使えない場合は adb devices と ps で検出する
+        success, adb_output = run_command("adb devices", show_output=False)
+        
+        is_running = False
+        if success and adb_output:
+            adb_text = adb_output.decode('utf-8') if isinstance(adb_output, bytes) else adb_output
+            if "emulator-" in adb_text and "device" in adb_text:
+                is_running = True
+        
+        if emulator_name in running_avds([emulator_name]):
             is_running = True
     
-    if success2 and ps_output and len(ps_output) > 0:
-        is_running = True
-    
     if is_running:
         print("✅ エミュレータは既に起動しています。そのまま使用します。")
-        return True
+        return True, find_running_emulator(emulator_name)
     
     # バックグラウンドでエミュレータを起動
     if platform.system() == "Windows":
@@ -284,36 +223,32 @@ def boot_emulator(emulator_name, wait_time=60):
     success, _ = run_command(start_cmd, "エミュレータ起動")
     if not success:
         print("⚠️ エミュレータの起動に失敗しました")
-        return False
+        return False, None
     
-    # エミュレータの起動を待機
+    # エミュレータの起動を待機 (準備ができた時点で次へ進む)
     print("⏳ エミュレータの起動を待機しています...")
     start_time = time.time()
-    while time.time() - start_time < wait_time:
-        success, output = run_command("adb devices", show_output=False)
-        if success and output:
-            devices_output = output.decode('utf-8') if isinstance(output, bytes) else output
-            if "device" in devices_output and "emulator" in devices_output:
-                # bootアニメーションが終了したか確認
-                success, boot_output = run_command(
-                    "adb shell getprop sys.boot_completed", show_output=False
-                )
-                if success and boot_output:
-                    boot_status = boot_output.decode('utf-8').strip() if isinstance(boot_output, bytes) else boot_output.strip()
-                    if boot_status == "1":
-                        print(f"✅ エミュレータの起動が完了しました ({int(time.time() - start_time)}秒)")
-                        # 追加の待機時間（UIの読み込み待ち）
-                        time.sleep(2)
-                        return True
-        
-        # 5秒ごとに状態を表示
-        if int(time.time() - start_time) % 5 == 0:
-            print(f"  起動中... {int(time.time() - start_time)}秒経過")
-        
-        time.sleep(1)
+    remaining = lambda: max(wait_time - (time.time() - start_time), 0)
+    if devices is not None:
+        # adb への接続はデバイス一覧のサービスで待ち、そのエミュレータのシリアル番号を特定する
+        device = wait_for_device(lambda d: _is_emulator_ready(d, emulator_name, pooled), wait_time, "エミュレータの接続")
+        serial = device['id'] if device else None
+    else:
+        wait_for_command("エミュレータの接続 (adb wait-for-device)", "adb wait-for-device", wait_time)
+        serial = None
+    adb = f"adb -s {serial}" if serial else "adb"
+    
+    # 起動の完了と、ブートアニメーションの終了 (ホーム画面の表示) を確認する
+    ready = (wait_until("起動の完了 (sys.boot_completed)",
+                        command_output(f"{adb} shell getprop sys.boot_completed", r'^1\s*$'), remaining())
+             and wait_until("ブートアニメーションの終了",
+                            command_output(f"{adb} shell getprop init.svc.bootanim", r'stopped'), remaining()))
+    if ready:
+        print(f"✅ エミュレータの起動が完了しました ({time.time() - start_time:.1f}秒)")
+        return True, serial
     
     print("⚠️ エミュレータの起動がタイムアウトしました。それでも続行します。")
-    return True  # タイムアウトしても一応続行する
+    return True, serial  # タイムアウトしても一応続行する
 
 def find_installed_ndk_version():
     """インストールされているNDKのバージョンを取得する"""
@@ -406,98 +341,151 @@ def update_gradle_ndk_version(ndk_version):
     
     return updated
 
-def build_and_run_android_emulator(emulator_name, verbose=False, no_clean=False):
-    """Flutterアプリをビルドして、Androidエミュレータで実行する"""
+def build_and_run_android_emulator(emulator_name, verbose=False, no_clean=False, force_clean=False, watch=False,
+                                   pool=False):
+    """Flutterアプリをビルドして、Androidエミュレータで実行する
+
+    pool=True の場合はエミュレータプールから起動済みのエミュレータを借り、終了後に返却する。
+    """
     print("\n🚀 FlutterアプリをAndroidエミュレータ用にビルドして実行します")
     
+    # エミュレータの起動を待つ間に Gradle デーモンを準備しておく
+    ensure_gradle_properties()
+    gradle_warmup = threading.Thread(target=warm_gradle_daemon, daemon=True)
+    gradle_warmup.start()
+    
+    lease = None
+    if pool:
+        print(f"\n🏊 エミュレータプールから「{emulator_name}」を借りています...")
+        lease = acquire(emulator_name)
+        if lease:
+            print(f"✅ {lease['serial']} を借りました (貸し出しID: {lease['id']})")
+        else:
+            print("⚠️ エミュレータプールから借りられませんでした。通常どおり起動します")
+    
     # まずエミュレータを起動
-    if not boot_emulator(emulator_name):
-        return False
+    serial = lease['serial'] if lease else None
+    if lease is None:
+        booted, serial = boot_emulator(emulator_name)
+        if not booted:
+            return False
     
-    # クリーンビルドが必要な場合
+    try:
+        return run_on_emulator(emulator_name, gradle_warmup, verbose, no_clean, force_clean, watch, serial)
+    finally:
+        if lease:
+            # 返却したエミュレータはプールの管理プロセスがスナップショットに戻す
+            release(lease['id'])
+            print(f"🔄 {lease['serial']} をエミュレータプールに返却しました")
+
+def run_on_emulator(emulator_name, gradle_warmup, verbose, no_clean, force_clean, watch, device_id=None):
+    """起動済みのエミュレータ (device_id、省略時は emulator_name の AVD) でアプリをビルドして実行する"""
+    # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
     if not no_clean:
-        print("🧹 クリーンビルド実行中...")
-        if not run_command("flutter clean", "クリーンビルド", show_output=verbose)[0]:
-            return False
+        print("🔍 前回のビルドからの変更を確認中...")
+        apply_clean(plan_clean('android', force=force_clean), 'android', show_progress=verbose)
     
     # 依存関係の解決
     print("📦 依存パッケージを取得中...")
-    if not run_command("flutter pub get", "依存関係の解決", show_output=verbose)[0]:
+    if not run_pub_get("依存関係の解決", show_output=verbose)[0]:
         return False
+    # flutter run と同時に使うと別のデーモンが起動するため、準備の完了を待つ
+    gradle_warmup.join()
+    print_probe_metrics()
     
     # エミュレータでFlutterアプリを実行
     print(f"📱 エミュレータ ({emulator_name}) でアプリを起動しています...")
     print("💡 終了するにはこのターミナルでCtrl+Cを押してください")
     
-    # デバイス検出に先にflutter devicesを使用（ADBよりも信頼性が高い）
-    success, flutter_devices_output = run_command("flutter devices", "利用可能なデバイス一覧", show_output=True, show_progress=False)
-    
-    device_id = None
-    if success and flutter_devices_output:
-        # Flutter devicesの出力を解析してAndroidエミュレータを探す
-        flutter_output = flutter_devices_output.decode('utf-8') if isinstance(flutter_devices_output, bytes) else flutter_devices_output
-        lines = flutter_output.strip().split('\n')
+    # デバイス一覧のサービスから AVD 名で起動したエミュレータのシリアル番号を特定する
+    device_id = device_id or find_running_emulator(emulator_name)
+    if device_id:
+        print(f"✅ 使用するエミュレータID: {device_id}")
+    else:
+        # サービスを使えない場合は flutter devices の出力から探す
+        success, flutter_devices_output = run_command("flutter devices", "利用可能なデバイス一覧", show_output=True, show_progress=False)
+        if success and flutter_devices_output:
+            # Flutter devicesの出力を解析してAndroidエミュレータを探す
+            flutter_output = flutter_devices_output.decode('utf-8') if isinstance(flutter_devices_output, bytes) else flutter_devices_output
+            lines = flutter_output.strip().split('\n')
         
-        # 実行中のエミュレータを特定する
-        android_devices = []
-        for line in lines:
-            if "emulator" in line.lower() and "android" in line.lower():
-                print(f"🔍 エミュレータ検出: {line}")
-                # ID抽出: 正規表現でemulator-XXXX形式のIDを抽出
-                emulator_id_match = re.search(r'emulator-\d+', line)
-                if emulator_id_match:
-                    emulator_id = emulator_id_match.group(0)
-                    android_devices.append({"line": line, "id": emulator_id})
-                    print(f"✓ エミュレータID検出: {emulator_id}")
-                else:
-                    # 代替方法: • で分割して2列目を取得
-                    parts = line.split('•')
-                    if len(parts) >= 2:
-                        potential_id = parts[1].strip()
-                        android_devices.append({"line": line, "id": potential_id})
-                        print(f"✓ エミュレータID検出 (代替): {potential_id}")
+            # 実行中のエミュレータを特定する
+            android_devices = []
+            for line in lines:
+                if "emulator" in line.lower() and "android" in line.lower():
+                    print(f"🔍 エミュレータ検出: {line}")
+                    # ID抽出: 正規表現でemulator-XXXX形式のIDを抽出
+                    emulator_id_match = re.search(r'emulator-\d+', line)
+                    if emulator_id_match:
+                        emulator_id = emulator_id_match.group(0)
+                        android_devices.append({"line": line, "id": emulator_id})
+                        print(f"✓ エミュレータID検出: {emulator_id}")
+                    else:
+                        # 代替方法: • で分割して2列目を取得
+                        parts = line.split('•')
+                        if len(parts) >= 2:
+                            potential_id = parts[1].strip()
+                            android_devices.append({"line": line, "id": potential_id})
+                            print(f"✓ エミュレータID検出 (代替): {potential_id}")
         
-        # 検出したデバイスを使用
-        if android_devices:
-            device_id = android_devices[0]["id"]
-            print(f"✅ 使用するエミュレータID: {device_id}")
+            # 検出したエミュレータのうち、emulator_name の AVD を実行しているものを使用する
+            for device in android_devices:
+                success, avd_output = run_command(f"adb -s {device['id']} emu avd name", show_output=False,
+                                                  show_progress=False)
+                avd_text = avd_output.decode('utf-8') if isinstance(avd_output, bytes) else (avd_output or "")
+                if success and avd_text.strip() and avd_text.splitlines()[0].strip() == emulator_name:
+                    device_id = device["id"]
+                    print(f"✅ 使用するエミュレータID: {device_id}")
+                    break
     
-    # 実行コマンドの決定
-    if device_id:
-        run_cmd = f"flutter run -d {device_id}"
-        print(f"📱 エミュレータID: {device_id} を使用します")
-    else:
-        # エミュレータIDが特定できない場合でも、出力から "sdk gphone" を検出して使用
-        for line in lines:
-            if "sdk gphone" in line and "emulator" in line.lower():
-                device_id = "emulator-5554"  # 標準的なエミュレータID
-                print(f"🔍 'sdk gphone' エミュレータを検出しました: {line}")
-                run_cmd = f"flutter run -d {device_id}"
-                print(f"📱 エミュレータID: {device_id} を使用します")
-                break
-        else:
-            print("⚠️ エミュレータIDが特定できません。デフォルトID（emulator-5554）を試します")
-            run_cmd = "flutter run -d emulator-5554"
+    # 実行コマンドの決定 (別のエミュレータ・実機で実行しないよう、特定できない場合は推測せずに中止する)
+    if not device_id:
+        print(f"❌ エミュレータ「{emulator_name}」のシリアル番号を特定できません")
+        print("💡 adb devices でエミュレータが接続されているか確認してから、もう一度実行してください")
+        return False
+    run_cmd = f"flutter run -d {device_id}"
+    print(f"📱 エミュレータID: {device_id} を使用します")
     
-    success, output = run_command(run_cmd, "Androidエミュレータでアプリを実行", show_output=True, show_progress=True)
+    if watch:
+        # ファイルの変更を監視して同じ flutter run のセッションに反映し続ける
+        success = run_hot_reload_session(run_cmd, verbose)
+        if success:
+            mark_built('android')
+        return success
     
-    # NDKエラーチェック - 手動で検出
+    result = execute_command(run_cmd, "Androidエミュレータでアプリを実行", show_output=True, interactive=True,
+                             failure_signatures=FAILURE_SIGNATURES)
+    success = result['success']
+    
+    # NDKエラーチェック - 出力の逐次照合で検出済みの分類結果を使用
     if not success:
-        # エラー出力からNDK不一致を検出
-        error_output = ""
-        if isinstance(output, bytes):
-            error_output = output.decode('utf-8')
-        elif isinstance(output, str):
-            error_output = output
-        
-        # この特定のNDKエラーパターンを検出 (直接見えているエラーメッセージを使用)
-        if "NDK from ndk.dir" in error_output and "disagrees with android.ndkVersion" in error_output:
+        installed_ndk = get_mismatched_ndk_version(result)
+        if installed_ndk:
             print("\n⚠️ NDKバージョン不一致を検出しました。直接修正を行います...")
+            print(f"  検出したインストール済みNDK: {installed_ndk}")
+            
+            # 直接ファイル修正を試行
+            gradle_files_modified = direct_update_ndk_version(installed_ndk)
             
-            # 明確にエラーメッセージから両方のNDKバージョンを抽出
-            installed_ndk_match = re.search(r'NDK.+version\s+\[([0-9.]+)\]', error_output)
-            if installed_ndk_match:
-                installed_ndk = installed_ndk_match.group(1)
+            if gradle_files_modified:
+                print(f"🔄 {len(gradle_files_modified)}個のファイルのNDK設定を {installed_ndk} に更新しました")
+                print("  ビルドを再実行します...")
+                # 再度実行
+                return run_command(run_cmd, "Androidエミュレータでアプリを実行（NDK設定更新後）", 
+                                    show_output=True, interactive=True)[0]
+        
+        # 自動選択に失敗したら手動選択に切り替え
+        print("⚠️ 自動デバイス選択に失敗しました。通常の実行方法を試します...")
+        run_cmd = "flutter run"
+        result = execute_command(run_cmd, "Androidエミュレータでアプリを実行（手動デバイス選択）", 
+                                 show_output=True, interactive=True, failure_signatures=FAILURE_SIGNATURES)
+        success = result['success']
+        
+        # 手動選択でもNDKエラーがあれば再度処理
+        if not success:
+            installed_ndk = get_mismatched_ndk_version(result)
+            if installed_ndk:
+                print("\n⚠️ NDKバージョン不一致を検出しました。直接修正を行います...")
                 print(f"  検出したインストール済みNDK: {installed_ndk}")
                 
                 # 直接ファイル修正を試行
@@ -508,46 +496,45 @@ def build_and_run_android_emulator(emulator_name, verbose=False, no_clean=False)
                     print("  ビルドを再実行します...")
                     # 再度実行
                     return run_command(run_cmd, "Androidエミュレータでアプリを実行（NDK設定更新後）", 
-                                        show_output=True, show_progress=True)[0]
-            else:
-                print("⚠️ NDKバージョンを抽出できませんでした")
-        
-        # 自動選択に失敗したら手動選択に切り替え
-        print("⚠️ 自動デバイス選択に失敗しました。通常の実行方法を試します...")
-        run_cmd = "flutter run"
-        success, output = run_command(run_cmd, "Androidエミュレータでアプリを実行（手動デバイス選択）", 
-                                    show_output=True, show_progress=True)
-        
-        # 手動選択でもNDKエラーがあれば再度処理
-        if not success:
-            error_output = ""
-            if isinstance(output, bytes):
-                error_output = output.decode('utf-8')
-            elif isinstance(output, str):
-                error_output = output
-            
-            # この特定のNDKエラーパターンを検出 (直接見えているエラーメッセージを使用)
-            if "NDK from ndk.dir" in error_output and "disagrees with android.ndkVersion" in error_output:
-                print("\n⚠️ NDKバージョン不一致を検出しました。直接修正を行います...")
-                
-                # 明確にエラーメッセージから両方のNDKバージョンを抽出
-                installed_ndk_match = re.search(r'at.+had version\s+\[([0-9.]+)\]', error_output)
-                if installed_ndk_match:
-                    installed_ndk = installed_ndk_match.group(1)
-                    print(f"  検出したインストール済みNDK: {installed_ndk}")
-                    
-                    # 直接ファイル修正を試行
-                    gradle_files_modified = direct_update_ndk_version(installed_ndk)
-                    
-                    if gradle_files_modified:
-                        print(f"🔄 {len(gradle_files_modified)}個のファイルのNDK設定を {installed_ndk} に更新しました")
-                        print("  ビルドを再実行します...")
-                        # 再度実行
-                        return run_command(run_cmd, "Androidエミュレータでアプリを実行（NDK設定更新後）", 
-                                            show_output=True, show_progress=True)[0]
+                                        show_output=True, interactive=True)[0]
     
+    if success:
+        mark_built('android')
+    print_gradle_cache_report({})
     return success
 
+def install_on_all_devices(verbose=False, no_clean=False, force_clean=False, match=None):
+    """デバッグ版のAPKをビルドし、起動中のすべてのエミュレータ・接続中の実機に並列にインストールして起動する"""
+    print("\n🚀 起動中のすべてのエミュレータ・実機にアプリをインストールします")
+    if not no_clean:
+        print("🔍 前回のビルドからの変更を確認中...")
+        apply_clean(plan_clean('android', force=force_clean), 'android', show_progress=verbose)
+    if not run_pub_get("依存関係の解決", show_output=verbose)[0]:
+        return False
+    ensure_gradle_properties()
+    result, stats = run_gradle_build("flutter build apk --debug", "デバッグ版APKのビルド", "flutter_build_apk_debug",
+                                     verbose, timeout=1200, failure_signatures=FAILURE_SIGNATURES)
+    if not result['success']:
+        return False
+    mark_built('android')
+    print_gradle_cache_report({"flutter_build_apk_debug": stats})
+    return install_to_all('android', built_apks("debug"), match=match)
+
+def get_mismatched_ndk_version(result):
+    """実行結果からNDKバージョン不一致を検出し、インストール済みNDKのバージョンを返す"""
+    failure = result.get('failure')
+    if failure and failure['id'] == 'ndk_version_mismatch':
+        return failure['groups'][0]
+    
+    # 分類できなかった場合は出力全体から検出を試みる
+    error_output = result.get('output') or ""
+    if "NDK from ndk.dir" in error_output and "disagrees with android.ndkVersion" in error_output:
+        installed_ndk_match = re.search(r'at.+had version\s+\[([0-9.]+)\]', error_output)
+        if installed_ndk_match:
+            return installed_ndk_match.group(1)
+        print("⚠️ NDKバージョンを抽出できませんでした")
+    return None
+
 def direct_update_ndk_version(ndk_version):
     """build.gradleファイルを直接検索して更新する"""
     print(f"🔎 プロジェクト内のすべてのbuild.gradleファイルを検索し、NDK設定を更新します...")
@@ -615,9 +602,22 @@ def main():
     parser = argparse.ArgumentParser(description="Flutter アプリケーションのAndroidエミュレータでの実行")
     parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
     parser.add_argument('--no-clean', action='store_true', help='クリーンビルドをスキップ')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず完全なクリーンを行う')
     parser.add_argument('--list', action='store_true', help='利用可能なエミュレータの一覧を表示するだけ')
     parser.add_argument('--emulator', type=str, help='使用するエミュレータの名前またはインデックス番号')
+    parser.add_argument('--watch', action='store_true',
+                        help='flutter run を起動したまま、ファイルの変更をホットリロード・リスタートで自動反映')
+    parser.add_argument('--all-devices', action='store_true',
+                        help='起動中のすべてのエミュレータ・実機に並列にインストールして起動')
+    parser.add_argument('--devices', help='--all-devices の対象のデバイスの名前・IDの正規表現 (例: "emulator-|SM-S9")')
+    parser.add_argument('--pool', action='store_true',
+                        help='エミュレータプール (run_common/emulator_pool.py) から起動済みのエミュレータを借りて実行')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
     args = parser.parse_args()
+    enable_fake_toolchain()
+    
+    if args.refresh_probes:
+        invalidate_probes()
     
     print("=== ジャイロスコープアプリ Android エミュレータ 自動ビルド＆実行スクリプト ===")
     
@@ -637,11 +637,16 @@ def main():
     
     # 出力フォルダの準備
     os.makedirs("output/android_emulator", exist_ok=True)
+    configure_metrics("output/android_emulator")
+    start_telemetry("android_emulator", 'android')
     
     # 利用可能なエミュレータの一覧を取得
     emulators = get_available_emulators()
     print_emulator_list(emulators)
     
+    if args.all_devices and not args.list:
+        return 0 if install_on_all_devices(args.verbose, args.no_clean, args.clean, args.devices) else 1
+    
     # 一覧表示のみの場合はここで終了
     if args.list or not emulators:
         return 0 if emulators else 1
@@ -690,7 +695,8 @@ def main():
     
     # ビルドと実行
     try:
-        if build_and_run_android_emulator(selected_emulator['name'], args.verbose, args.no_clean):
+        if build_and_run_android_emulator(selected_emulator['name'], args.verbose, args.no_clean, args.clean,
+                                          args.watch, args.pool):
             print("\n✨ アプリの実行が終了しました")
             return 0
         else:
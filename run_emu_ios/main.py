@@ -6,50 +6,20 @@ import argparse
 import platform
 import datetime
 import sys
-import subprocess
-import time
 import shutil
 import json
 import re
 
-def run_command(cmd, description="", timeout=None, show_output=True, show_progress=False):
-    """コマンドを実行し、結果を表示する"""
-    if description:
-        print(f"\n===== {description} =====")
-        print(f"実行: {cmd}")
-    
-    try:
-        if show_output:
-            if show_progress:
-                process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-                for line in iter(process.stdout.readline, ''):
-                    if line:  # 空行をスキップ
-                        print(line.rstrip())
-                process.stdout.close()
-                return_code = process.wait(timeout=timeout)
-            else:
-                result = subprocess.run(cmd, shell=True, check=False, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-                if result.stdout:
-                    print(result.stdout)
-                return_code = result.returncode
-        else:
-            result = subprocess.run(cmd, shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
-            return_code = result.returncode
-            stdout = result.stdout
-        
-        if return_code != 0 and show_output:
-            print(f"エラー発生 (コード: {return_code})")
-            if not show_progress:
-                print(f"エラー詳細: {result.stdout}")
-            return False, None
-        
-        return True, stdout if not show_output else None
-    except subprocess.TimeoutExpired:
-        print(f"タイムアウト: {cmd}")
-        return False, None
-    except Exception as e:
-        print(f"例外発生: {e}")
-        return False, None
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+from command_runner import run_command, configure_metrics, enable_fake_toolchain
+from probe_cache import cached_probe, invalidate_probes
+from step_cache import run_pub_get
+from build_invalidation import plan_clean, apply_clean, mark_built
+from build_telemetry import start_telemetry
+from hot_reload import run_hot_reload_session
+from device_inventory import list_devices
+from readiness import wait_for_command, print_probe_metrics
 
 def check_flutter_installation():
     """Flutter SDKのインストールを確認する"""
@@ -66,7 +36,9 @@ def check_flutter_installation():
 def get_flutter_version():
     """Flutterのバージョン情報を取得する"""
     try:
-        result = subprocess.run("flutter --version", shell=True, check=True, text=True, capture_output=True)
+        result = cached_probe("flutter --version")
+        if result.returncode != 0:
+            return "不明"
         version_line = result.stdout.strip().split('\n')[0]
         return version_line
     except:
@@ -85,7 +57,8 @@ def check_xcode_installation():
         return False
     
     # xcodeのバージョン確認
-    success, output = run_command("xcodebuild -version", "Xcodeのバージョン確認", show_output=False)
+    result = cached_probe("xcodebuild -version")
+    success, output = result.returncode == 0, result.stdout
     if not success:
         print("⚠️ Xcodeのバージョン取得に失敗しました。")
         return False
@@ -103,6 +76,13 @@ def get_available_simulators():
     """利用可能なiOSシミュレータの一覧を取得する"""
     print("\n🔍 利用可能なiOSシミュレータを検索しています...")
     
+    # デバイス一覧のサービスが把握している一覧を使う (使えない場合は simctl を実行する)
+    simulators = list_devices('ios', kind='simulator')
+    if simulators is not None:
+        print(f"🔍 検出したシミュレータ: {len(simulators)}台")
+        return [{'udid': sim['id'], 'name': sim['name'], 'state': sim['state'], 'ios_version': sim['ios_version'],
+                 'runtime': sim['runtime']} for sim in simulators]
+    
     # すべてのデバイスを取得 (フィルタオプションなし)
     success, output = run_command("xcrun simctl list devices --json", show_output=False)
     if not success or not output:
@@ -187,8 +167,15 @@ def boot_simulator(simulator_udid):
     print(f"\n🚀 シミュレータ (UDID: {simulator_udid}) を起動しています...")
     
     # シミュレータが既に起動しているか確認
-    success, output = run_command(f"xcrun simctl list devices | grep {simulator_udid}", show_output=False)
-    if success and output and "Booted" in output.decode('utf-8') if isinstance(output, bytes) else output:
+    simulators = list_devices('ios', kind='simulator')
+    if simulators is not None:
+        is_booted = any(sim['id'] == simulator_udid and sim['state'] == "Booted" for sim in simulators)
+    else:
+        success, output = run_command(f"xcrun simctl list devices | grep {simulator_udid}", show_output=False)
+        if isinstance(output, bytes):
+            output = output.decode('utf-8')
+        is_booted = bool(success and output and "Booted" in output)
+    if is_booted:
         print("✅ シミュレータは既に起動しています")
         return True
     
@@ -201,13 +188,15 @@ def boot_simulator(simulator_udid):
     # Simulator.appを開く（UIを表示）
     run_command("open -a Simulator", "シミュレータアプリを開く")
     
-    # シミュレータが完全に起動するまで少し待つ
+    # シミュレータの起動が完了するまで待つ (simctl bootstatus は完了した時点で終了する)
     print("⏳ シミュレータの起動を待機しています...")
-    time.sleep(5)
+    if not wait_for_command("シミュレータの起動 (simctl bootstatus)", f"xcrun simctl bootstatus {simulator_udid} -b", 120):
+        print("⚠️ シミュレータの起動がタイムアウトしました。それでも続行します。")
+    print_probe_metrics()
     
     return True
 
-def build_and_run_ios_simulator(simulator_udid, verbose=False, no_clean=False):
+def build_and_run_ios_simulator(simulator_udid, verbose=False, no_clean=False, force_clean=False, watch=False):
     """Flutterアプリをビルドしてiシミュレータで実行する"""
     print("\n🚀 FlutterアプリをiOSシミュレータ用にビルドして実行します")
     
@@ -215,15 +204,14 @@ def build_and_run_ios_simulator(simulator_udid, verbose=False, no_clean=False):
     if not boot_simulator(simulator_udid):
         return False
     
-    # クリーンビルドが必要な場合
+    # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
     if not no_clean:
-        print("🧹 クリーンビルド実行中...")
-        if not run_command("flutter clean", "クリーンビルド", show_output=verbose)[0]:
-            return False
+        print("🔍 前回のビルドからの変更を確認中...")
+        apply_clean(plan_clean('ios', force=force_clean), 'ios', show_progress=verbose)
     
     # 依存関係の解決
     print("📦 依存パッケージを取得中...")
-    if not run_command("flutter pub get", "依存関係の解決", show_output=verbose)[0]:
+    if not run_pub_get("依存関係の解決", show_output=verbose)[0]:
         return False
     
     # iOSシミュレータでFlutterアプリを実行
@@ -231,8 +219,12 @@ def build_and_run_ios_simulator(simulator_udid, verbose=False, no_clean=False):
     print("💡 終了するにはこのターミナルでCtrl+Cを押してください")
     
     # シミュレータIDを指定して実行（コンソール出力をリアルタイム表示）
-    if not run_command(f"flutter run -d {simulator_udid}", "iOSシミュレータでアプリを実行", show_output=True, show_progress=True)[0]:
+    if watch:
+        if not run_hot_reload_session(f"flutter run -d {simulator_udid}", verbose):
+            return False
+    elif not run_command(f"flutter run -d {simulator_udid}", "iOSシミュレータでアプリを実行", show_output=True, interactive=True)[0]:
         return False
+    mark_built('ios')
     
     return True
 
@@ -244,9 +236,17 @@ def main():
     parser = argparse.ArgumentParser(description="Flutter アプリケーションのiOSシミュレータでの実行")
     parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
     parser.add_argument('--no-clean', action='store_true', help='クリーンビルドをスキップ')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず完全なクリーンを行う')
     parser.add_argument('--list', action='store_true', help='利用可能なシミュレータの一覧を表示するだけ')
     parser.add_argument('--simulator', type=str, help='使用するシミュレータのUDIDまたはインデックス番号')
+    parser.add_argument('--watch', action='store_true',
+                        help='flutter run を起動したまま、ファイルの変更をホットリロード・リスタートで自動反映')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
     args = parser.parse_args()
+    enable_fake_toolchain()
+    
+    if args.refresh_probes:
+        invalidate_probes()
     
     print("=== ジャイロスコープアプリ iOS シミュレータ 自動ビルド＆実行スクリプト ===")
     
@@ -271,6 +271,8 @@ def main():
     
     # 出力フォルダの準備
     os.makedirs("output/ios_simulator", exist_ok=True)
+    configure_metrics("output/ios_simulator")
+    start_telemetry("ios_simulator", 'ios')
     
     # 利用可能なシミュレータの一覧を取得
     simulators = get_available_simulators()
@@ -326,7 +328,8 @@ def main():
     
     # ビルドと実行
     try:
-        if build_and_run_ios_simulator(selected_simulator['udid'], args.verbose, args.no_clean):
+        if build_and_run_ios_simulator(selected_simulator['udid'], args.verbose, args.no_clean, args.clean,
+                                       args.watch):
             print("\n✨ アプリの実行が終了しました")
             return 0
         else:
@@ -4,13 +4,6 @@ echo "=== AudioPlayers プラグイン修復スクリプト v1.0 ==="
 PROJECT_ROOT="$(cd "$(dirname "$0")/.." && pwd)"
 echo "プロジェクトルート: $PROJECT_ROOT"
 
-# pubspec.lockをバックアップして削除（強制的に依存関係を再解決させる）
-if [ -f "$PROJECT_ROOT/pubspec.lock" ]; then
-  cp "$PROJECT_ROOT/pubspec.lock" "$PROJECT_ROOT/pubspec.lock.bak"
-  rm "$PROJECT_ROOT/pubspec.lock"
-  echo "✅ pubspec.lockをリセットしました"
-fi
-
 # AudioPlayerのポッドファイル修正
 POD_DIR="$HOME/.pub-cache/hosted/pub.dev"
 for audio_dir in $(find "$POD_DIR" -name "audioplayers_darwin*" -type d); do
@@ -40,9 +33,9 @@ done
 
 # プラグインの再インストール
 echo "🔄 Flutterプラグインを再インストールしています..."
-cd "$PROJECT_ROOT" && flutter pub cache repair
+python3 "$PROJECT_ROOT/run_common/pub_mirror.py" --restore --force
 cd "$PROJECT_ROOT" && flutter clean
-cd "$PROJECT_ROOT" && flutter pub get
+cd "$PROJECT_ROOT" && (flutter pub get --offline || flutter pub get)
 
 # iOSビルドファイルの完全クリーンアップ
 echo "🧹 iOSビルドファイルをクリーンアップしています..."
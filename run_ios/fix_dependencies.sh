@@ -8,15 +8,13 @@ echo "プロジェクトルート: $PROJECT_ROOT"
 echo "🧹 プロジェクトをクリーンアップしています..."
 cd "$PROJECT_ROOT" && flutter clean
 
-# pubspec.lockを削除して依存関係を再解決
-if [ -f "$PROJECT_ROOT/pubspec.lock" ]; then
-  echo "🔄 pubspec.lockを削除して新しく依存関係を解決します..."
-  rm "$PROJECT_ROOT/pubspec.lock"
-fi
+# pubspec.lockは保持し、不足しているパッケージをオフラインミラーから復元する
+echo "🔄 オフラインミラーから依存パッケージを復元しています..."
+python3 "$PROJECT_ROOT/run_common/pub_mirror.py" --restore
 
-# 正しいコマンドで依存関係を取得
+# 正しいコマンドで依存関係を取得 (オフラインで解決できない場合のみネットワークを使用)
 echo "🔄 正しいコマンドで依存関係を取得しています..."
-cd "$PROJECT_ROOT" && flutter pub get
+cd "$PROJECT_ROOT" && (flutter pub get --offline || flutter pub get)
 
 # iOS関連のファイルをクリーンアップして再生成
 echo "🧹 iOSビルドファイルをクリーンアップしています..."
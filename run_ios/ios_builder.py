@@ -8,10 +8,18 @@ import shutil
 import time
 import re
 from pathlib import Path
-from utils import run_command, check_cocoapods
+from utils import (run_command, check_cocoapods, FAILURE_SIGNATURES, metrics_checkpoint, print_command_metrics,
+                   cached_probe, DEVICE_PROBE_TTL, run_pub_get, run_pod_install, plan_clean, apply_clean,
+                   mark_built, artifact_key, fetch_artifacts, store_artifacts, wait_for_command, install_to_all)
 
-def build_ios_debug(verbose=False, skip_clean=False, auto_install=False):
-    """iOS用のデバッグビルドを作成"""
+# flutter build ios --debug の成果物 (キャッシュの保存・復元の対象)
+IOS_DEBUG_APP = "build/ios/iphoneos/Runner.app"
+
+def build_ios_debug(verbose=False, skip_clean=False, auto_install=False, clean_plan=None, all_devices=False):
+    """iOS用のデバッグビルドを作成 (clean_planを省略した場合は変更内容から判定する)
+
+    all_devices=True の場合は、接続中のすべての実機に並列にインストールして起動する。
+    """
     if platform.system() != "Darwin":
         print("iOSビルドはmacOSでのみ実行できます。")
         return False
@@ -23,23 +31,36 @@ def build_ios_debug(verbose=False, skip_clean=False, auto_install=False):
 
     # 開始時間を記録
     start_time = time.time()
+    metrics_start = metrics_checkpoint()
 
-    # クリーンビルドは時間がかかるのでスキップオプション
+    # 同じ入力から作成済みのアプリがあれば、ビルドせずにキャッシュから復元する
+    cache_key = artifact_key('ios', 'debug', "ios --no-tree-shake-icons")
+    if fetch_artifacts(cache_key):
+        # Xcode でワークスペースを開けるよう依存関係だけは揃える (変更が無ければどちらもスキップされる)
+        if not run_pub_get(timeout=120, show_progress=True)[0] or \
+                not run_pod_install(timeout=300, show_progress=True, log_name="pod_install")[0]:
+            print("⚠️ 依存関係の準備に失敗しました。")
+            return False
+        print(f"\n✅ iOSデバッグビルドをキャッシュから復元しました: {IOS_DEBUG_APP}")
+        print_command_metrics(metrics_start)
+        return install_or_open_ios_app(auto_install, all_devices)
+
+    # 前回のビルドからの変化に応じて必要最小限のクリーンを行う
     if not skip_clean:
-        clean_success, _ = run_command("flutter clean", "Flutterプロジェクトをクリーン", show_progress=True)
-        if not clean_success:
-            print("警告: クリーンに失敗しましたが、ビルドを続行します")
+        print("\n前回のビルドからの変更を確認しています...")
+        apply_clean(clean_plan or plan_clean('ios'), 'ios')
     else:
         print("クリーンステップをスキップします")
 
     # 依存関係を解決
-    pub_success, _ = run_command("flutter pub get", "Flutter依存関係の解決", timeout=120, show_progress=True)
+    pub_success, _ = run_pub_get(timeout=120, show_progress=True)
     if not pub_success:
         print("⚠️ 依存関係の解決に失敗しました。")
         return False
     
     # ポッドのインストール
-    pod_success, _ = run_command("cd ios && pod install", "CocoaPodsのインストール", timeout=300, show_progress=True)
+    pod_success, _ = run_pod_install(timeout=300, show_progress=True, log_name="pod_install",
+                                     failure_signatures=FAILURE_SIGNATURES)
     if not pod_success:
         print("⚠️ CocoaPodsのインストールに失敗しました。")
         print("以下のコマンドを試してみてください:")
@@ -49,9 +70,10 @@ def build_ios_debug(verbose=False, skip_clean=False, auto_install=False):
         print("\nPod repoを更新中...")
         run_command("pod repo update", "Pod Repo更新", timeout=300, show_progress=True)
         # 再試行
-        pod_success, _ = run_command("cd ios && pod install --repo-update", 
-                                  "CocoaPodsのインストール (リトライ)", 
-                                  timeout=300, show_progress=True)
+        pod_success, _ = run_pod_install("cd ios && pod install --repo-update", 
+                                         "CocoaPodsのインストール (リトライ)", force=True,
+                                         timeout=300, show_progress=True, log_name="pod_install_retry",
+                                         failure_signatures=FAILURE_SIGNATURES)
         if not pod_success:
             print("⚠️ CocoaPodsのインストールにまた失敗しました。")
             return False
@@ -139,30 +161,6 @@ def build_ios_debug(verbose=False, skip_clean=False, auto_install=False):
     if not patch_applied:
         print("パッチ対象ファイルが見つからないか、既に修正済みです。")
     
-    # 古いビルドの痕跡をクリーンアップ
-    print("古いビルドファイルをクリーンアップしています...")
-    stale_dirs = [
-        "build/ios/Debug-iphoneos",
-        "build/ios/Release-iphoneos",
-        "ios/Pods",
-        "ios/Flutter/Flutter.podspec",
-        "ios/Flutter/ephemeral",
-        ".dart_tool/flutter_build",
-        "build/ios/iphonesimulator",
-        "build/ios/iphoneos"
-    ]
-    for path in stale_dirs:
-        if os.path.exists(path):
-            try:
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
-                    print(f"削除: {path}")
-                else:
-                    os.remove(path)
-                    print(f"削除: {path}")
-            except Exception as e:
-                print(f"警告: {path} の削除に失敗しました - {e}")
-    
     # Podfileに警告抑制設定を追加
     podfile_path = "ios/Podfile"
     if os.path.exists(podfile_path):
@@ -208,14 +206,16 @@ end
         except Exception as e:
             print(f"警告: Podfileの更新に失敗しました - {e}")
     
-    # ポッドの再インストール
+    # ポッドの再インストール (Podfileや削除したPodsに変更がなければスキップ)
     print("\nCocoaPodsを更新設定で再インストールしています...")
-    run_command("cd ios && pod install --repo-update", 
-                "CocoaPodsの再インストール", timeout=300, show_progress=True)
+    run_pod_install("cd ios && pod install --repo-update", 
+                    "CocoaPodsの再インストール", timeout=300, show_progress=True, log_name="pod_reinstall",
+                    failure_signatures=FAILURE_SIGNATURES)
     
     # iOSビルド - コード署名のため--no-codesignフラグを削除し、警告を無視するフラグを追加
     build_success, _ = run_command(f"flutter build ios --debug {extra_flags} --no-tree-shake-icons", 
-                               "iOSデバッグビルド", timeout=900, show_progress=True)
+                               "iOSデバッグビルド", timeout=900, show_progress=True,
+                               log_name="flutter_build_ios", failure_signatures=FAILURE_SIGNATURES)
     if not build_success:
         print("⚠️ iOSビルドに失敗しました。")
         print("警告を無視してビルドを再試行します...")
@@ -223,7 +223,8 @@ end
         # 警告を無視してビルドを再試行
         os.environ["FLUTTER_XCODE_ONLY_SHOW_ERRORS"] = "1"  # 警告を表示しない環境変数
         build_success, _ = run_command(f"flutter build ios --debug {extra_flags} --no-tree-shake-icons --suppress-analytics", 
-                                   "iOSデバッグビルド (警告無視)", timeout=900, show_progress=True)
+                                   "iOSデバッグビルド (警告無視)", timeout=900, show_progress=True,
+                                   log_name="flutter_build_ios_retry", failure_signatures=FAILURE_SIGNATURES)
         if not build_success:
             print("⚠️ iOSビルドに再度失敗しました。")
             return False
@@ -233,7 +234,16 @@ end
     minutes, seconds = divmod(int(build_duration), 60)
     
     print(f"\n✅ iOSデバッグビルドが正常に作成されました (所要時間: {minutes}分{seconds}秒)")
-    
+    mark_built('ios')
+    store_artifacts(cache_key, {IOS_DEBUG_APP: IOS_DEBUG_APP}, meta={'target': "ios", 'mode': "debug"})
+    print_command_metrics(metrics_start)
+    return install_or_open_ios_app(auto_install, all_devices)
+
+def install_or_open_ios_app(auto_install=False, all_devices=False):
+    """ビルドしたアプリを実機にインストールする (auto_installでない場合はXcodeを開く)"""
+    if all_devices:
+        print("\n接続中のすべての実機にインストールします...")
+        return install_to_all('ios', ios_apps={'device': IOS_DEBUG_APP}, kinds=["device"])
     # 自動インストールが有効な場合はXcodeからの直接インストールを実行
     if auto_install:
         print("\nXcodeを通じて実機にアプリをインストールします...")
@@ -274,7 +284,7 @@ def run_xcode_build_and_install():
     workspace_path = "ios/Runner.xcworkspace"
     print("Xcodeを起動中...")
     subprocess.Popen(f"open {workspace_path}", shell=True)
-    time.sleep(3)  # Xcodeが起動するまで待機
+    wait_for_command("Xcodeの起動", "pgrep -x Xcode", 30)  # Xcodeのプロセスが起動するまで待機
     
     # AppleScriptを使用してXcodeでの操作を自動化
     print("AppleScriptでXcodeの操作を実行中...")
@@ -375,8 +385,7 @@ def get_connected_ios_devices():
         return []
     
     try:
-        result = subprocess.run("xcrun xctrace list devices", 
-                               shell=True, text=True, capture_output=True)
+        result = cached_probe("xcrun xctrace list devices", ttl=DEVICE_PROBE_TTL)
         
         if result.returncode != 0:
             return []
@@ -8,8 +8,9 @@ import datetime
 import sys
 import re
 import shutil
-import time  # 追加: time モジュールをインポート
-from utils import run_command, check_flutter_installation, get_flutter_version
+from utils import (run_command, check_flutter_installation, get_flutter_version, configure_metrics,
+                   run_flutter_doctor, invalidate_probes, check_cocoapods, run_preflight, plan_clean, CLEAN_FULL,
+                   CLEAN_NONE, start_telemetry, wait_for_command, enable_fake_toolchain)
 from ios_builder import build_ios_debug, get_connected_ios_devices
 
 def create_minimal_swift_implementation(swift_file):
@@ -509,7 +510,7 @@ exit 0
     # Xcodeを確実に再起動
     print("\n⚠️ Xcodeを再起動しています...")
     run_command("killall Xcode || true", "Xcode終了")
-    time.sleep(2)
+    wait_for_command("Xcodeの終了", "! pgrep -x Xcode", 10)
     
     return True
 
@@ -531,15 +532,13 @@ echo "プロジェクトルート: $PROJECT_ROOT"
 echo "🧹 プロジェクトをクリーンアップしています..."
 cd "$PROJECT_ROOT" && flutter clean
 
-# pubspec.lockを削除して依存関係を再解決
-if [ -f "$PROJECT_ROOT/pubspec.lock" ]; then
-  echo "🔄 pubspec.lockを削除して新しく依存関係を解決します..."
-  rm "$PROJECT_ROOT/pubspec.lock"
-fi
+# pubspec.lockは保持し、不足しているパッケージをオフラインミラーから復元する
+echo "🔄 オフラインミラーから依存パッケージを復元しています..."
+python3 "$PROJECT_ROOT/run_common/pub_mirror.py" --restore
 
-# 正しいコマンドで依存関係を取得
+# 正しいコマンドで依存関係を取得 (オフラインで解決できない場合のみネットワークを使用)
 echo "🔄 正しいコマンドで依存関係を取得しています..."
-cd "$PROJECT_ROOT" && flutter pub get
+cd "$PROJECT_ROOT" && (flutter pub get --offline || flutter pub get)
 
 # iOS関連のファイルをクリーンアップして再生成
 echo "🧹 iOSビルドファイルをクリーンアップしています..."
@@ -564,89 +563,20 @@ exit 0
     
     return True
 
-def main():
-    """メイン実行関数"""
-    # カレントディレクトリをプロジェクトのルートに変更（安全のため）
-    os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-    
-    parser = argparse.ArgumentParser(description="Flutter アプリケーションのiOSビルドとインストール")
-    parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
-    parser.add_argument('--no-clean', action='store_true', help='クリーンステップをスキップして高速化')
-    parser.add_argument('--install', action='store_true', help='ビルド後に実機にインストール')
-    parser.add_argument('--run', action='store_true', help='ビルド後にXcodeを開いて実行')
-    parser.add_argument('--xcode-only', action='store_true', help='ビルドせずにXcodeを開く')
-    parser.add_argument('--auto-run', action='store_true', help='ビルド、インストール、実行まで全て自動化')
-    args = parser.parse_args()
-    
-    print("=== ジャイロスコープアプリ iOS 自動ビルド＆実行スクリプト ===")
-    if platform.system() != "Darwin":
-        print("⚠️ このスクリプトはmacOSでのみ実行できます。")
-        return 1
-    
-    # Flutter doctorを自動実行（ユーザー入力なし）
-    print("Flutter環境を確認中...")
-    run_command("flutter doctor -v", "Flutter環境診断", timeout=60, show_progress=True)
-    
-    # 現在のディレクトリを表示
-    print(f"現在のディレクトリ: {os.getcwd()}")
-    if not check_flutter_installation():
-        return 1
-    
-    # プロジェクトディレクトリの確認
-    if not os.path.exists('lib/main.dart'):
-        print("エラー: このディレクトリはFlutterプロジェクトではないようです。")
-        print("Flutterプロジェクトのルートディレクトリで実行してください。")
-        return 1
-    
-    # 出力フォルダの準備
-    os.makedirs("output/ios", exist_ok=True)
+def repair_and_clean_project():
+    """依存関係・プラグインの修復とプロジェクトの徹底クリーンアップを行う (完全なクリーンが必要な場合のみ)"""
+    # パッケージの依存関係を修正（新規追加）
+    fix_flutter_dependencies()
     
-    # 接続されているiOSデバイスを確認
-    devices = get_connected_ios_devices()
-    if not devices:
-        print("⚠️ 接続されているiOSデバイスが見つかりません。シミュレータを使用します。")
-        # シミュレータでも続行する（デバイスがなくても処理を続行）
-    else:
-        print("\n接続されているiOSデバイス:")
-        for i, device in enumerate(devices):
-            print(f"{i+1}: {device['name']} ({device['id']})")
-    
-    # 常に自動実行モードを強制的に有効にする
-    args.auto_run = True
-    args.run = True
-    args.install = True
-    print("\n完全自動モードで実行: ビルド→インストール→Xcode起動→アプリ実行までを自動化します")
-    
-    # ビルドの実行
-    success = True
-    selected_device_id = None
-    try:
-        # デバイスの自動選択（最初のデバイスを使用）
-        if devices:
-            selected_device_id = devices[0]['id']
-            print(f"デバイス自動選択: {devices[0]['name']}")
-        
-        print("\nFlutterアプリをビルドしています...")
-        
-        # パッケージの依存関係を修正（新規追加）
-        fix_flutter_dependencies()
-        
-        # AudioPlayersプラグイン専用の修正を実行
-        audioplayers_fix_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fix_audioplayers_plugin.sh")
-        if not os.path.exists(audioplayers_fix_script):
-            with open(audioplayers_fix_script, 'w') as f:
-                f.write('''#!/bin/bash
+    # AudioPlayersプラグイン専用の修正を実行
+    audioplayers_fix_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fix_audioplayers_plugin.sh")
+    if not os.path.exists(audioplayers_fix_script):
+        with open(audioplayers_fix_script, 'w') as f:
+            f.write('''#!/bin/bash
 echo "=== AudioPlayers プラグイン修復スクリプト v1.0 ==="
 PROJECT_ROOT="$(cd "$(dirname "$0")/.." && pwd)"
 echo "プロジェクトルート: $PROJECT_ROOT"
 
-# pubspec.lockをバックアップして削除（強制的に依存関係を再解決させる）
-if [ -f "$PROJECT_ROOT/pubspec.lock" ]; then
-  cp "$PROJECT_ROOT/pubspec.lock" "$PROJECT_ROOT/pubspec.lock.bak"
-  rm "$PROJECT_ROOT/pubspec.lock"
-  echo "✅ pubspec.lockをリセットしました"
-fi
-
 # AudioPlayerのポッドファイル修正
 POD_DIR="$HOME/.pub-cache/hosted/pub.dev"
 for audio_dir in $(find "$POD_DIR" -name "audioplayers_darwin*" -type d); do
@@ -676,9 +606,9 @@ done
 
 # プラグインの再インストール
 echo "🔄 Flutterプラグインを再インストールしています..."
-cd "$PROJECT_ROOT" && flutter pub cache repair
+python3 "$PROJECT_ROOT/run_common/pub_mirror.py" --restore --force
 cd "$PROJECT_ROOT" && flutter clean
-cd "$PROJECT_ROOT" && flutter pub get    
+cd "$PROJECT_ROOT" && (flutter pub get --offline || flutter pub get)    
 
 # iOSビルドファイルの完全クリーンアップ
 echo "🧹 iOSビルドファイルをクリーンアップしています..."
@@ -694,22 +624,22 @@ cd "$PROJECT_ROOT/ios" && pod install --repo-update
 echo "✅ AudioPlayersプラグイン修復が完了しました"
 exit 0
 ''')
-            os.chmod(audioplayers_fix_script, 0o755)
-        
-        print("🔧 AudioPlayers プラグインを修正しています...")
-        run_command(f"bash {audioplayers_fix_script}", "AudioPlayersプラグイン修復処理")
-        
-        # ステールファイル警告修正を実行（新しく追加）
-        fix_stale_file_warnings()
-        
-        # まずXcodeのキャッシュとプロジェクト設定を徹底的にクリーンアップ
-        deep_clean_xcode()
-        
-        # より徹底的なクリーンアップを実行
-        super_clean_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "super_clean.sh")
-        if not os.path.exists(super_clean_script):
-            with open(super_clean_script, 'w') as f:
-                f.write('''#!/bin/bash
+        os.chmod(audioplayers_fix_script, 0o755)
+    
+    print("🔧 AudioPlayers プラグインを修正しています...")
+    run_command(f"bash {audioplayers_fix_script}", "AudioPlayersプラグイン修復処理")
+    
+    # ステールファイル警告修正を実行（新しく追加）
+    fix_stale_file_warnings()
+    
+    # まずXcodeのキャッシュとプロジェクト設定を徹底的にクリーンアップ
+    deep_clean_xcode()
+    
+    # より徹底的なクリーンアップを実行
+    super_clean_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "super_clean.sh")
+    if not os.path.exists(super_clean_script):
+        with open(super_clean_script, 'w') as f:
+            f.write('''#!/bin/bash
 echo "=== Flutter プロジェクト徹底クリーンアップスクリプト v3.0 ==="
 
 # ローカルビルドディレクトリの完全クリーンアップ
@@ -768,12 +698,106 @@ cd ios && pod install --repo-update
 echo "✅ クリーンアップが完了しました"
 exit 0
 ''')
-            os.chmod(super_clean_script, 0o755)
+        os.chmod(super_clean_script, 0o755)
+    
+    print("🧹 ビルド前に徹底的なクリーンアップを実行しています...")
+    run_command(f"bash {super_clean_script}", "プロジェクト完全クリーンアップ処理")
+
+
+def main():
+    """メイン実行関数"""
+    # カレントディレクトリをプロジェクトのルートに変更（安全のため）
+    os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    
+    parser = argparse.ArgumentParser(description="Flutter アプリケーションのiOSビルドとインストール")
+    parser.add_argument('--verbose', action='store_true', help='詳細な出力を表示')
+    parser.add_argument('--no-clean', action='store_true', help='クリーンステップをスキップして高速化')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず修復と完全なクリーンを行う')
+    parser.add_argument('--install', action='store_true', help='ビルド後に実機にインストール')
+    parser.add_argument('--run', action='store_true', help='ビルド後にXcodeを開いて実行')
+    parser.add_argument('--xcode-only', action='store_true', help='ビルドせずにXcodeを開く')
+    parser.add_argument('--auto-run', action='store_true', help='ビルド、インストール、実行まで全て自動化')
+    parser.add_argument('--all-devices', action='store_true',
+                        help='Xcodeを使わず、接続中のすべての実機に並列にインストールして起動')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+    
+    if args.refresh_probes:
+        invalidate_probes()
+    
+    print("=== ジャイロスコープアプリ iOS 自動ビルド＆実行スクリプト ===")
+    if platform.system() != "Darwin":
+        print("⚠️ このスクリプトはmacOSでのみ実行できます。")
+        return 1
+    
+    # 現在のディレクトリを表示
+    print(f"現在のディレクトリ: {os.getcwd()}")
+    
+    # プロジェクトディレクトリの確認
+    if not os.path.exists('lib/main.dart'):
+        print("エラー: このディレクトリはFlutterプロジェクトではないようです。")
+        print("Flutterプロジェクトのルートディレクトリで実行してください。")
+        return 1
+    
+    # 出力フォルダの準備
+    os.makedirs("output/ios", exist_ok=True)
+    configure_metrics("output/ios")
+    start_telemetry("ios_build", 'ios')
+    
+    # 環境確認は互いに独立しているため並列に実行する（Flutter doctorもユーザー入力なしで実行）
+    preflight_steps = [
+        {'name': 'doctor', 'func': run_flutter_doctor, 'description': "Flutter環境診断"},
+        {'name': 'flutter', 'func': check_flutter_installation, 'description': "Flutterの確認"},
+        {'name': 'devices', 'func': get_connected_ios_devices, 'description': "接続デバイスの確認"},
+        {'name': 'cocoapods', 'func': check_cocoapods, 'description': "CocoaPodsの確認"},
+    ]
+    if not args.no_clean:
+        preflight_steps.append({'name': 'clean_plan', 'func': plan_clean, 'args': ('ios', args.clean),
+                                'deps': ['flutter'], 'description': "前回のビルドからの変更確認"})
+    preflight = run_preflight(preflight_steps, title="iOSビルドの事前チェック")
+    if not preflight['flutter']['ok']:
+        return 1
+    
+    # 接続されているiOSデバイスを確認
+    devices = preflight['devices']['result'] or []
+    if not devices:
+        print("⚠️ 接続されているiOSデバイスが見つかりません。シミュレータを使用します。")
+        # シミュレータでも続行する（デバイスがなくても処理を続行）
+    else:
+        print("\n接続されているiOSデバイス:")
+        for i, device in enumerate(devices):
+            print(f"{i+1}: {device['name']} ({device['id']})")
+    
+    # 常に自動実行モードを強制的に有効にする
+    args.auto_run = True
+    args.run = True
+    args.install = True
+    print("\n完全自動モードで実行: ビルド→インストール→Xcode起動→アプリ実行までを自動化します")
+    
+    # ビルドの実行
+    success = True
+    selected_device_id = None
+    try:
+        # デバイスの自動選択（最初のデバイスを使用）
+        if devices and args.all_devices:
+            print(f"すべての実機 ({len(devices)}台) にインストールします")
+        elif devices:
+            selected_device_id = devices[0]['id']
+            print(f"デバイス自動選択: {devices[0]['name']}")
+        
+        print("\nFlutterアプリをビルドしています...")
         
-        print("🧹 ビルド前に徹底的なクリーンアップを実行しています...")
-        run_command(f"bash {super_clean_script}", "プロジェクト完全クリーンアップ処理")
+        # ツールチェーンやプラグイン構成が変わった場合のみ修復とクリーンアップを行う
+        clean_plan = preflight['clean_plan']['result'] if 'clean_plan' in preflight else None
+        if clean_plan and clean_plan['level'] == CLEAN_FULL:
+            for reason in clean_plan['reasons']:
+                print(f"  - {reason}")
+            repair_and_clean_project()
+            # 徹底クリーンアップで flutter clean まで実行済みのため、ビルド側では削除しない
+            clean_plan = dict(clean_plan, level=CLEAN_NONE, reasons=[])
         
-        if not build_ios_debug(args.verbose, args.no_clean, True):
+        if not build_ios_debug(args.verbose, args.no_clean, True, clean_plan, args.all_devices):
             print("\n⚠️ iOSビルドに失敗しました。")
             print("🔄 audioplayers_darwin の Swift ファイルエラーを修正します...")
             success = False
@@ -783,12 +807,12 @@ exit 0
                 success = False
             else:
                 print("✅ Swift ファイルの修正に成功しました。再ビルドを試行します...")
-                if not build_ios_debug(args.verbose, args.no_clean, True):
+                if not build_ios_debug(args.verbose, args.no_clean, True, all_devices=args.all_devices):
                     print("❌ 再ビルドも失敗しました。最終手段を試みます...")
                     print("🔄 Podfileを修正して audioplayers_darwin を無効化します...")
                     if modify_ios_podfile():
                         run_command("cd ios && rm -rf Pods && pod install --repo-update", "最終CocoaPods再インストール")
-                        if not build_ios_debug(args.verbose, args.no_clean, True):
+                        if not build_ios_debug(args.verbose, args.no_clean, True, all_devices=args.all_devices):
                             print("❌ すべての修正を試みましたが、ビルドに失敗しました。")
                             success = False
                         else:
@@ -818,7 +842,10 @@ exit 0
     
     if success:
         print("\n✨ すべての処理が正常に完了しました! ✨")
-        print("Xcodeでアプリが実行されています。画面を確認してください。")
+        if args.all_devices:
+            print("すべての実機でアプリを起動しました。上記の表を確認してください。")
+        else:
+            print("Xcodeでアプリが実行されています。画面を確認してください。")
     else:
         print("\n⚠️ 処理中に問題が発生しました。上記のエラーを確認してください。")
     
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import argparse
+import platform
+import datetime
+
+# 共通のコマンド実行エンジンを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_common"))
+from command_runner import (run_command, configure_metrics, metrics_checkpoint, print_command_metrics,
+                            enable_fake_toolchain)
+from failure_signatures import FAILURE_SIGNATURES
+from probe_cache import cached_probe, invalidate_probes
+from step_cache import run_pub_get
+from build_invalidation import plan_clean, apply_clean, mark_built, CLEAN_FULL, CLEAN_PLATFORM
+from preflight import run_graph, host_capacity
+from artifact_cache import artifact_key, fetch_artifacts, store_artifacts
+from build_telemetry import start_telemetry
+
+# ビルド対象の定義
+# cpus / memory_mb はビルド1本あたりの目安。locks が同じものは出力先やビルドツールのロックを
+# 共有するため同時に実行しない (Gradle のプロジェクトロック、build/ios・build/web の出力先)。
+TARGETS = {
+    'apk': {
+        'platform': 'android',
+        'command': "flutter build apk --{mode} --no-pub",
+        'modes': ['debug', 'profile', 'release'],
+        'cpus': 8, 'memory_mb': 6144, 'locks': ['gradle'],
+        'outputs': ["build/app/outputs/flutter-apk/app-{mode}.apk"],
+    },
+    'appbundle': {
+        'platform': 'android',
+        'command': "flutter build appbundle --{mode} --no-pub",
+        'modes': ['debug', 'profile', 'release'],
+        'cpus': 8, 'memory_mb': 6144, 'locks': ['gradle'],
+        'outputs': ["build/app/outputs/bundle/{mode}/app-{mode}.aab"],
+    },
+    'ios': {
+        'platform': 'ios',
+        'command': "flutter build ios --{mode} --no-codesign --no-pub",
+        'modes': ['debug', 'profile', 'release'],
+        'cpus': 8, 'memory_mb': 6144, 'locks': ['xcode'],
+        'outputs': ["build/ios/iphoneos/Runner.app"],
+        'requires': "Darwin",
+    },
+    'ios-simulator': {
+        'platform': 'ios',
+        'command': "flutter build ios --simulator --{mode} --no-pub",
+        'modes': ['debug'],
+        'cpus': 6, 'memory_mb': 4096, 'locks': ['xcode'],
+        'outputs': ["build/ios/iphonesimulator/Runner.app"],
+        'requires': "Darwin",
+    },
+    'web': {
+        'platform': 'web',
+        'command': "flutter build web --{mode} --no-pub",
+        'modes': ['debug', 'profile', 'release'],
+        'cpus': 4, 'memory_mb': 4096, 'locks': ['build_web'],
+        'outputs': ["build/web"],
+    },
+}
+DEFAULT_TARGETS = ['apk', 'ios', 'web']
+BUILD_TIMEOUT = 1800
+
+
+def prepare_workspace(platforms, force_clean=False):
+    """対象プラットフォームごとに必要最小限のクリーンを行う (flutter clean は全体で1回まで)"""
+    plans = {platform_name: plan_clean(platform_name, force=force_clean) for platform_name in platforms}
+    cleaned_full = False
+    for platform_name, plan in plans.items():
+        print(f"\n[{platform_name}] クリーンの段階: {plan['level']}")
+        if plan['level'] == CLEAN_FULL and cleaned_full:
+            # flutter clean は build/ 全体を消すため、2つ目以降はプラットフォーム固有の削除だけでよい
+            plan = dict(plan, level=CLEAN_PLATFORM)
+        apply_clean(plan, platform_name, show_progress=False)
+        cleaned_full = cleaned_full or plan['level'] == CLEAN_FULL
+    return True
+
+
+def build_target(target, mode, verbose=False, use_cache=True):
+    """1つのターゲット・モードをビルドする (同じ入力の成果物がキャッシュにあれば復元する)"""
+    spec = TARGETS[target]
+    outputs = [path.format(mode=mode) for path in spec['outputs']]
+    cache_key = artifact_key(spec['platform'], mode, spec['command'].format(mode=mode))
+    if use_cache and fetch_artifacts(cache_key):
+        return outputs
+    command = spec['command'].format(mode=mode)
+    if verbose:
+        command += " --verbose"
+    success, _ = run_command(command, f"{target} ({mode}) ビルド", timeout=BUILD_TIMEOUT, show_output=False,
+                             log_name=f"matrix_{target}_{mode}", failure_signatures=FAILURE_SIGNATURES)
+    if not success:
+        return False
+    store_artifacts(cache_key, {path: path for path in outputs if os.path.exists(path)},
+                    meta={'target': target, 'mode': mode})
+    for path in outputs:
+        if os.path.exists(path):
+            print(f"成果物: {path}")
+    return outputs
+
+
+def build_matrix_steps(targets, modes, verbose=False, no_clean=False, force_clean=False):
+    """ビルドマトリクスをステップのグラフに展開する (共通ステップは1回だけ実行する)"""
+    jobs = []
+    skipped = []
+    for target in targets:
+        spec = TARGETS[target]
+        for mode in modes:
+            if spec.get('requires') and platform.system() != spec['requires']:
+                skipped.append((target, mode, f"{spec['requires']} でのみビルドできます"))
+            elif mode not in spec['modes']:
+                skipped.append((target, mode, f"{mode} モードには対応していません"))
+            else:
+                jobs.append((target, mode))
+
+    platforms = sorted({TARGETS[target]['platform'] for target, _ in jobs})
+    steps = []
+    if not no_clean:
+        steps.append({'name': 'clean', 'func': prepare_workspace, 'args': (platforms, force_clean),
+                      'description': "ワークスペースの準備"})
+    steps.append({'name': 'pub_get', 'func': lambda: run_pub_get(timeout=300, show_output=False)[0],
+                  'deps': ['clean'] if not no_clean else [], 'description': "依存関係の解決"})
+    if 'web' in platforms:
+        steps.append({'name': 'enable_web',
+                      'func': lambda: run_command("flutter config --enable-web", "Webの有効化", show_output=False)[0],
+                      'description': "Webビルドの設定"})
+    for target, mode in jobs:
+        spec = TARGETS[target]
+        deps = ['pub_get'] + (['enable_web'] if spec['platform'] == 'web' else [])
+        steps.append({
+            'name': f"{target}:{mode}",
+            'func': build_target,
+            'args': (target, mode, verbose, not force_clean),
+            'deps': deps,
+            'description': f"{target} ({mode})",
+            'cpus': spec['cpus'],
+            'memory_mb': spec['memory_mb'],
+            'locks': spec['locks'],
+        })
+    return steps, jobs, skipped
+
+
+def print_matrix_summary(results, jobs, skipped, wall):
+    """ターゲットごとの結果と所要時間の一覧を表示する"""
+    print("\n=== ビルドマトリクスの結果 ===")
+    print(f"{'ターゲット':<16} {'モード':<8} {'結果':<6} {'時間':>8}")
+    for target, mode in jobs:
+        outcome = results.get(f"{target}:{mode}", {})
+        if outcome.get('skipped'):
+            status = "スキップ"
+        else:
+            status = "成功" if outcome.get('ok') else "失敗"
+        print(f"{target:<16} {mode:<8} {status:<6} {outcome.get('duration', 0):>7.1f}秒")
+    for target, mode, reason in skipped:
+        print(f"{target:<16} {mode:<8} 対象外 ({reason})")
+    longest = max((results.get(f"{t}:{m}", {}).get('duration', 0) for t, m in jobs), default=0)
+    print(f"\n全体: {wall:.1f}秒 (最も長いターゲット: {longest:.1f}秒)")
+
+
+def main():
+    """メイン実行関数"""
+    # カレントディレクトリをプロジェクトのルートに変更（安全のため）
+    os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+    capacity = host_capacity()
+    parser = argparse.ArgumentParser(description="複数のターゲット・モードをまとめて並列にビルド")
+    parser.add_argument('--targets', default=",".join(DEFAULT_TARGETS),
+                        help=f"ビルドするターゲット (カンマ区切り: {', '.join(TARGETS)})")
+    parser.add_argument('--modes', default="release", help='ビルドモード (カンマ区切り: debug, profile, release)')
+    parser.add_argument('--cpus', type=int, default=capacity['cpus'], help='同時に使うCPUコア数の上限')
+    parser.add_argument('--memory', type=int, default=capacity['memory_mb'], help='同時に使うメモリの上限 (MB)')
+    parser.add_argument('--verbose', action='store_true', help='詳細な出力をログに記録')
+    parser.add_argument('--no-clean', action='store_true', help='クリーンステップをスキップ')
+    parser.add_argument('--clean', action='store_true', help='変更の有無にかかわらず完全なクリーンを行う')
+    parser.add_argument('--refresh-probes', action='store_true', help='ツールチェーン情報のキャッシュを破棄して再取得')
+    args = parser.parse_args()
+    enable_fake_toolchain()
+
+    if args.refresh_probes:
+        invalidate_probes()
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown:
+        print(f"エラー: 不明なターゲット: {', '.join(unknown)}")
+        return 1
+
+    print("=== ジャイロスコープアプリ ビルドマトリクス ===")
+    if not os.path.exists('lib/main.dart'):
+        print("エラー: このディレクトリはFlutterプロジェクトではないようです。")
+        return 1
+    flutter = cached_probe("flutter --version")
+    if flutter.returncode != 0:
+        print("Flutterがインストールされていないか、PATHに設定されていません。")
+        return 1
+    print(f"Flutter: {flutter.stdout.splitlines()[0] if flutter.stdout else '不明'}")
+    print(f"資源の上限: CPU {args.cpus}コア / メモリ {args.memory}MB")
+
+    os.makedirs("output/matrix", exist_ok=True)
+    configure_metrics("output/matrix")
+    start_telemetry("matrix")
+    metrics_start = metrics_checkpoint()
+
+    steps, jobs, skipped = build_matrix_steps(targets, modes, args.verbose, args.no_clean, args.clean)
+    if not jobs:
+        print("ビルドできるターゲットがありません。")
+        for target, mode, reason in skipped:
+            print(f"  {target} ({mode}): {reason}")
+        return 1
+
+    start = time.time()
+    results = run_graph(steps, max_workers=len(steps), title="ビルドマトリクス", announce=True,
+                        capacity={'cpus': args.cpus, 'memory_mb': args.memory})
+    wall = time.time() - start
+
+    # プラットフォームのターゲットがすべて成功した場合のみ、次回のインクリメンタルビルドの基準にする
+    for platform_name in sorted({TARGETS[target]['platform'] for target, _ in jobs}):
+        names = [f"{t}:{m}" for t, m in jobs if TARGETS[t]['platform'] == platform_name]
+        if all(results[name]['ok'] for name in names):
+            mark_built(platform_name)
+
+    print_matrix_summary(results, jobs, skipped, wall)
+    print_command_metrics(metrics_start)
+
+    failed = [f"{t}:{m}" for t, m in jobs if not results[f"{t}:{m}"]['ok']]
+    if failed:
+        print(f"\n⚠️ 失敗したターゲット: {', '.join(failed)}")
+        print("詳細は output/logs/ のビルドログを確認してください。")
+        return 1
+    print(f"\n✨ {len(jobs)}個のターゲットのビルドが完了しました ({datetime.datetime.now().strftime('%H:%M:%S')})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())